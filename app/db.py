@@ -1,8 +1,10 @@
 import os
-import mysql.connector
-from mysql.connector import pooling
 from dotenv import load_dotenv
 
+from db_aio import get_async_pool
+from db_pool import get_pool
+from executors import DB_WORKERS, StageExecutor
+
 load_dotenv()
 
 DB_CONFIG = dict(
@@ -13,10 +15,29 @@ DB_CONFIG = dict(
     database=os.getenv("DB_NAME", "buscador_normativo"),
 )
 
-POOL_NAME = "mysql_pool"
-POOL_SIZE = 5
-
-_connection_pool = pooling.MySQLConnectionPool(pool_name=POOL_NAME, pool_size=POOL_SIZE, **DB_CONFIG)
+# Tamaño, overflow, ping y reciclado: DB_POOL_SIZE, DB_POOL_MAX_OVERFLOW, DB_POOL_PING, DB_POOL_RECYCLE_S
+_connection_pool = get_pool(DB_CONFIG)
 
 def get_conn():
-    return _connection_pool.get_connection()
+    return _connection_pool.get_conn()
+
+
+# Ruta async para los handlers: mysql.connector.aio si está disponible; si no, pool síncrono en db_exec
+aio_pool = get_async_pool(DB_CONFIG)
+db_exec = StageExecutor("db", DB_WORKERS)
+
+def _fetch_all(sql: str, params=None):
+    conn = get_conn()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+        cur.close()
+    finally:
+        conn.close()
+    return rows
+
+async def fetch_all_async(sql: str, params=None):
+    if aio_pool is None:
+        return await db_exec.run(_fetch_all, sql, params)
+    return await aio_pool.fetch_all(sql, params)
@@ -1,13 +1,16 @@
 import os
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List
+from fastapi.responses import JSONResponse, PlainTextResponse
 from sentence_transformers import SentenceTransformer
-import numpy as np
 from dotenv import load_dotenv
 
-from .search import search_similar
+from executors import ENCODE_WORKERS, Saturated, StageExecutor
+from metrics import EXECUTOR_QUEUED, EXECUTOR_RUNNING, render_metrics, start_request, timed
+from query_encoder import QueryEncoder
+
+from .db import aio_pool, db_exec
+from .search import load_vector_index, score_exec, search_similar, vector_index
 from .models import SearchResponse, SearchResult
 
 load_dotenv()
@@ -17,7 +20,7 @@ TOP_K_DEFAULT = int(os.getenv("TOP_K", "10"))
 
 app = FastAPI(title="Semantic Search API (MySQL + ST)",
               version="0.1.0",
-              description="FastAPI que busca por similitud de coseno usando embeddings almacenados en MySQL (JSON).")
+              description="FastAPI que busca por similitud de coseno usando embeddings almacenados en MySQL (BLOB float32; JSON heredado).")
 
 # CORS (desarrollo)
 allow_origins = os.getenv("CORS_ALLOW_ORIGINS", "*").split(",")
@@ -31,25 +34,65 @@ app.add_middleware(
 
 # Cargar modelo global (mismo que al indexar)
 model = SentenceTransformer(MODEL_NAME)
+encode_exec = StageExecutor("encode", ENCODE_WORKERS)
+encoder = QueryEncoder(model, MODEL_NAME, executor=encode_exec)
+
+@app.on_event("startup")
+def _startup():
+    # Respaldo del prefiltro adaptativo: consultas sin coincidencias léxicas no recorren la tabla
+    try:
+        load_vector_index()
+    except Exception as e:
+        print(f"[WARN] No se pudo cargar el índice vectorial (sin coincidencias se recorre la tabla): {e}")
+
+@app.exception_handler(Saturated)
+async def _saturated(request: Request, exc: Saturated):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 
 @app.get("/health")
-def health():
-    return {"status": "ok", "model": MODEL_NAME}
+async def health():
+    return {
+        "status": "ok",
+        "model": MODEL_NAME,
+        "query_encoder": encoder.stats(),
+        "db_async": aio_pool.stats() if aio_pool is not None else None,
+        "vector_index": vector_index().size if vector_index() is not None else None,
+        "executors": {e.name: e.stats() for e in (encode_exec, score_exec, db_exec)},
+    }
+
+@app.post("/reload")
+def reload_index():
+    idx = load_vector_index()
+    return {"status": "ok", "vector_index": idx.size if idx is not None else None}
+
+@app.get("/metrics")
+def metrics():
+    for e in (encode_exec, score_exec, db_exec):
+        st = e.stats()
+        EXECUTOR_QUEUED.set(st["queued"], "app", e.name)
+        EXECUTOR_RUNNING.set(st["running"], "app", e.name)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.get("/search", response_model=SearchResponse)
-def search(query: str = Query(..., min_length=1), k: int = Query(TOP_K_DEFAULT, ge=1, le=100)):
-    # 1) Embedding normalizado para coseno
-    qvec = model.encode(query, normalize_embeddings=True)
-    if not isinstance(qvec, np.ndarray):
-        qvec = np.array(qvec, dtype=np.float32)
-    qvec = qvec.astype(np.float32)
-
-    # 2) Buscar candidatos y rankear por coseno
-    results, took_ms, total_examined, prefilter_used = search_similar(qvec, query, k)
-
-    return SearchResponse(
-        results=[SearchResult(**r) for r in results],
-        took_ms=round(took_ms, 3),
-        total_examined=total_examined,
-        prefilter_used=prefilter_used,
-    )
+async def search(query: str = Query(..., min_length=1), k: int = Query(TOP_K_DEFAULT, ge=1, le=100),
+                 timings: bool = Query(False, description="Incluye ms por etapa")):
+    tiempos = start_request("app", "search")
+    # 1) Embedding normalizado para coseno (cacheado por consulta), sin bloquear el event loop
+    with timed("encode"):
+        qvec = await encoder.encode_async(query)
+
+    # 2) Buscar candidatos (BD async) y rankear por coseno (ejecutor de scoring)
+    results, took_ms, total_examined, prefilter_used, prefilter_path = await search_similar(qvec, query, k)
+
+    with timed("serialize"):
+        resp = SearchResponse(
+            results=[SearchResult(**r) for r in results],
+            took_ms=round(took_ms, 3),
+            total_examined=total_examined,
+            prefilter_used=prefilter_used,
+            prefilter_path=prefilter_path,
+        )
+    tiempos.finish()
+    if timings:
+        resp.timings = tiempos.as_dict()
+    return resp
@@ -0,0 +1,161 @@
+# app/migrate_embeddings.py — Convierte la columna `embedding` de JSON a BLOB float32 (formato de make_embeddings.py)
+#
+#   python -m app.migrate_embeddings                # llena embedding_bin por lotes (reanudable)
+#   python -m app.migrate_embeddings --swap         # embedding -> embedding_json, embedding_bin -> embedding
+#   python -m app.migrate_embeddings --drop-json    # tras verificar, elimina embedding_json
+#
+# Mientras no se hace --swap la API sigue leyendo JSON; después lee BLOBs con un solo np.frombuffer por lote.
+import argparse
+import json
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .db import get_conn
+from .search import TABLE, looks_like_json
+
+BIN_COL = "embedding_bin"
+JSON_COL = "embedding_json"
+
+
+def _has_column(conn, col: str) -> bool:
+    cur = conn.cursor()
+    try:
+        cur.execute(f"SELECT {col} FROM {TABLE} LIMIT 1")
+        cur.fetchall()
+        return True
+    except Exception:
+        return False
+    finally:
+        cur.close()
+
+
+def to_blob(value, normalize: bool) -> Optional[bytes]:
+    """JSON (o BLOB ya migrado) -> bytes float32; None si el valor no es un vector válido."""
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        raw = bytes(value)
+        if looks_like_json(raw):
+            value = raw.decode("utf-8", "replace")  # JSON guardado en una columna binaria
+        elif len(raw) % 4 == 0:
+            value = np.frombuffer(raw, dtype=np.float32)
+        else:
+            return None
+    if isinstance(value, np.ndarray):
+        v = value
+    else:
+        try:
+            v = np.asarray(json.loads(value), dtype=np.float32)
+        except (ValueError, TypeError):
+            return None
+    if v.ndim != 1 or v.size == 0:
+        return None
+    if normalize:
+        v = v / (np.linalg.norm(v) + 1e-12)
+    return v.astype(np.float32, copy=False).tobytes()
+
+
+def convert(batch: int, normalize: bool) -> Tuple[int, int]:
+    """Llena embedding_bin donde falte, paginando por id (keyset): se puede interrumpir y reanudar."""
+    conn = get_conn()
+    hechas = invalidas = 0
+    try:
+        if not _has_column(conn, BIN_COL):
+            cur = conn.cursor()
+            cur.execute(f"ALTER TABLE {TABLE} ADD COLUMN {BIN_COL} BLOB")
+            cur.close()
+            conn.commit()
+            print(f"[INFO] Columna {BIN_COL} creada en {TABLE}")
+        last_id, t0 = -1, time.time()
+        while True:
+            cur = conn.cursor()
+            cur.execute(
+                f"SELECT id, embedding FROM {TABLE} "
+                f"WHERE id > %s AND embedding IS NOT NULL AND {BIN_COL} IS NULL ORDER BY id LIMIT %s",
+                (last_id, batch),
+            )
+            rows = cur.fetchall()
+            cur.close()
+            if not rows:
+                break
+            last_id = int(rows[-1][0])
+            pares: List[Tuple[bytes, int]] = []
+            for _id, value in rows:
+                blob = to_blob(value, normalize)
+                if blob is None:
+                    invalidas += 1
+                    continue
+                pares.append((blob, _id))
+            if pares:
+                cur = conn.cursor()
+                cur.executemany(f"UPDATE {TABLE} SET {BIN_COL}=%s WHERE id=%s", pares)
+                cur.close()
+                conn.commit()
+            hechas += len(pares)
+            print(f"[INFO] {hechas} filas convertidas (id <= {last_id}, {hechas / max(time.time() - t0, 1e-9):.0f} filas/s)")
+    finally:
+        conn.close()
+    return hechas, invalidas
+
+
+def pending(conn) -> int:
+    cur = conn.cursor()
+    cur.execute(f"SELECT COUNT(*) FROM {TABLE} WHERE embedding IS NOT NULL AND {BIN_COL} IS NULL")
+    n = int(cur.fetchone()[0])
+    cur.close()
+    return n
+
+
+def swap(force: bool = False):
+    conn = get_conn()
+    try:
+        if not _has_column(conn, BIN_COL):
+            raise SystemExit(f"[ERROR] No existe {TABLE}.{BIN_COL}: corre primero la conversión")
+        faltan = pending(conn)
+        if faltan and not force:
+            raise SystemExit(f"[ERROR] {faltan} filas sin convertir (o inválidas); usa --force para ignorarlas")
+        cur = conn.cursor()
+        # Dos sentencias: SQLite no admite varios RENAME COLUMN en un ALTER
+        cur.execute(f"ALTER TABLE {TABLE} RENAME COLUMN embedding TO {JSON_COL}")
+        cur.execute(f"ALTER TABLE {TABLE} RENAME COLUMN {BIN_COL} TO embedding")
+        cur.close()
+        conn.commit()
+        print(f"[OK] {TABLE}.embedding ahora es BLOB float32 (JSON previo en {JSON_COL})")
+    finally:
+        conn.close()
+
+
+def drop_json():
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"ALTER TABLE {TABLE} DROP COLUMN {JSON_COL}")
+        cur.close()
+        conn.commit()
+        print(f"[OK] {TABLE}.{JSON_COL} eliminada")
+    finally:
+        conn.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=f"Migra {TABLE}.embedding de JSON a BLOB float32 (DB_TABLE)")
+    ap.add_argument("--batch", type=int, default=2000, help="Filas por SELECT/UPDATE")
+    ap.add_argument("--normalize", action="store_true", help="Normaliza L2 al convertir (la API asume vectores unitarios)")
+    ap.add_argument("--swap", action="store_true", help="Convierte lo pendiente y renombra columnas")
+    ap.add_argument("--force", action="store_true", help="Con --swap: no exige que todas las filas estén convertidas")
+    ap.add_argument("--drop-json", action="store_true", help=f"Elimina {JSON_COL} (después de --swap)")
+    args = ap.parse_args()
+
+    if args.drop_json:
+        drop_json()
+        return
+    hechas, invalidas = convert(args.batch, args.normalize)
+    print(f"[OK] {hechas} filas convertidas, {invalidas} con embedding inválido")
+    if args.swap:
+        swap(args.force)
+
+
+if __name__ == "__main__":
+    main()
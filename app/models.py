@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 class SearchResult(BaseModel):
     id: int
@@ -11,3 +11,5 @@ class SearchResponse(BaseModel):
     took_ms: float
     total_examined: int
     prefilter_used: bool
+    prefilter_path: str = "fulltext"  # fulltext | fulltext_widened | fulltext+vector | vector | scan
+    timings: Optional[Dict[str, Any]] = None  # solo con ?timings=true
@@ -1,68 +1,235 @@
 import json
 import os
+import re
+import threading
 import time
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import numpy as np
-from mysql.connector.cursor import MySQLCursorDict
-from .db import get_conn
+
+from db_pool import DB_BACKEND
+from executors import SCORE_WORKERS, StageExecutor
+from metrics import timed
+from vector_index import TableIndex, normalize_rows
+
+from .db import get_conn, fetch_all_async
 
 TABLE = os.getenv("DB_TABLE", "tu_tabla")
-PREFILTER_FULLTEXT = os.getenv("PREFILTER_FULLTEXT", "true").lower() == "true"
+# MATCH ... AGAINST solo existe en MySQL: con DB_BACKEND=sqlite se puntúa la tabla completa
+PREFILTER_FULLTEXT = os.getenv("PREFILTER_FULLTEXT", "true").lower() == "true" and DB_BACKEND == "mysql"
 PREFILTER_LIMIT = int(os.getenv("PREFILTER_LIMIT", "500"))
+# adaptive: FULLTEXT si da suficientes candidatos, si no se amplía, y sin coincidencias va al
+# índice vectorial residente; fulltext / scan: comportamiento fijo anterior (MATCH o tabla completa)
+PREFILTER_MODE = os.getenv("PREFILTER_MODE", "adaptive").lower()
+PREFILTER_MIN_CANDIDATES = int(os.getenv("PREFILTER_MIN_CANDIDATES", "50"))  # por debajo, se amplía
+PREFILTER_WIDEN_FACTOR = int(os.getenv("PREFILTER_WIDEN_FACTOR", "4"))       # LIMIT de la búsqueda ampliada
+VECTOR_FALLBACK = os.getenv("VECTOR_FALLBACK", "true").lower() == "true"     # matriz residente de TABLE
+VECTOR_LOAD_BATCH = int(os.getenv("VECTOR_LOAD_BATCH", "5000"))
+# auto: BLOB -> float32 (como make_embeddings.py), texto -> JSON; json: fuerza JSON aunque llegue como bytes
+EMBEDDING_FORMAT = os.getenv("EMBEDDING_FORMAT", "auto").lower()
 
-def _cosine_topk(query_vec: np.ndarray, rows: List[dict], k: int) -> List[Tuple[dict, float]]:
-    # rows: [{"id":.., "texto":.., "embedding": json_str}, ...]
-    embs = []
-    valid_rows = []
-    for r in rows:
+# Decodificación + coseno fuera del event loop, con concurrencia acotada
+score_exec = StageExecutor("score", SCORE_WORKERS)
+
+_BINARY = (bytes, bytearray, memoryview)
+
+def looks_like_json(v) -> bool:
+    """JSON guardado en una columna binaria: el driver lo entrega como bytes, igual que un BLOB float32."""
+    return bytes(v[:1]) == b"[" and bytes(v[-1:]) == b"]"
+
+def decode_embeddings(values: List) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (M, filas_validas) para una lista de embeddings de BD. Los BLOB float32 (formato de
+    make_embeddings.py) se decodifican juntos: un b"".join y un solo np.frombuffer.
+    Los str, y los bytes con forma de JSON, son JSON heredado (columna sin migrar, ver
+    app/migrate_embeddings.py).
+    """
+    binarios = [i for i, v in enumerate(values) if isinstance(v, _BINARY) and not looks_like_json(v)]
+    if len(binarios) == len(values) and EMBEDDING_FORMAT != "json":
+        # Dimensión = la longitud más común; filas con otra longitud se descartan
+        lens = np.fromiter((len(v) for v in values), dtype=np.int64, count=len(values))
+        if lens.size == 0:
+            return np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int64)
+        nbytes = int(np.bincount(lens).argmax())
+        valid = np.flatnonzero(lens == nbytes)
+        if nbytes == 0 or nbytes % 4:
+            return np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int64)
+        buf = b"".join(values) if valid.size == len(values) else b"".join(values[i] for i in valid.tolist())
+        return np.frombuffer(buf, dtype=np.float32).reshape(valid.size, nbytes // 4), valid
+
+    # Ruta lenta (JSON o mezcla durante la migración): fila por fila
+    embs, valid = [], []
+    for i, v in enumerate(values):
+        binario = isinstance(v, _BINARY) and EMBEDDING_FORMAT != "json"
         try:
-            e = np.array(json.loads(r["embedding"]), dtype=np.float32)
-            if e.ndim != 1:
-                continue
-            embs.append(e)
-            valid_rows.append(r)
+            if binario and not looks_like_json(v):
+                e = np.frombuffer(v, dtype=np.float32)
+            else:
+                e = np.asarray(json.loads(bytes(v) if isinstance(v, _BINARY) else v), dtype=np.float32)
         except Exception:
+            if not binario or len(v) % 4:
+                continue
+            e = np.frombuffer(v, dtype=np.float32)  # float32 que por azar empieza con "[" y termina con "]"
+        if e.ndim != 1 or (embs and e.shape[0] != embs[0].shape[0]):
             continue
-
+        embs.append(e)
+        valid.append(i)
     if not embs:
+        return np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int64)
+    return np.vstack(embs), np.asarray(valid, dtype=np.int64)
+
+def _cosine_topk(query_vec: np.ndarray, rows: List[dict], k: int) -> List[Tuple[dict, float]]:
+    # rows: [{"id":.., "texto":.., "embedding": BLOB float32 (o JSON heredado)}, ...]
+    with timed("decode", TABLE):
+        M, valid = decode_embeddings([r["embedding"] for r in rows])
+    if valid.size == 0 or M.shape[1] != query_vec.shape[0]:
         return []
 
-    M = np.vstack(embs)  # (n, d)
-    # Asumimos embeddings normalizados al indexar.
-    sims = M @ query_vec  # producto punto == coseno
-    top_idx = np.argsort(-sims)[:k]
-    out = [(valid_rows[i], float(sims[i])) for i in top_idx]
+    with timed("score", TABLE):
+        # Asumimos embeddings normalizados al indexar.
+        sims = M @ query_vec  # producto punto == coseno
+    with timed("topk", TABLE):
+        top_idx = np.argsort(-sims)[:k]
+    out = [(rows[int(valid[i])], float(sims[i])) for i in top_idx]
     return out
 
-def fetch_candidates(query: str) -> Tuple[List[dict], bool]:
-    conn = get_conn()
-    try:
-        cur: MySQLCursorDict = conn.cursor(dictionary=True)
-        if PREFILTER_FULLTEXT:
-            sql = f"SELECT id, texto, embedding FROM {TABLE} WHERE MATCH(texto) AGAINST (%s IN NATURAL LANGUAGE MODE) LIMIT %s"
-            cur.execute(sql, (query, PREFILTER_LIMIT))
-            rows = cur.fetchall()
-            return rows, True
-        else:
-            sql = f"SELECT id, texto, embedding FROM {TABLE}"
-            cur.execute(sql)
-            rows = cur.fetchall()
-            return rows, False
-    finally:
+async def fetch_candidates_async(query: str) -> Tuple[List[dict], bool]:
+    if PREFILTER_FULLTEXT:
+        sql = f"SELECT id, texto, embedding FROM {TABLE} WHERE MATCH(texto) AGAINST (%s IN NATURAL LANGUAGE MODE) LIMIT %s"
+        return await fetch_all_async(sql, (query, PREFILTER_LIMIT)), True
+    return await fetch_all_async(f"SELECT id, texto, embedding FROM {TABLE}"), False
+
+# ---------- Índice vectorial residente (respaldo sin coincidencias léxicas) ----------
+_vector_index: Optional[TableIndex] = None
+_vector_lock = threading.Lock()
+
+def load_vector_index() -> Optional[TableIndex]:
+    """Carga id + embedding de TABLE por lotes (keyset) en una matriz normalizada; None si está desactivado."""
+    global _vector_index
+    if not VECTOR_FALLBACK:
+        return None
+    with _vector_lock:
+        t0 = time.time()
+        ids: List[np.ndarray] = []
+        mats: List[np.ndarray] = []
+        last_id, dim = -1, None
+        conn = get_conn()
         try:
-            cur.close()
-        except Exception:
-            pass
-        conn.close()
+            while True:
+                cur = conn.cursor()
+                cur.execute(f"SELECT id, embedding FROM {TABLE} WHERE id > %s AND embedding IS NOT NULL "
+                            f"ORDER BY id LIMIT %s", (last_id, VECTOR_LOAD_BATCH))
+                rows = cur.fetchall()
+                cur.close()
+                if not rows:
+                    break
+                last_id = int(rows[-1][0])
+                M, valid = decode_embeddings([r[1] for r in rows])
+                if valid.size == 0:
+                    continue
+                if dim is None:
+                    dim = M.shape[1]
+                if M.shape[1] != dim:
+                    print(f"[WARN] {TABLE}: lote con dimensión {M.shape[1]} (se esperaba {dim}); se omite")
+                    continue
+                ids.append(np.asarray([rows[i][0] for i in valid.tolist()], dtype=np.int64))
+                mats.append(np.array(M, dtype=np.float32))
+        finally:
+            conn.close()
+        if not mats:
+            _vector_index = TableIndex(table=TABLE, ids=np.zeros((0,), dtype=np.int64),
+                                       matrix=np.zeros((0, 0), dtype=np.float32), meta=None)
+        else:
+            _vector_index = TableIndex(table=TABLE, ids=np.concatenate(ids),
+                                       matrix=normalize_rows(np.vstack(mats)), meta=None)
+        print(f"[INFO] Índice vectorial {TABLE}: {_vector_index.size} filas en {time.time() - t0:.2f}s")
+        return _vector_index
+
+def vector_index() -> Optional[TableIndex]:
+    return _vector_index
+
+# ---------- Prefiltro adaptativo ----------
+_WORD_RE = re.compile(r"\w{3,}", re.UNICODE)
+
+def widened_query(query: str) -> str:
+    """BOOLEAN MODE con prefijos: 'capitalización bancaria' -> 'capitaliza* bancari*' (recorta sufijos)."""
+    terms = []
+    for w in _WORD_RE.findall(query.lower()):
+        stem = w[:max(4, len(w) - 3)] if len(w) > 6 else w
+        terms.append(stem + "*")
+    return " ".join(dict.fromkeys(terms))
+
+async def _fulltext(query: str, mode: str, limit: int) -> List[dict]:
+    sql = f"SELECT id, texto, embedding FROM {TABLE} WHERE MATCH(texto) AGAINST (%s IN {mode} MODE) LIMIT %s"
+    return await fetch_all_async(sql, (query, limit))
+
+async def _fetch_texts(ids: List[int]) -> dict:
+    if not ids:
+        return {}
+    placeholders = ",".join(["%s"] * len(ids))
+    rows = await fetch_all_async(f"SELECT id, texto FROM {TABLE} WHERE id IN ({placeholders})", ids)
+    return {int(r["id"]): r for r in rows}
+
+async def _vector_topk(query_vec: np.ndarray, k: int) -> List[Tuple[dict, float]]:
+    idx = _vector_index
+    rows, sims = await score_exec.run(idx.search_topk, query_vec, k)
+    ids = [int(i) for i in idx.ids[rows]]
+    with timed("fetch", TABLE):
+        por_id = await _fetch_texts(ids)
+    return [(por_id[i], float(s)) for i, s in zip(ids, sims.tolist()) if i in por_id]
+
+def _merge(a: List[Tuple[dict, float]], b: List[Tuple[dict, float]], k: int) -> List[Tuple[dict, float]]:
+    mejor = {}
+    for r, s in a + b:
+        if r["id"] not in mejor or s > mejor[r["id"]][1]:
+            mejor[r["id"]] = (r, s)
+    return sorted(mejor.values(), key=lambda x: -x[1])[:k]
+
+async def adaptive_candidates(query_vec: np.ndarray, query_text: str, k: int) -> Tuple[List[Tuple[dict, float]], int, str]:
+    """
+    (top, examinadas, ruta). Rutas: fulltext (suficientes candidatos), fulltext_widened (prefijos en
+    BOOLEAN MODE y LIMIT mayor), fulltext+vector (pocos candidatos, se completan con el índice),
+    vector (sin coincidencias léxicas) y scan (sin índice residente: tabla completa, como antes).
+    """
+    idx = _vector_index
+    has_index = idx is not None and idx.size > 0
+    minimo = max(k, PREFILTER_MIN_CANDIDATES)
+    rows: List[dict] = []
+    path = "fulltext"
+    if PREFILTER_FULLTEXT:
+        with timed("fetch", TABLE):
+            rows = await _fulltext(query_text, "NATURAL LANGUAGE", PREFILTER_LIMIT)
+            if len(rows) < minimo:
+                amplia = widened_query(query_text)
+                if amplia:
+                    vistos = {r["id"] for r in rows}
+                    extra = await _fulltext(amplia, "BOOLEAN", PREFILTER_LIMIT * PREFILTER_WIDEN_FACTOR)
+                    rows += [r for r in extra if r["id"] not in vistos]
+                    path = "fulltext_widened"
+    if rows:
+        top = await score_exec.run(_cosine_topk, query_vec, rows, k)
+        if len(rows) >= minimo or not has_index:
+            return top, len(rows), path
+        # Pocas coincidencias léxicas: se completan con el índice vectorial
+        return _merge(top, await _vector_topk(query_vec, k), k), len(rows) + idx.size, "fulltext+vector"
+    if has_index:
+        return await _vector_topk(query_vec, k), idx.size, "vector"
+    with timed("fetch", TABLE):
+        rows = await fetch_all_async(f"SELECT id, texto, embedding FROM {TABLE}")
+    return await score_exec.run(_cosine_topk, query_vec, rows, k), len(rows), "scan"
 
-def search_similar(query_vec: np.ndarray, query_text: str, k: int) -> Tuple[List[dict], float, int, bool]:
+async def search_similar(query_vec: np.ndarray, query_text: str, k: int) -> Tuple[List[dict], float, int, bool, str]:
     t0 = time.time()
-    rows, used_prefilter = fetch_candidates(query_text)
-    top = _cosine_topk(query_vec, rows, k)
+    if PREFILTER_MODE == "adaptive":
+        top, examined, path = await adaptive_candidates(query_vec, query_text, k)
+    else:
+        with timed("fetch", TABLE):
+            rows, used_prefilter = await fetch_candidates_async(query_text)
+        top = await score_exec.run(_cosine_topk, query_vec, rows, k)
+        examined, path = len(rows), "fulltext" if used_prefilter else "scan"
     took_ms = (time.time() - t0) * 1000.0
     results = [{
         "id": r["id"],
         "texto": r["texto"][:500],  # recorte simple para respuesta
         "score": score
     } for (r, score) in top]
-    return results, took_ms, len(rows), used_prefilter
+    return results, took_ms, examined, path.startswith("fulltext"), path
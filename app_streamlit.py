@@ -1,4 +1,5 @@
 # app_streamlit.py — Front Streamlit (muestra Fuente y Título)
+import json
 import os
 from pathlib import Path
 import streamlit as st
@@ -56,6 +57,8 @@ with mid:
     )
 with right:
     limit = st.number_input("Resultados", min_value=1, max_value=100, value=10, step=1)
+    progresivo = st.checkbox("Mostrar mientras llegan", value=True,
+                             help="Pide la respuesta en NDJSON y pinta cada tarjeta al recibirla")
 
 buscar = st.button("🔎 Buscar")
 
@@ -77,54 +80,93 @@ def llamar_api(query: str, limit: int, tablas: list[str]):
         st.error(f"No fue posible consultar la API ({e}). Verifica que FastAPI esté en: {API_URL}")
     return []
 
+def llamar_api_stream(query: str, limit: int, tablas: list[str]):
+    """Genera resultados conforme llegan (NDJSON); la última línea es el resumen {partial, ...}."""
+    params = {
+        "query": query,
+        "limit": limit,
+        "tables": ",".join(tablas) if tablas else None,
+        "stream": "true",
+    }
+    try:
+        with requests.get(API_URL, params=params, timeout=30, stream=True) as resp:
+            if resp.status_code != 200:
+                st.error(f"HTTP {resp.status_code}: {resp.text[:200]}")
+                return
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                obj = json.loads(line)
+                if "partial" in obj and "id" not in obj:
+                    if obj.get("partial"):
+                        st.warning(f"Resultados parciales; fallaron: {', '.join(obj.get('tablas_fallidas', {}))}")
+                    continue
+                yield obj
+    except Exception as e:
+        st.error(f"No fue posible consultar la API ({e}). Verifica que FastAPI esté en: {API_URL}")
+
+def render_card(i: int, res: dict):
+    texto = res.get("texto") or res.get("content") or res.get("fragment") or "Sin texto"
+    sim = res.get("similaridad") or res.get("score") or 0
+    ruta = res.get("ruta_archivo") or res.get("url") or res.get("source")
+    fuente = res.get("fuente")
+    titulo = res.get("titulo")
+    fecha = res.get("fecha_publicacion")
+    id_doc = res.get("id_documento")
+
+    st.markdown('<div class="result-card">', unsafe_allow_html=True)
+    st.markdown(f"**{i}. {texto}**")
+
+    # Meta: fuente, título, fecha, id_documento
+    metas = []
+    if fuente: metas.append(f"Fuente: {fuente}")
+    if titulo: metas.append(f"Título: {titulo}")
+    if fecha:  metas.append(f"Fecha: {fecha}")
+    if id_doc: metas.append(f"id_documento: {id_doc}")
+    if metas:
+        st.markdown(f'<div class="result-meta">{" · ".join(metas)}</div>', unsafe_allow_html=True)
+
+    # Barra de similitud
+    try:
+        val = float(sim)
+        if val > 1.0:  # normaliza si vino 0..100
+            val = val / 100.0
+        pct = int(val * 100)
+        st.markdown(f'<div class="result-meta">Similaridad: {pct}%</div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="progress"><div style="width:{pct}%"></div></div>', unsafe_allow_html=True)
+    except Exception:
+        pass
+
+    # Fuente/ruta si existe
+    if ruta:
+        is_url = str(ruta).startswith(("http://","https://"))
+        if is_url:
+            st.markdown(f'<div class="result-meta">Ruta/Fuente: <a href="{ruta}" target="_blank">{ruta}</a></div>', unsafe_allow_html=True)
+        else:
+            st.markdown(f'<div class="result-meta">Ruta/Fuente: {ruta}</div>', unsafe_allow_html=True)
+
+    st.markdown("</div>", unsafe_allow_html=True)
+
 # ---- Ejecutar búsqueda ----
-if buscar and query:
+if buscar and query and progresivo:
+    # Cada tarjeta se pinta en cuanto llega su línea; el contador se actualiza al final
+    resumen = st.empty()
+    resumen.caption("Buscando...")
+    n = 0
+    for n, res in enumerate(llamar_api_stream(query, int(limit), tablas), start=1):
+        render_card(n, res)
+    if n:
+        resumen.success(f"{n} resultado(s)")
+    else:
+        resumen.info("No se encontraron resultados. Intenta con otras palabras clave.")
+elif buscar and query:
     with st.spinner("Buscando..."):
         resultados = llamar_api(query, int(limit), tablas)
 
     if resultados:
         st.success(f"{len(resultados)} resultado(s)")
         for i, res in enumerate(resultados, start=1):
-            texto = res.get("texto") or res.get("content") or res.get("fragment") or "Sin texto"
-            sim = res.get("similaridad") or res.get("score") or 0
-            ruta = res.get("ruta_archivo") or res.get("url") or res.get("source")
-            fuente = res.get("fuente")
-            titulo = res.get("titulo")
-            fecha = res.get("fecha_publicacion")
-            id_doc = res.get("id_documento")
-
-            st.markdown('<div class="result-card">', unsafe_allow_html=True)
-            st.markdown(f"**{i}. {texto}**")
-
-            # Meta: fuente, título, fecha, id_documento
-            metas = []
-            if fuente: metas.append(f"Fuente: {fuente}")
-            if titulo: metas.append(f"Título: {titulo}")
-            if fecha:  metas.append(f"Fecha: {fecha}")
-            if id_doc: metas.append(f"id_documento: {id_doc}")
-            if metas:
-                st.markdown(f'<div class="result-meta">{" · ".join(metas)}</div>', unsafe_allow_html=True)
-
-            # Barra de similitud
-            try:
-                val = float(sim)
-                if val > 1.0:  # normaliza si vino 0..100
-                    val = val / 100.0
-                pct = int(val * 100)
-                st.markdown(f'<div class="result-meta">Similaridad: {pct}%</div>', unsafe_allow_html=True)
-                st.markdown(f'<div class="progress"><div style="width:{pct}%"></div></div>', unsafe_allow_html=True)
-            except Exception:
-                pass
-
-            # Fuente/ruta si existe
-            if ruta:
-                is_url = str(ruta).startswith(("http://","https://"))
-                if is_url:
-                    st.markdown(f'<div class="result-meta">Ruta/Fuente: <a href="{ruta}" target="_blank">{ruta}</a></div>', unsafe_allow_html=True)
-                else:
-                    st.markdown(f'<div class="result-meta">Ruta/Fuente: {ruta}</div>', unsafe_allow_html=True)
-
-            st.markdown("</div>", unsafe_allow_html=True)
+            render_card(i, res)
     else:
         st.info("No se encontraron resultados. Intenta con otras palabras clave.")
 elif buscar and not query:
@@ -0,0 +1,4 @@
+# bench — Benchmark reproducible de /search sobre un corpus sintético con el esquema de buscador_normativo.sql
+#
+#   python -m bench.run --sizes 10000,100000 --out bench/results/main.json
+#   python -m bench.compare bench/results/main.json bench/results/rama.json
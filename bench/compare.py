@@ -0,0 +1,78 @@
+# bench/compare.py — Compara dos resultados de bench.run y marca regresiones
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# (ruta dentro de la corrida, True si más alto es mejor)
+METRICS = [
+    (("latency", "p50_ms"), False),
+    (("latency", "p95_ms"), False),
+    (("latency", "p99_ms"), False),
+    (("memory_end", "peak_rss_mb"), False),
+    (("startup_s",), False),
+]
+
+
+def _get(d: Dict, path: Tuple[str, ...]) -> Optional[float]:
+    for k in path:
+        if not isinstance(d, dict) or k not in d:
+            return None
+        d = d[k]
+    return d if isinstance(d, (int, float)) else None
+
+
+def _rows(base: Dict, new: Dict) -> Iterator[Tuple[int, str, float, float, bool]]:
+    """(tamaño, métrica, base, nuevo, más_alto_es_mejor) para los tamaños presentes en ambos."""
+    nuevos = {r["size"]: r for r in new["runs"]}
+    for rb in base["runs"]:
+        rn = nuevos.get(rb["size"])
+        if rn is None:
+            continue
+        for path, higher in METRICS:
+            a, b = _get(rb, path), _get(rn, path)
+            if a is not None and b is not None:
+                yield rb["size"], ".".join(path), a, b, higher
+        qps_n = {t["concurrency"]: t for t in rn.get("throughput", [])}
+        for tb in rb.get("throughput", []):
+            tn = qps_n.get(tb["concurrency"])
+            if tn is not None:
+                c = tb["concurrency"]
+                yield rb["size"], f"c{c}.qps", tb["qps"], tn["qps"], True
+                if "p99_ms" in tb and "p99_ms" in tn:
+                    yield rb["size"], f"c{c}.p99_ms", tb["p99_ms"], tn["p99_ms"], False
+
+
+def compare(base: Dict, new: Dict, threshold: float) -> List[str]:
+    regresiones = []
+    print(f"{'filas':>9}  {'métrica':<24}{'base':>12}{'nuevo':>12}{'cambio':>9}")
+    for size, name, a, b, higher in _rows(base, new):
+        delta = (b - a) / a if a else 0.0
+        peor = -delta if higher else delta
+        marca = ""
+        if peor > threshold:
+            marca = "  REGRESIÓN"
+            regresiones.append(f"{size} {name}: {a} -> {b}")
+        print(f"{size:>9}  {name:<24}{a:>12.3f}{b:>12.3f}{delta:>+9.1%}{marca}")
+    return regresiones
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Compara dos JSON de bench.run (p. ej. main vs. una rama)")
+    ap.add_argument("base")
+    ap.add_argument("new")
+    ap.add_argument("--threshold", type=float, default=0.10, help="Empeoramiento relativo tolerado (0.10 = 10%%)")
+    args = ap.parse_args(argv)
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    regresiones = compare(base, new, args.threshold)
+    if regresiones:
+        print(f"[WARN] {len(regresiones)} regresiones por encima de {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
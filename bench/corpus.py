@@ -0,0 +1,150 @@
+# bench/corpus.py — Corpus sintético tipo CNBV (documentos, articulos, modificaciones, anexos)
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+# Reparto de filas entre tablas (aprox. al de la base real: muchos artículos por documento)
+TABLE_SHARE = {"documentos": 0.02, "articulos": 0.70, "modificaciones": 0.20, "anexos": 0.08}
+
+# Palabras por texto: (media de log-normal, sigma, mínimo, máximo)
+TEXT_WORDS = {
+    "documentos": (2.7, 0.4, 5, 60),        # nombre_regulacion
+    "articulos": (5.0, 0.7, 15, 3000),      # texto_articulo
+    "modificaciones": (4.6, 0.8, 10, 2500),  # texto_modificacion
+    "anexos": (6.2, 0.9, 30, 8000),          # texto_anexo
+}
+
+# Mismas columnas que buscador_normativo.sql (sin los embeddings que no usa la API)
+COLUMNS = {
+    "documentos": ["id_documento", "nombre_regulacion", "ambito_aplicacion", "tipo_de_ordenamiento",
+                   "fecha_publicacion", "emisor", "ruta_archivo", "embedding_completo"],
+    "articulos": ["id_articulo", "id_documento", "numero_articulo", "texto_articulo", "embedding_articulo"],
+    "modificaciones": ["id_modificacion", "id_documento", "nombre_regulacion", "tipo_modificacion",
+                       "texto_modificacion", "fecha_publicacion", "embedding_texto_modificacion"],
+    "anexos": ["id_anexo", "id_documento", "nombre_anexo", "texto_anexo", "ruta_archivo", "embedding_texto"],
+}
+
+AMBITOS = ["Federal", "Estatal", "Municipal"]
+TIPOS = ["Acuerdo", "Circular", "Disposiciones", "Ley", "Lineamientos", "Reglamento", "Reglas",
+         "Resolución", "Decreto", "Norma Oficial Mexicana", "Manual", "Otros"]
+EMISORES = ["CNBV", "SHCP", "Banxico", "CONDUSEF", "CNSF", "CONSAR", "SAT", "UIF"]
+TIPOS_MODIFICACION = ["Reforma", "Adición", "Derogación", "Corrección", "Otra"]
+
+VOCAB = (
+    "artículo fracción párrafo inciso disposición comisión nacional bancaria valores entidad financiera "
+    "institución crédito banca múltiple desarrollo casa bolsa sociedad inversión fondo emisora "
+    "capital neto requerimiento capitalización riesgo crédito mercado operacional liquidez reserva "
+    "preventiva calificación cartera vigente vencida garantía fideicomiso mandato comisión cliente "
+    "usuario contrato operación pasiva activa servicio depósito ahorro préstamo tarjeta cargo "
+    "información financiera estados contables auditor externo dictamen control interno consejo "
+    "administración comité auditoría director general oficial cumplimiento lavado dinero "
+    "financiamiento terrorismo identificación conocimiento reporte operaciones inusuales relevantes "
+    "sanción multa amonestación suspensión revocación autorización registro inscripción padrón "
+    "plazo días hábiles naturales vigencia entrada vigor transitorio publicación diario oficial "
+    "federación presente resolución modifica adiciona deroga reforma anexo formato instructivo "
+    "metodología cálculo índice coeficiente límite máximo mínimo porcentaje monto saldo promedio "
+    "tasa interés moneda nacional extranjera unidades udis pesos dólares divisas derivados "
+    "reporto préstamo valores custodia administración intermediario bursátil asesoría inversiones"
+).split()
+
+
+@dataclass
+class Chunk:
+    table: str
+    columns: List[str]
+    rows: List[tuple]          # valores en el orden de `columns`; el embedding va como bytes float32
+    ids: np.ndarray            # int64, alineado con `vectors`
+    vectors: np.ndarray        # (n, dim) float32 normalizado
+
+
+def table_sizes(total: int) -> Dict[str, int]:
+    sizes = {t: max(1, int(round(total * s))) for t, s in TABLE_SHARE.items()}
+    sizes["articulos"] += total - sum(sizes.values())  # el redondeo se absorbe en la tabla grande
+    return sizes
+
+
+def _zipf_weights(n: int) -> np.ndarray:
+    w = 1.0 / np.arange(1, n + 1)
+    return w / w.sum()
+
+
+class CorpusGenerator:
+    """Determinista por semilla: el mismo (total, dim, seed) produce exactamente el mismo corpus."""
+
+    def __init__(self, total: int, dim: int = 768, seed: int = 7, chunk_rows: int = 5000):
+        self.total = total
+        self.dim = dim
+        self.seed = seed
+        self.chunk_rows = max(1, chunk_rows)
+        self.sizes = table_sizes(total)
+        self._vocab = np.array(VOCAB)
+        self._p = _zipf_weights(len(VOCAB))
+
+    def _rng(self, table: str, chunk: int) -> np.random.Generator:
+        # Un generador por (tabla, chunk): se puede regenerar cualquier tramo sin recorrer los anteriores
+        return np.random.default_rng([self.seed, list(TABLE_SHARE).index(table), chunk])
+
+    def _texts(self, rng: np.random.Generator, table: str, n: int) -> List[str]:
+        mu, sigma, lo, hi = TEXT_WORDS[table]
+        lens = np.clip(rng.lognormal(mu, sigma, n).astype(np.int64), lo, hi)
+        words = rng.choice(len(self._vocab), size=int(lens.sum()), p=self._p)
+        out, pos = [], 0
+        for m in lens:
+            out.append(" ".join(self._vocab[words[pos:pos + m]]).capitalize() + ".")
+            pos += m
+        return out
+
+    def _vectors(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        V = rng.standard_normal((n, self.dim), dtype=np.float32)
+        V /= np.linalg.norm(V, axis=1, keepdims=True) + 1e-12
+        return V
+
+    def _rows(self, rng: np.random.Generator, table: str, ids: np.ndarray, V: np.ndarray) -> List[tuple]:
+        n = len(ids)
+        texts = self._texts(rng, table, n)
+        blobs = [v.tobytes() for v in V]
+        n_docs = self.sizes["documentos"]
+        id_docs = rng.integers(1, n_docs + 1, n).tolist()
+        dias = rng.integers(0, 365 * 25, n).tolist()
+        fechas = [date(2000, 1, 1) + timedelta(days=d) for d in dias]
+        ids_l = ids.tolist()
+        if table == "documentos":
+            amb = rng.choice(AMBITOS, n, p=[0.8, 0.15, 0.05]).tolist()
+            tip = rng.choice(TIPOS, n).tolist()
+            emi = rng.choice(EMISORES, n).tolist()
+            return [(i, t, a, tp, f, e, f"/corpus/documentos/{i}.pdf", b)
+                    for i, t, a, tp, f, e, b in zip(ids_l, texts, amb, tip, fechas, emi, blobs)]
+        if table == "articulos":
+            nums = rng.integers(1, 400, n).tolist()
+            return [(i, d, f"Artículo {k}", t, b) for i, d, k, t, b in zip(ids_l, id_docs, nums, texts, blobs)]
+        if table == "modificaciones":
+            tip = rng.choice(TIPOS_MODIFICACION, n).tolist()
+            return [(i, d, f"Regulación {d}", tp, t, f, b)
+                    for i, d, tp, t, f, b in zip(ids_l, id_docs, tip, texts, fechas, blobs)]
+        return [(i, d, f"Anexo {i}", t, f"/corpus/anexos/{i}.pdf", b)
+                for i, d, t, b in zip(ids_l, id_docs, texts, blobs)]
+
+    def chunks(self, table: str) -> Iterator[Chunk]:
+        n = self.sizes[table]
+        for c, start in enumerate(range(0, n, self.chunk_rows)):
+            rng = self._rng(table, c)
+            ids = np.arange(start + 1, min(n, start + self.chunk_rows) + 1, dtype=np.int64)
+            V = self._vectors(rng, len(ids))
+            yield Chunk(table, COLUMNS[table], self._rows(rng, table, ids, V), ids, V)
+
+
+def sample_queries(n: int, seed: int = 7, words: Tuple[int, int] = (2, 8)) -> List[str]:
+    """Consultas distintas (para no medir la caché de resultados) con el mismo vocabulario del corpus."""
+    rng = np.random.default_rng([seed, 99])
+    vocab, p = np.array(VOCAB), _zipf_weights(len(VOCAB))
+    out: List[str] = []
+    seen = set()
+    while len(out) < n:
+        q = " ".join(rng.choice(vocab, size=int(rng.integers(words[0], words[1] + 1)), p=p, replace=False))
+        if q not in seen:
+            seen.add(q)
+            out.append(q)
+    return out
+
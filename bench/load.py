@@ -0,0 +1,79 @@
+# bench/load.py — Carga del corpus sintético (MySQL o SQLite) y snapshots mmap (mismo formato que make_embeddings.py)
+import os
+import time
+from typing import Dict
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from db_pool import ConnectionPool
+from snapshot import snapshot_paths
+
+from .corpus import CorpusGenerator
+
+# documentos al final del TRUNCATE y al inicio del INSERT por las llaves foráneas
+LOAD_ORDER = ["documentos", "articulos", "modificaciones", "anexos"]
+
+
+class _SnapshotSink:
+    """Escribe <tabla>.npy / <tabla>.ids.npy por tramos, sin tener la matriz completa en memoria."""
+
+    def __init__(self, snapshot_dir: str, table: str, n: int, dim: int):
+        os.makedirs(snapshot_dir, exist_ok=True)
+        self.m_path, self.ids_path = snapshot_paths(snapshot_dir, table)
+        self.matrix = open_memmap(self.m_path + ".tmp", mode="w+", dtype=np.float32, shape=(n, dim))
+        self.ids = np.zeros(n, dtype=np.int64)
+        self.pos = 0
+
+    def write(self, ids: np.ndarray, V: np.ndarray):
+        end = self.pos + len(ids)
+        self.matrix[self.pos:end] = V
+        self.ids[self.pos:end] = ids
+        self.pos = end
+
+    def close(self):
+        self.matrix.flush()
+        del self.matrix
+        # Igual que snapshot.write_snapshot: primero la matriz, al final los ids
+        os.replace(self.m_path + ".tmp", self.m_path)
+        with open(self.ids_path + ".tmp", "wb") as f:
+            np.save(f, self.ids[:self.pos])
+        os.replace(self.ids_path + ".tmp", self.ids_path)
+
+
+def load_corpus(gen: CorpusGenerator, pool: ConnectionPool, snapshot_dir: str = "",
+                insert_batch: int = 1000) -> Dict[str, float]:
+    """
+    Vacía las cuatro tablas y las llena con el corpus de `gen`; con snapshot_dir, además deja
+    los snapshots que main.py abre con mmap (SNAPSHOT_DIR). Devuelve segundos por tabla.
+    """
+    sqlite = pool.dialect == "sqlite"
+    conn = pool.get_conn()
+    tiempos: Dict[str, float] = {}
+    try:
+        cur = conn.cursor()
+        cur.execute("PRAGMA foreign_keys=OFF" if sqlite else "SET FOREIGN_KEY_CHECKS=0")
+        for t in reversed(LOAD_ORDER):
+            cur.execute(f"DELETE FROM {t}" if sqlite else f"TRUNCATE TABLE {t}")
+        conn.commit()
+        for t in LOAD_ORDER:
+            t0 = time.perf_counter()
+            sink = _SnapshotSink(snapshot_dir, t, gen.sizes[t], gen.dim) if snapshot_dir else None
+            for ch in gen.chunks(t):
+                sql = (f"INSERT INTO {t} ({', '.join(ch.columns)}) "
+                       f"VALUES ({', '.join(['%s'] * len(ch.columns))})")
+                for i in range(0, len(ch.rows), insert_batch):
+                    cur.executemany(sql, ch.rows[i:i + insert_batch])
+                conn.commit()
+                if sink is not None:
+                    sink.write(ch.ids, ch.vectors)
+            if sink is not None:
+                sink.close()
+            tiempos[t] = round(time.perf_counter() - t0, 3)
+            print(f"[INFO] {t}: {gen.sizes[t]} filas en {tiempos[t]} s")
+        cur.execute("PRAGMA foreign_keys=ON" if sqlite else "SET FOREIGN_KEY_CHECKS=1")
+        cur.close()
+    finally:
+        conn.close()
+    return tiempos
+
@@ -0,0 +1,318 @@
+# bench/run.py — Latencia (p50/p95/p99), QPS con concurrencia y memoria de /search por tamaño de corpus
+import argparse
+import http.client
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from urllib.parse import urlencode, urlparse
+
+import numpy as np
+
+from .corpus import CorpusGenerator, sample_queries
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = "10000,100000,1000000,5000000"
+
+
+# =======================
+# Cliente HTTP
+# =======================
+class _Client:
+    """Una conexión keep-alive por hilo: se mide el servidor, no el handshake TCP."""
+
+    def __init__(self, base_url: str, timeout_s: float):
+        u = urlparse(base_url)
+        self.conn = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=timeout_s)
+
+    def get(self, path: str, params: Optional[dict] = None):
+        url = path + ("?" + urlencode(params) if params else "")
+        self.conn.request("GET", url)
+        r = self.conn.getresponse()
+        return r.status, r.read()
+
+    def close(self):
+        self.conn.close()
+
+
+def _search_params(q: str, args) -> dict:
+    p = {"query": q, "limit": args.limit, "mode": args.mode}
+    if args.tables:
+        p["tables"] = args.tables
+    return p
+
+
+def percentiles(lat_s: List[float]) -> Dict[str, float]:
+    if not lat_s:
+        return {"n": 0}
+    a = np.asarray(lat_s) * 1000.0
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {"n": int(a.size), "mean_ms": round(float(a.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(a.max()), 3)}
+
+
+def measure_latency(base_url: str, queries: List[str], args) -> Dict:
+    """Una consulta a la vez: latencia sin contención."""
+    c = _Client(base_url, args.request_timeout)
+    lat, errores = [], 0
+    try:
+        for q in queries:
+            t0 = time.perf_counter()
+            status, _ = c.get("/search", _search_params(q, args))
+            if status == 200:
+                lat.append(time.perf_counter() - t0)
+            else:
+                errores += 1
+    finally:
+        c.close()
+    return {**percentiles(lat), "errors": errores}
+
+
+def measure_throughput(base_url: str, queries: List[str], concurrency: int, args) -> Dict:
+    """`concurrency` clientes cerrados (cada uno espera su respuesta) durante args.duration segundos."""
+    lat: List[float] = []
+    errores = [0]
+    lock = threading.Lock()
+    stop = time.perf_counter() + args.duration
+
+    def worker(k: int):
+        c = _Client(base_url, args.request_timeout)
+        mios, err, i = [], 0, k
+        try:
+            while time.perf_counter() < stop:
+                q = queries[i % len(queries)]
+                i += concurrency
+                t0 = time.perf_counter()
+                try:
+                    status, _ = c.get("/search", _search_params(q, args))
+                except (OSError, http.client.HTTPException):
+                    status = 0
+                    c.close()
+                    c = _Client(base_url, args.request_timeout)
+                if status == 200:
+                    mios.append(time.perf_counter() - t0)
+                else:
+                    err += 1
+        finally:
+            c.close()
+        with lock:
+            lat.extend(mios)
+            errores[0] += err
+
+    t0 = time.perf_counter()
+    hilos = [threading.Thread(target=worker, args=(k,), daemon=True) for k in range(concurrency)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    elapsed = time.perf_counter() - t0
+    return {"concurrency": concurrency, "qps": round(len(lat) / elapsed, 2), "errors": errores[0],
+            **percentiles(lat)}
+
+
+_STAGE_RE = re.compile(r'^search_stage_seconds_(sum|count)\{app="main",stage="([^"]+)",table="[^"]*"\} (\S+)$')
+
+
+def stage_means(base_url: str, args) -> Dict[str, float]:
+    """ms promedio por etapa según /metrics (suma sobre tablas / peticiones con esa etapa)."""
+    c = _Client(base_url, args.request_timeout)
+    try:
+        status, body = c.get("/metrics")
+    except (OSError, http.client.HTTPException):
+        return {}
+    finally:
+        c.close()
+    if status != 200:
+        return {}
+    sums: Dict[str, float] = {}
+    counts: Dict[str, float] = {}
+    for line in body.decode().splitlines():
+        m = _STAGE_RE.match(line)
+        if m:
+            d = sums if m.group(1) == "sum" else counts
+            d[m.group(2)] = d.get(m.group(2), 0.0) + float(m.group(3))
+    return {s: round(sums[s] * 1000.0 / counts[s], 3) for s in sorted(sums) if counts.get(s)}
+
+
+# =======================
+# Servidor
+# =======================
+def rss_mb(pid: int) -> Dict[str, float]:
+    """VmRSS / VmHWM (pico) de /proc; vacío fuera de Linux."""
+    out = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key = "rss_mb" if line.startswith("VmRSS") else "peak_rss_mb"
+                    out[key] = round(int(line.split()[1]) / 1024.0, 1)
+    except OSError:
+        pass
+    return out
+
+
+def start_server(port: int, env: Dict[str, str], timeout_s: float) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", "1", "--log-level", "warning"],
+        cwd=ROOT, env={**os.environ, **env},
+    )
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"El servidor terminó al arrancar (código {proc.returncode})")
+        try:
+            c = _Client(f"http://127.0.0.1:{port}", 5.0)
+            status, _ = c.get("/")
+            c.close()
+            if status == 200:
+                return proc
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise TimeoutError(f"El servidor no respondió en {timeout_s} s")
+
+
+def stop_server(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# =======================
+# Corridas
+# =======================
+def run_size(size: int, args, queries: List[str]) -> Dict:
+    gen = CorpusGenerator(size, dim=args.dim, seed=args.seed)
+    res: Dict = {"size": size, "rows": gen.sizes}
+    snapshot_dir = os.path.join(args.data_dir, f"snap_{size}_{args.dim}_{args.seed}")
+    sqlite_path = os.path.join(args.data_dir, f"bench_{size}_{args.dim}_{args.seed}.sqlite3")
+
+    if not args.url and not args.skip_load:
+        from db_pool import ConnectionPool, default_config
+        from db_sqlite import SQLitePool
+        from .load import load_corpus
+        os.makedirs(args.data_dir, exist_ok=True)
+        pool = (SQLitePool(sqlite_path, readonly=False) if args.backend == "sqlite"
+                else ConnectionPool({**default_config(), "database": args.db_name}))
+        t0 = time.perf_counter()
+        res["load_s_by_table"] = load_corpus(gen, pool, snapshot_dir=snapshot_dir if args.snapshots else "")
+        res["load_s"] = round(time.perf_counter() - t0, 3)
+        pool.close_all()
+
+    proc = None
+    base_url = args.url
+    if not base_url:
+        # Sin cachés: tras la primera pasada por las consultas se mediría solo la búsqueda, sin el encode
+        env = {"DB_BACKEND": args.backend,
+               "RESULT_CACHE_SIZE": "0" if not args.keep_cache else os.getenv("RESULT_CACHE_SIZE", "1024"),
+               "QUERY_CACHE_SIZE": "0" if not args.keep_cache else os.getenv("QUERY_CACHE_SIZE", "2048")}
+        if args.backend == "sqlite":
+            # Despliegue de solo lectura: SQLite para metadatos + snapshots mmap para los vectores
+            env.update({"DB_SQLITE_PATH": sqlite_path, "DB_SQLITE_READONLY": "true"})
+        else:
+            env["DB_NAME"] = args.db_name
+        if args.snapshots:
+            env["SNAPSHOT_DIR"] = snapshot_dir
+        env.update(kv.split("=", 1) for kv in args.env)
+        t0 = time.perf_counter()
+        proc = start_server(args.port, env, args.startup_timeout)
+        res["startup_s"] = round(time.perf_counter() - t0, 3)
+        res["server_env"] = env
+        base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        if proc is not None:
+            res["memory_after_load"] = rss_mb(proc.pid)
+        measure_latency(base_url, queries[:args.warmup], args)  # calienta caché de páginas / JIT de BLAS
+        res["latency"] = measure_latency(base_url, queries[args.warmup:], args)
+        res["throughput"] = [measure_throughput(base_url, queries, c, args) for c in args.concurrency]
+        res["stages_ms"] = stage_means(base_url, args)
+        if proc is not None:
+            res["memory_end"] = rss_mb(proc.pid)
+    finally:
+        if proc is not None:
+            stop_server(proc)
+    return res
+
+
+def git_info() -> Dict[str, str]:
+    def git(*a):
+        try:
+            return subprocess.run(["git", *a], cwd=ROOT, capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"commit": git("rev-parse", "HEAD"), "branch": git("rev-parse", "--abbrev-ref", "HEAD"),
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Benchmark de /search sobre un corpus sintético")
+    ap.add_argument("--sizes", default=DEFAULT_SIZES, help="Filas totales por corrida, separadas por comas")
+    ap.add_argument("--dim", type=int, default=768, help="Debe coincidir con la dimensión de MODEL_NAME")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--queries", type=int, default=300, help="Consultas distintas (incluye las de calentamiento)")
+    ap.add_argument("--warmup", type=int, default=30)
+    ap.add_argument("--concurrency", default="1,8,32", help="Niveles de clientes concurrentes")
+    ap.add_argument("--duration", type=float, default=20.0, help="Segundos por nivel de concurrencia")
+    ap.add_argument("--limit", type=int, default=10)
+    ap.add_argument("--mode", default="semantic", choices=["semantic", "lexical", "hybrid"])
+    ap.add_argument("--tables", default="", help="Tablas a consultar (vacío = TABLES del servidor)")
+    ap.add_argument("--backend", default="sqlite", choices=["sqlite", "mysql"],
+                    help="sqlite: archivo en --data-dir, sin servidor; mysql: base --db-name")
+    ap.add_argument("--db-name", default=os.getenv("BENCH_DB_NAME", "buscador_normativo_bench"),
+                    help="Con --backend mysql: base que se VACÍA y llena (crear antes con buscador_normativo.sql)")
+    ap.add_argument("--no-snapshots", dest="snapshots", action="store_false",
+                    help="No escribir snapshots: el servidor carga los BLOBs desde la BD")
+    ap.add_argument("--data-dir", default=os.path.join(ROOT, "bench", "data"))
+    ap.add_argument("--skip-load", action="store_true", help="Reusar la BD / snapshots de una corrida previa")
+    ap.add_argument("--keep-cache", action="store_true", help="No desactivar las cachés de resultados y de vectores de consulta")
+    ap.add_argument("--env", action="append", default=[], metavar="CLAVE=VALOR",
+                    help="Variables extra para el servidor (INDEX_DTYPE=int8, ANN_NPROBE=16, ...)")
+    ap.add_argument("--url", default="", help="Medir un servidor ya levantado (sin cargar corpus ni medir memoria)")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--startup-timeout", type=float, default=3600.0)
+    ap.add_argument("--request-timeout", type=float, default=60.0)
+    ap.add_argument("--out", default="", help="JSON de salida (por defecto bench/results/<fecha>.json)")
+    args = ap.parse_args(argv)
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    queries = sample_queries(args.queries, seed=args.seed)
+    started = datetime.now(timezone.utc)
+    out = {
+        "meta": {
+            "started_at": started.isoformat(timespec="seconds"),
+            "git": git_info(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k != "url" or v},
+        },
+        "runs": [],
+    }
+    path = args.out or os.path.join(ROOT, "bench", "results", started.strftime("%Y%m%dT%H%M%SZ") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    for size in sizes:
+        print(f"[INFO] Corpus de {size} filas")
+        out["runs"].append(run_size(size, args, queries))
+        # Se reescribe tras cada tamaño: una corrida larga interrumpida conserva lo medido
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(out, f, ensure_ascii=False, indent=2, default=str)
+        lat = out["runs"][-1]["latency"]
+        print(f"[INFO] {size} filas: p50={lat.get('p50_ms')} ms p95={lat.get('p95_ms')} ms p99={lat.get('p99_ms')} ms")
+    print(f"[INFO] Resultados en {path}")
+    return out
+
+
+if __name__ == "__main__":
+    main()
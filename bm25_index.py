@@ -0,0 +1,336 @@
+# bm25_index.py — Índice invertido BM25 en proceso (normalización en español, postings compactos)
+import argparse
+import math
+import os
+import re
+import time
+import unicodedata
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a al algo algunas algunos ante antes como con contra cual cuales cuando de del desde donde
+durante e el ella ellas ellos en entre era eran es esa esas ese eso esos esta estas este esto
+estos fue fueron ha han hasta la las le les lo los mas me mi mismo mucho muy ni no nos o os otra
+otras otro otros para pero poco por porque que quien quienes se sea sean ser si sin sobre su sus
+tambien tan te tiene tienen todo todos tu un una uno unos y ya
+""".split())
+
+
+def fold(text: str) -> str:
+    """Minúsculas y sin acentos (á->a, ñ->n, ü->u)."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def stem(w: str) -> str:
+    """Stemmer ligero para español (plurales y vocal final), estilo SpanishLightStemmer."""
+    n = len(w)
+    if n < 5:
+        return w
+    last = w[-1]
+    if last in "oae":
+        return w[:-1]
+    if last == "s":
+        if w.endswith("eses"):
+            return w[:-2]
+        if w.endswith("ces"):
+            return w[:-3] + "z"
+        if w[-2] in "oae":
+            return w[:-2]
+    return w
+
+
+def analyze(text: str) -> List[str]:
+    return [stem(t) for t in _TOKEN_RE.findall(fold(text or "")) if t not in STOPWORDS]
+
+
+def text_crc(text: str) -> int:
+    """CRC32 de los bytes UTF-8: el mismo valor que CRC32(col) en MySQL (utf8mb4) y en db_sqlite."""
+    return zlib.crc32(text.encode("utf-8"))
+
+
+class BM25Index:
+    """
+    Postings en CSR: para el término t, doc_rows[offsets[t]:offsets[t+1]] son posiciones de
+    documento y tfs[...] sus frecuencias. doc_ids[pos] es el id de la fila en la tabla y
+    doc_crc[pos] el CRC32 del texto indexado (para detectar filas editadas).
+    """
+
+    def __init__(self, terms: List[str], offsets: np.ndarray, doc_rows: np.ndarray, tfs: np.ndarray,
+                 doc_ids: np.ndarray, doc_len: np.ndarray, doc_crc: np.ndarray):
+        self.terms = terms
+        self.vocab: Dict[str, int] = {t: i for i, t in enumerate(terms)}
+        self.offsets = offsets      # (V + 1,) int64
+        self.doc_rows = doc_rows    # (P,) int32
+        self.tfs = tfs              # (P,) uint16
+        self.doc_ids = doc_ids      # (N,) int64
+        self.doc_len = doc_len      # (N,) int32
+        self.doc_crc = doc_crc      # (N,) uint32
+
+    @classmethod
+    def empty(cls) -> "BM25Index":
+        return cls([], np.zeros((1,), dtype=np.int64), np.zeros((0,), dtype=np.int32),
+                   np.zeros((0,), dtype=np.uint16), np.zeros((0,), dtype=np.int64),
+                   np.zeros((0,), dtype=np.int32), np.zeros((0,), dtype=np.uint32))
+
+    @property
+    def n_docs(self) -> int:
+        return int(self.doc_ids.shape[0])
+
+    # ---- construcción incremental ----
+    def add_documents(self, docs: Iterable[Tuple[int, str]]) -> int:
+        """
+        Agrega documentos nuevos (id, texto) sin re-tokenizar los existentes: se generan
+        postings solo para los nuevos y se fusionan con los actuales ordenando por término.
+        """
+        vocab = dict(self.vocab)
+        terms = list(self.terms)
+        new_t: List[int] = []
+        new_r: List[int] = []
+        new_tf: List[int] = []
+        new_ids: List[int] = []
+        new_len: List[int] = []
+        new_crc: List[int] = []
+        base = self.n_docs
+        for doc_id, text in docs:
+            toks = analyze(text)
+            counts: Dict[str, int] = {}
+            for t in toks:
+                counts[t] = counts.get(t, 0) + 1
+            row = base + len(new_ids)
+            for t, c in counts.items():
+                tid = vocab.get(t)
+                if tid is None:
+                    tid = vocab[t] = len(terms)
+                    terms.append(t)
+                new_t.append(tid)
+                new_r.append(row)
+                new_tf.append(min(c, 65535))
+            new_ids.append(int(doc_id))
+            new_len.append(len(toks))
+            new_crc.append(text_crc(text))
+        if not new_ids:
+            return 0
+
+        old_t = np.repeat(np.arange(len(self.terms), dtype=np.int64), np.diff(self.offsets))
+        all_t = np.concatenate([old_t, np.asarray(new_t, dtype=np.int64)])
+        all_r = np.concatenate([self.doc_rows, np.asarray(new_r, dtype=np.int32)])
+        all_tf = np.concatenate([self.tfs, np.asarray(new_tf, dtype=np.uint16)])
+        order = np.argsort(all_t, kind="stable")  # estable: filas en orden dentro de cada término
+
+        offsets = np.zeros((len(terms) + 1,), dtype=np.int64)
+        np.cumsum(np.bincount(all_t, minlength=len(terms)), out=offsets[1:])
+        self.terms, self.vocab = terms, vocab
+        self.offsets = offsets
+        self.doc_rows = all_r[order]
+        self.tfs = all_tf[order]
+        self.doc_ids = np.concatenate([self.doc_ids, np.asarray(new_ids, dtype=np.int64)])
+        self.doc_len = np.concatenate([self.doc_len, np.asarray(new_len, dtype=np.int32)])
+        self.doc_crc = np.concatenate([self.doc_crc, np.asarray(new_crc, dtype=np.uint32)])
+        return len(new_ids)
+
+    def remove_documents(self, ids: np.ndarray) -> int:
+        """
+        Quita los documentos con esos ids (borrados o editados) compactando los postings: sin lápidas,
+        así df, N y avgdl de search() y max_score() solo cuentan documentos vivos.
+        """
+        keep = ~np.isin(self.doc_ids, ids)
+        removed = int(self.n_docs - keep.sum())
+        if not removed:
+            return 0
+        new_row = (np.cumsum(keep) - 1).astype(np.int32)
+        live = keep[self.doc_rows]
+        # Filtrar conserva el orden por término (y por fila dentro de cada uno)
+        t = np.repeat(np.arange(len(self.terms), dtype=np.int64), np.diff(self.offsets))[live]
+        offsets = np.zeros((len(self.terms) + 1,), dtype=np.int64)
+        np.cumsum(np.bincount(t, minlength=len(self.terms)), out=offsets[1:])
+        self.offsets = offsets
+        self.doc_rows = new_row[self.doc_rows[live]]
+        self.tfs = self.tfs[live]
+        self.doc_ids = self.doc_ids[keep]
+        self.doc_len = self.doc_len[keep]
+        self.doc_crc = self.doc_crc[keep]
+        return removed
+
+    # ---- consulta ----
+    def search(self, query: str, k: int, allowed_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids de fila, puntajes BM25) de los k mejores, ordenados desc; opcionalmente solo entre `allowed_ids`."""
+        empty = (np.zeros((0,), dtype=np.int64), np.zeros((0,), dtype=np.float32))
+        tids = sorted({self.vocab[t] for t in analyze(query) if t in self.vocab})
+        if not tids or self.n_docs == 0:
+            return empty
+        N = self.n_docs
+        avgdl = float(self.doc_len.mean()) or 1.0
+        rows_parts, score_parts = [], []
+        for tid in tids:
+            s, e = self.offsets[tid], self.offsets[tid + 1]
+            rows = self.doc_rows[s:e]
+            tf = self.tfs[s:e].astype(np.float32)
+            df = e - s
+            idf = math.log(1.0 + (N - df + 0.5) / (df + 0.5))
+            dl = self.doc_len[rows].astype(np.float32)
+            rows_parts.append(rows)
+            score_parts.append(idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / avgdl)))
+        rows = np.concatenate(rows_parts)
+        # Acumula por documento solo sobre los que aparecen en algún posting
+        uniq, inv = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inv, weights=np.concatenate(score_parts)).astype(np.float32)
+        if allowed_ids is not None:
+            keep = np.isin(self.doc_ids[uniq], allowed_ids)
+            uniq, scores = uniq[keep], scores[keep]
+            if uniq.shape[0] == 0:
+                return empty
+        kk = min(k, uniq.shape[0])
+        part = np.argpartition(-scores, kk - 1)[:kk]
+        part = part[np.argsort(-scores[part], kind="stable")]
+        return self.doc_ids[uniq[part]], scores[part]
+
+    def max_score(self, query: str) -> float:
+        """
+        Cota superior del puntaje BM25 de `query` en este índice: sum(idf * (k1 + 1)) sobre sus términos.
+        score / max_score queda en [0, 1] y sí se puede comparar entre tablas, cuyos idf y avgdl difieren;
+        un término ausente de la tabla cuenta con el idf máximo (ningún documento lo tiene).
+        """
+        N = self.n_docs
+        total = 0.0
+        for t in set(analyze(query)):
+            tid = self.vocab.get(t)
+            df = 0 if tid is None else int(self.offsets[tid + 1] - self.offsets[tid])
+            total += math.log(1.0 + (N - df + 0.5) / (df + 0.5)) * (BM25_K1 + 1)
+        return total
+
+    # ---- persistencia ----
+    def save(self, path: str):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, terms=np.array(self.terms, dtype=str), offsets=self.offsets,
+                 doc_rows=self.doc_rows, tfs=self.tfs, doc_ids=self.doc_ids, doc_len=self.doc_len,
+                 doc_crc=self.doc_crc)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as z:
+            if "doc_crc" not in z:
+                raise ValueError("índice sin doc_crc (versión anterior)")
+            return cls(z["terms"].tolist(), z["offsets"], z["doc_rows"], z["tfs"], z["doc_ids"], z["doc_len"],
+                       z["doc_crc"])
+
+
+def bm25_path(index_dir: str, table: str) -> str:
+    return os.path.join(index_dir, f"{table}.bm25.npz")
+
+
+def text_signatures(conn, table: str, id_col: str, text_col: str,
+                    batch: int = 20000) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (ids, CRC32 del texto) de todas las filas con texto, paginado por llave. El servidor calcula el
+    CRC: se transfieren 12 bytes por fila en lugar del texto, y las filas editadas se distinguen sin
+    una columna de fecha de modificación en el esquema.
+    """
+    ids: List[int] = []
+    crcs: List[int] = []
+    last = None
+    while True:
+        cur = conn.cursor()
+        where = f"`{text_col}` IS NOT NULL" + (f" AND `{id_col}` > %s" if last is not None else "")
+        cur.execute(
+            f"SELECT `{id_col}`, CRC32(`{text_col}`) FROM `{table}` WHERE {where} ORDER BY `{id_col}` LIMIT %s",
+            (last, batch) if last is not None else (batch,),
+        )
+        rows = cur.fetchall()
+        cur.close()
+        if not rows:
+            break
+        for _id, crc in rows:
+            ids.append(int(_id))
+            crcs.append(int(crc))
+        last = ids[-1]
+    return np.asarray(ids, dtype=np.int64), np.asarray(crcs, dtype=np.uint32)
+
+
+def iter_texts(conn, table: str, id_col: str, text_col: str, ids: np.ndarray,
+               batch: int = 1000) -> Iterable[Tuple[int, str]]:
+    """(id, texto) de las filas indicadas, por lotes de `batch` ids."""
+    for i in range(0, ids.shape[0], batch):
+        chunk = [int(x) for x in ids[i:i + batch]]
+        cur = conn.cursor()
+        cur.execute(
+            f"SELECT `{id_col}`, `{text_col}` FROM `{table}` "
+            f"WHERE `{id_col}` IN ({', '.join(['%s'] * len(chunk))}) AND `{text_col}` IS NOT NULL "
+            f"ORDER BY `{id_col}`",
+            chunk,
+        )
+        rows = cur.fetchall()
+        cur.close()
+        for _id, txt in rows:
+            yield int(_id), str(txt)
+
+
+def sync(idx: BM25Index, conn, table: str, id_col: str, text_col: str) -> Tuple[int, int]:
+    """
+    Pone `idx` al día con la tabla: quita filas borradas o editadas (CRC distinto, o texto en NULL)
+    y agrega las nuevas y las editadas. Devuelve (agregados, quitados).
+    """
+    db_ids, db_crc = text_signatures(conn, table, id_col, text_col)
+    order = np.argsort(idx.doc_ids, kind="stable")
+    sorted_ids, sorted_crc = idx.doc_ids[order], idx.doc_crc[order]
+    pos = np.minimum(np.searchsorted(sorted_ids, db_ids), max(sorted_ids.shape[0] - 1, 0))
+    same = np.zeros(db_ids.shape, dtype=bool)
+    if sorted_ids.shape[0]:
+        same = (sorted_ids[pos] == db_ids) & (sorted_crc[pos] == db_crc)
+    removed = idx.remove_documents(np.setdiff1d(idx.doc_ids, db_ids[same]))
+    added = idx.add_documents(iter_texts(conn, table, id_col, text_col, db_ids[~same]))
+    return added, removed
+
+
+def load_and_update(index_dir: str, table: str, id_col: str, text_col: str, get_conn) -> BM25Index:
+    """Carga el índice persistido y lo sincroniza con la tabla (filas nuevas, editadas y borradas)."""
+    path = bm25_path(index_dir, table) if index_dir else ""
+    idx = BM25Index.empty()
+    if path and os.path.exists(path):
+        try:
+            idx = BM25Index.load(path)
+        except Exception as e:
+            print(f"[WARN] No se pudo leer {path}: {e}; se reconstruye.")
+    t0 = time.time()
+    conn = get_conn()
+    try:
+        added, removed = sync(idx, conn, table, id_col, text_col)
+    finally:
+        conn.close()
+    if added or removed:
+        print(f"[INFO] BM25 {table}: +{added} / -{removed} docs ({idx.n_docs} total) en {time.time() - t0:.2f}s")
+        if path:
+            os.makedirs(index_dir, exist_ok=True)
+            idx.save(path)
+    return idx
+
+
+def main():
+    from db_pool import get_conn
+    from table_config import TABLE_CONFIGS
+
+    parser = argparse.ArgumentParser(description="Índice BM25 por tabla (construcción / actualización incremental)")
+    parser.add_argument("--index-dir", required=True)
+    parser.add_argument("--tables", nargs="+", default=list(TABLE_CONFIGS))
+    parser.add_argument("--rebuild", action="store_true", help="Descarta el índice persistido y reconstruye")
+    args = parser.parse_args()
+
+    for table in args.tables:
+        conf = TABLE_CONFIGS[table]
+        if args.rebuild and os.path.exists(bm25_path(args.index_dir, table)):
+            os.remove(bm25_path(args.index_dir, table))
+        idx = load_and_update(args.index_dir, table, conf.id_col, conf.text_col, get_conn)
+        print(f"[OK] {table}: {idx.n_docs} docs, {len(idx.terms)} términos, {idx.doc_rows.shape[0]} postings")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# db_aio.py — Pool asíncrono (mysql.connector.aio, Connector/Python >= 9.0) para las etapas de BD de la API
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from db_pool import DB_BACKEND, POOL_SIZE, POOL_TIMEOUT_S, POOL_RECYCLE_S, POOL_PING, default_config
+
+try:
+    import mysql.connector.aio as mysql_aio
+except ImportError:  # Connector/Python < 9.0: las etapas de BD van al ejecutor de hilos
+    mysql_aio = None
+
+DB_ASYNC = os.getenv("DB_ASYNC", "true").lower() == "true"
+
+
+class AsyncConnectionPool:
+    """
+    Mismo criterio que db_pool.ConnectionPool (LIFO, reciclado, ping) pero sin hilos:
+    las corrutinas esperan una conexión libre en lugar de bloquear un worker.
+    """
+
+    def __init__(self, cfg: dict, size: int = POOL_SIZE, timeout_s: float = POOL_TIMEOUT_S,
+                 recycle_s: float = POOL_RECYCLE_S, ping: bool = POOL_PING):
+        self.cfg = dict(cfg)
+        self.size = max(1, size)
+        self.timeout_s = timeout_s
+        self.recycle_s = recycle_s
+        self.ping = ping
+        self._idle: List[Tuple[object, float]] = []
+        self._sem: Optional[asyncio.Semaphore] = None  # se crea dentro del event loop
+        self._open = 0
+        self.waiting = 0
+        self.queries = 0
+
+    async def _acquire(self):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.size)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.timeout_s)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Pool asíncrono agotado ({self.size} conexiones en uso)")
+        finally:
+            self.waiting -= 1
+        raw = None
+        try:
+            while self._idle:
+                raw, created_at = self._idle.pop()
+                if await self._healthy(raw, created_at):
+                    return raw, created_at
+                await self._discard(raw)
+                raw = None
+            raw = await mysql_aio.connect(**self.cfg)
+            self._open += 1
+            return raw, time.monotonic()
+        except BaseException:
+            # BaseException: CancelledError (timeout de fan_out, cliente que se desconecta) no es Exception
+            # y sin esto cada cancelación se llevaba un permiso del semáforo para siempre.
+            if raw is not None:
+                # Sacada de _idle pero no entregada (cancelada en el ping): su estado es incierto, se cierra
+                self._open -= 1
+                asyncio.ensure_future(self._close_quietly(raw))
+            self._sem.release()
+            raise
+
+    async def _healthy(self, raw, created_at: float) -> bool:
+        if self.recycle_s and time.monotonic() - created_at > self.recycle_s:
+            return False
+        if self.ping:
+            try:
+                await raw.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    async def _discard(self, raw):
+        self._open -= 1
+        await self._close_quietly(raw)
+
+    @staticmethod
+    async def _close_quietly(raw):
+        try:
+            await raw.close()
+        except Exception:
+            pass
+
+    async def _release(self, raw, created_at: float, broken: bool):
+        try:
+            if broken:
+                await self._discard(raw)
+            else:
+                self._idle.append((raw, created_at))
+        finally:
+            self._sem.release()
+
+    async def fetch_all(self, sql: str, params: Optional[Sequence] = None) -> List[dict]:
+        """Ejecuta un SELECT y devuelve filas como dict."""
+        raw, created_at = await self._acquire()
+        broken = True
+        try:
+            cur = await raw.cursor(dictionary=True)
+            try:
+                await cur.execute(sql, params)
+                rows = await cur.fetchall()
+            finally:
+                await cur.close()
+            self.queries += 1
+            broken = False
+            return rows
+        finally:
+            await self._release(raw, created_at, broken)
+
+    def stats(self) -> Dict[str, int]:
+        return {"open": self._open, "idle": len(self._idle), "size": self.size,
+                "waiting": self.waiting, "queries": self.queries}
+
+
+_pools: Dict[Tuple, AsyncConnectionPool] = {}
+
+
+def get_async_pool(cfg: Optional[dict] = None, **kwargs) -> Optional[AsyncConnectionPool]:
+    """Un pool asíncrono por configuración; None si no hay mysql.connector.aio, DB_ASYNC=false o el backend no es MySQL."""
+    if mysql_aio is None or not DB_ASYNC or DB_BACKEND != "mysql":
+        return None
+    cfg = cfg or default_config()
+    key = tuple(sorted(cfg.items()))
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = AsyncConnectionPool(cfg, **kwargs)
+    return pool
@@ -0,0 +1,184 @@
+# db_pool.py — Pool de conexiones compartido (API, app/, make_embeddings y extractor): MySQL o SQLite
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+import mysql.connector as mysql
+from mysql.connector.errors import PoolError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()        # mysql | sqlite (ver db_sqlite.py)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))              # conexiones que se mantienen abiertas
+POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "10"))  # extra temporales bajo carga
+POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT_S", "10"))  # espera máxima por una conexión libre
+POOL_RECYCLE_S = float(os.getenv("DB_POOL_RECYCLE_S", "3600"))  # reabre conexiones más viejas que esto
+POOL_PING = os.getenv("DB_POOL_PING", "true").lower() == "true"  # verifica la conexión al tomarla
+
+
+def default_config() -> dict:
+    return dict(
+        host=os.getenv("DB_HOST", "127.0.0.1"),
+        port=int(os.getenv("DB_PORT", "3306")),
+        user=os.getenv("DB_USER", "root"),
+        password=os.getenv("DB_PASSWORD", "1234"),
+        database=os.getenv("DB_NAME", "buscador_normativo"),
+    )
+
+
+class PooledConnection:
+    """
+    Envoltura de una conexión del pool: se usa igual que la de mysql.connector,
+    pero close() la devuelve al pool en lugar de cerrarla.
+    """
+
+    def __init__(self, pool: "ConnectionPool", raw, created_at: float):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._raw is None:
+            return
+        raw, self._raw = self._raw, None
+        self._pool._release(raw, self._created_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConnectionPool:
+    dialect = "mysql"
+
+    def __init__(self, cfg: dict, size: int = POOL_SIZE, max_overflow: int = POOL_MAX_OVERFLOW,
+                 timeout_s: float = POOL_TIMEOUT_S, recycle_s: float = POOL_RECYCLE_S,
+                 ping: bool = POOL_PING):
+        self.cfg = dict(cfg)
+        self.size = max(1, size)
+        self.max_overflow = max(0, max_overflow)
+        self.timeout_s = timeout_s
+        self.recycle_s = recycle_s
+        self.ping = ping
+        self._idle: deque = deque()   # (raw, created_at), LIFO para reutilizar conexiones calientes
+        self._open = 0                # conexiones abiertas (ociosas + prestadas)
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        return mysql.connect(**self.cfg), time.monotonic()
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _healthy(self, raw, created_at: float) -> bool:
+        if self.recycle_s and time.monotonic() - created_at > self.recycle_s:
+            return False
+        if self.ping:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    def get_conn(self) -> PooledConnection:
+        deadline = time.monotonic() + self.timeout_s
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, created_at = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    raw, created_at = None, 0.0
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolError(f"Pool agotado ({self._open} conexiones en uso)")
+                self._cond.wait(remaining)
+
+        # Conectar / validar fuera del lock
+        try:
+            if raw is not None and not self._healthy(raw, created_at):
+                self._discard(raw)
+                raw = None
+            if raw is None:
+                raw, created_at = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, raw, created_at)
+
+    def _release(self, raw, created_at: float):
+        try:
+            # No devolver transacciones a medias al pool
+            if raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            self._discard(raw)
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            if len(self._idle) >= self.size:
+                # Conexión de overflow: se cierra en lugar de quedarse ociosa
+                self._open -= 1
+                self._discard(raw)
+            else:
+                self._idle.append((raw, created_at))
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"open": self._open, "idle": len(self._idle), "size": self.size,
+                    "max_overflow": self.max_overflow}
+
+    def close_all(self):
+        with self._cond:
+            while self._idle:
+                raw, _ = self._idle.pop()
+                self._open -= 1
+                self._discard(raw)
+
+
+_pools: Dict[Tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(cfg: Optional[dict] = None, **kwargs) -> ConnectionPool:
+    """
+    Un pool por proceso y por configuración de conexión. Con DB_BACKEND=sqlite, `cfg` (de MySQL)
+    se ignora y todos comparten el archivo DB_SQLITE_PATH.
+    """
+    if DB_BACKEND == "sqlite":
+        from db_sqlite import SQLITE_PATH, SQLitePool
+        with _pools_lock:
+            key = ("sqlite", SQLITE_PATH)
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = SQLitePool(SQLITE_PATH, **kwargs)
+            return pool
+    cfg = cfg or default_config()
+    key = tuple(sorted(cfg.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(cfg, **kwargs)
+        return pool
+
+
+def get_conn(cfg: Optional[dict] = None) -> PooledConnection:
+    return get_pool(cfg).get_conn()
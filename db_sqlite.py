@@ -0,0 +1,233 @@
+# db_sqlite.py — Backend SQLite embebido con la misma interfaz que db_pool (DB_BACKEND=sqlite)
+#
+# Mismo esquema que buscador_normativo.sql y la misma forma de uso que mysql.connector
+# (cursor(dictionary=True), placeholders %s, lastrowid, commit), así que main.py, app/,
+# make_embeddings.py, bm25_index.py y el extractor funcionan sin servidor MySQL: pruebas,
+# benchmarks y despliegues de un solo nodo de solo lectura (con los vectores en SNAPSHOT_DIR).
+#
+#   python db_sqlite.py --init                 # crea las tablas en DB_SQLITE_PATH
+#   python db_sqlite.py --from-mysql           # copia las cuatro tablas desde MySQL (DB_HOST, DB_NAME, ...)
+import argparse
+import os
+import re
+import sqlite3
+import time
+import zlib
+from datetime import date, datetime
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from db_pool import ConnectionPool, POOL_SIZE, POOL_MAX_OVERFLOW, POOL_TIMEOUT_S
+
+load_dotenv()
+
+SQLITE_PATH = os.getenv("DB_SQLITE_PATH", "buscador_normativo.sqlite3")
+SQLITE_READONLY = os.getenv("DB_SQLITE_READONLY", "false").lower() == "true"  # mode=ro: sin escrituras ni WAL
+SQLITE_MMAP_MB = int(os.getenv("DB_SQLITE_MMAP_MB", "256"))     # lecturas vía mmap en lugar de read()
+SQLITE_CACHE_MB = int(os.getenv("DB_SQLITE_CACHE_MB", "64"))    # page cache por conexión
+
+# Traducción directa de buscador_normativo.sql: ENUM -> TEXT, AUTO_INCREMENT -> INTEGER PRIMARY KEY
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS documentos (
+        id_documento INTEGER PRIMARY KEY,
+        nombre_regulacion TEXT,
+        ambito_aplicacion TEXT,
+        tipo_de_ordenamiento TEXT,
+        fecha_publicacion DATE,
+        emisor TEXT,
+        ruta_archivo TEXT,
+        embedding_completo BLOB,
+        embedding_nombre BLOB,
+        embedding_ambito BLOB,
+        embedding_tipo BLOB,
+        embedding_emisor BLOB
+    )""",
+    """CREATE TABLE IF NOT EXISTS articulos (
+        id_articulo INTEGER PRIMARY KEY,
+        id_documento INTEGER NOT NULL REFERENCES documentos (id_documento) ON DELETE CASCADE ON UPDATE CASCADE,
+        numero_articulo TEXT,
+        texto_articulo TEXT,
+        embedding_articulo BLOB
+    )""",
+    "CREATE INDEX IF NOT EXISTS articulos_id_documento ON articulos (id_documento)",
+    """CREATE TABLE IF NOT EXISTS modificaciones (
+        id_modificacion INTEGER PRIMARY KEY,
+        id_documento INTEGER NOT NULL REFERENCES documentos (id_documento) ON DELETE CASCADE ON UPDATE CASCADE,
+        id_articulo INTEGER REFERENCES articulos (id_articulo) ON DELETE SET NULL ON UPDATE CASCADE,
+        nombre_regulacion TEXT,
+        tipo_modificacion TEXT,
+        texto_modificacion TEXT,
+        fecha_publicacion DATE,
+        fuente TEXT,
+        ruta_archivo TEXT,  -- no está en el dump, pero la usan table_config y el extractor
+        embedding_completo BLOB,
+        embedding_texto_modificacion BLOB
+    )""",
+    "CREATE INDEX IF NOT EXISTS modificaciones_id_documento ON modificaciones (id_documento)",
+    "CREATE INDEX IF NOT EXISTS modificaciones_id_articulo ON modificaciones (id_articulo)",
+    """CREATE TABLE IF NOT EXISTS anexos (
+        id_anexo INTEGER PRIMARY KEY,
+        id_documento INTEGER NOT NULL REFERENCES documentos (id_documento) ON DELETE CASCADE ON UPDATE CASCADE,
+        nombre_anexo TEXT,
+        texto_anexo TEXT,
+        ruta_archivo TEXT,
+        embedding_completo BLOB,
+        embedding_texto BLOB
+    )""",
+    "CREATE INDEX IF NOT EXISTS anexos_id_documento ON anexos (id_documento)",
+]
+TABLES = ["documentos", "articulos", "modificaciones", "anexos"]
+
+# DATE de MySQL <-> texto ISO en SQLite (los adaptadores por defecto de sqlite3 están deprecados)
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+sqlite3.register_converter("DATE", lambda b: date.fromisoformat(b.decode()[:10]))
+
+_PLACEHOLDER = re.compile(r"%(s|%)")
+
+
+def to_sqlite(sql: str) -> str:
+    """Placeholders de mysql.connector (%s, %%) al estilo qmark de sqlite3."""
+    return _PLACEHOLDER.sub(lambda m: "?" if m.group(1) == "s" else "%", sql)
+
+
+def _dict_row(cur: sqlite3.Cursor, row: tuple) -> dict:
+    return {d[0]: v for d, v in zip(cur.description, row)}
+
+
+class _Cursor(sqlite3.Cursor):
+    def execute(self, sql, params=None):
+        return super().execute(to_sqlite(sql), params if params is not None else ())
+
+    def executemany(self, sql, seq):
+        return super().executemany(to_sqlite(sql), seq)
+
+
+def _crc32(v) -> Optional[int]:
+    if v is None:
+        return None
+    return zlib.crc32(v.encode("utf-8") if isinstance(v, str) else bytes(v))
+
+
+class SQLiteConnection:
+    """Lo que usa el repo de una conexión de mysql.connector, sobre sqlite3."""
+
+    def __init__(self, path: str, readonly: bool = SQLITE_READONLY):
+        uri = f"file:{path}?mode=ro" if readonly else f"file:{path}"
+        self._cn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                                   detect_types=sqlite3.PARSE_DECLTYPES)
+        if not readonly:
+            self._cn.execute("PRAGMA journal_mode=WAL")  # lectores concurrentes con un escritor
+            self._cn.execute("PRAGMA synchronous=NORMAL")
+        self._cn.execute("PRAGMA foreign_keys=ON")
+        self._cn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}")
+        self._cn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}")
+        # CRC32() de MySQL (bytes UTF-8); bm25_index lo usa para detectar textos editados
+        self._cn.create_function("CRC32", 1, _crc32, deterministic=True)
+
+    def cursor(self, dictionary: bool = False, **_):
+        cur = self._cn.cursor(_Cursor)
+        if dictionary:
+            cur.row_factory = _dict_row
+        return cur
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._cn.in_transaction
+
+    def commit(self):
+        self._cn.commit()
+
+    def rollback(self):
+        self._cn.rollback()
+
+    def ping(self, reconnect: bool = False):
+        self._cn.execute("SELECT 1")
+
+    def close(self):
+        self._cn.close()
+
+
+class SQLitePool(ConnectionPool):
+    """Mismo pool (LIFO, overflow, timeout) que MySQL; abrir una conexión SQLite es solo abrir el archivo."""
+
+    dialect = "sqlite"
+
+    def __init__(self, path: str = SQLITE_PATH, readonly: bool = SQLITE_READONLY, size: int = POOL_SIZE,
+                 max_overflow: int = POOL_MAX_OVERFLOW, timeout_s: float = POOL_TIMEOUT_S):
+        super().__init__({"path": path}, size=size, max_overflow=max_overflow, timeout_s=timeout_s,
+                         recycle_s=0, ping=False)
+        self.path = path
+        self.readonly = readonly
+        if not readonly:
+            init_schema(path)
+
+    def _connect(self):
+        return SQLiteConnection(self.path, self.readonly), time.monotonic()
+
+
+def init_schema(path: str = SQLITE_PATH):
+    cn = sqlite3.connect(path)
+    try:
+        for stmt in SCHEMA:
+            cn.execute(stmt)
+        cn.commit()
+    finally:
+        cn.close()
+
+
+def copy_from_mysql(path: str, tables: List[str], batch: int = 2000, mysql_cfg: Optional[dict] = None):
+    """Copia filas (incluidos los BLOBs de embeddings) de MySQL al archivo SQLite; reemplaza lo que hubiera."""
+    from db_pool import default_config  # pool MySQL explícito: DB_BACKEND=sqlite no aplica aquí
+
+    src = ConnectionPool(mysql_cfg or default_config(), size=1).get_conn()
+    init_schema(path)
+    dst = SQLiteConnection(path, readonly=False)
+    try:
+        dst._cn.execute("PRAGMA foreign_keys=OFF")
+        for t in reversed(TABLES):
+            if t in tables:
+                dst._cn.execute(f"DELETE FROM {t}")
+        for t in TABLES:
+            if t not in tables:
+                continue
+            t0 = time.time()
+            cur = src.cursor()
+            cur.execute(f"SELECT * FROM `{t}`")
+            cols = [d[0] for d in cur.description]
+            sql = f"INSERT INTO {t} ({', '.join(cols)}) VALUES ({', '.join(['?'] * len(cols))})"
+            n = 0
+            while True:
+                rows = cur.fetchmany(batch)
+                if not rows:
+                    break
+                dst._cn.executemany(sql, [tuple(bytes(v) if isinstance(v, bytearray) else v for v in r)
+                                          for r in rows])
+                n += len(rows)
+            cur.close()
+            dst.commit()
+            print(f"[OK] {t}: {n} filas en {time.time() - t0:.1f}s")
+        dst._cn.execute("PRAGMA foreign_keys=ON")
+        dst._cn.execute("ANALYZE")
+    finally:
+        dst.close()
+        src.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Base SQLite con el esquema de buscador_normativo (DB_BACKEND=sqlite)")
+    ap.add_argument("--path", default=SQLITE_PATH)
+    ap.add_argument("--init", action="store_true", help="Solo crea las tablas que falten")
+    ap.add_argument("--from-mysql", action="store_true", help="Copia las tablas desde MySQL (DB_HOST, DB_NAME, ...)")
+    ap.add_argument("--tables", nargs="+", default=TABLES, choices=TABLES)
+    args = ap.parse_args()
+    if args.from_mysql:
+        copy_from_mysql(args.path, args.tables)
+    else:
+        init_schema(args.path)
+        print(f"[OK] Esquema en {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# executors.py — Ejecutores dedicados por etapa (encode / scoring / BD) con métricas de cola
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from metrics import record
+
+# La concurrencia de la API la fijan estos límites, no el threadpool por defecto de Starlette
+ENCODE_WORKERS = int(os.getenv("ENCODE_WORKERS", "1"))   # model.encode ya usa varios hilos de torch
+SCORE_WORKERS = int(os.getenv("SCORE_WORKERS", os.getenv("FANOUT_WORKERS", "8")))  # NumPy libera el GIL
+DB_WORKERS = int(os.getenv("DB_WORKERS", "8"))           # solo si no se usa mysql.connector.aio
+STAGE_QUEUE_MAX = int(os.getenv("STAGE_QUEUE_MAX", "0"))  # tareas en espera por etapa; 0 = sin límite
+
+
+class Saturated(RuntimeError):
+    """La cola de una etapa superó STAGE_QUEUE_MAX: mejor rechazar (503) que acumular latencia."""
+
+
+class StageExecutor:
+    """ThreadPoolExecutor de tamaño fijo para una etapa, con profundidad de cola y tiempos de espera."""
+
+    def __init__(self, name: str, workers: int, queue_max: int = STAGE_QUEUE_MAX):
+        self.name = name
+        self.workers = max(1, workers)
+        self.queue_max = max(0, queue_max)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_queued = 0
+        self.wait_s = 0.0
+        self.busy_s = 0.0
+
+    def _wrap(self, fn: Callable, args, kwargs, t_submit: float):
+        def _call():
+            t0 = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.wait_s += t0 - t_submit
+            record(f"queue_{self.name}", t0 - t_submit)
+            ok = False
+            try:
+                out = fn(*args, **kwargs)
+                ok = True
+                return out
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.busy_s += time.perf_counter() - t0
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+        return _call
+
+    def submit(self, fn: Callable, *args, **kwargs):
+        """concurrent.futures.Future; lanza Saturated si la cola está llena."""
+        with self._lock:
+            if self.queue_max and self.queued >= self.queue_max:
+                self.rejected += 1
+                raise Saturated(f"Etapa {self.name} saturada ({self.queued} en cola)")
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        # Copia del contexto: los tiempos por etapa (metrics.timed) llegan a la petición que los originó
+        ctx = contextvars.copy_context()
+        return self._pool.submit(ctx.run, self._wrap(fn, args, kwargs, time.perf_counter()))
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        cf = self.submit(fn, *args, **kwargs)
+        try:
+            return await asyncio.wrap_future(cf)
+        except asyncio.CancelledError:
+            # Cancelada antes de empezar: nunca pasará por _call, se descuenta aquí
+            if cf.cancel():
+                with self._lock:
+                    self.queued -= 1
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            done = self.completed + self.failed
+            return {
+                "workers": self.workers,
+                "queue_max": self.queue_max,
+                "queued": self.queued,
+                "running": self.running,
+                "max_queued": self.max_queued,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.wait_s * 1000.0 / done, 3) if done else 0.0,
+                "avg_busy_ms": round(self.busy_s * 1000.0 / done, 3) if done else 0.0,
+            }
@@ -26,7 +26,9 @@ from dataclasses import dataclass
 from datetime import date
 
 import fitz  # PyMuPDF
-import mysql.connector as mysql
+
+from db_pool import get_pool
+from generation import bump_generation
 
 # ==========================
 # CONFIG
@@ -356,10 +358,14 @@ def partir_articulos(texto: str) -> List[Tuple[str, str]]:
 # ==========================
 class DB:
     def __init__(self, cfg: dict):
-        self.cn = mysql.connect(**cfg)
+        # Conexión del pool compartido: close() la devuelve en lugar de cerrarla
+        self.cn = get_pool(cfg).get_conn()
         self.cur = self.cn.cursor(dictionary=True)
 
-    def commit(self): self.cn.commit()
+    def commit(self):
+        self.cn.commit()
+        if not DRY_RUN:
+            bump_generation()  # filas nuevas: invalida cachés de resultados de la API
     def rollback(self): self.cn.rollback()
     def close(self):
         try: self.cur.close()
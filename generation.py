@@ -0,0 +1,47 @@
+# generation.py — Contador de generación de datos en archivo (invalida cachés de resultados)
+import os
+import threading
+from typing import Optional, Tuple
+
+GENERATION_FILE = os.getenv(
+    "GENERATION_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".search_generation"),
+)
+
+_lock = threading.Lock()
+_memo: Tuple[Optional[int], int] = (None, 0)  # (mtime_ns, generación)
+
+
+def bump_generation(path: Optional[str] = None) -> int:
+    """Lo llaman los escritores (make_embeddings, extractor) tras hacer commit de filas nuevas."""
+    path = path or GENERATION_FILE
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            gen = int(f.read().strip() or 0) + 1
+    except (OSError, ValueError):
+        gen = 1
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(str(gen))
+    os.replace(tmp, path)
+    return gen
+
+
+def read_generation(path: Optional[str] = None) -> int:
+    """Generación actual; solo relee el archivo si cambió su mtime (un stat por llamada)."""
+    global _memo
+    path = path or GENERATION_FILE
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+    with _lock:
+        if _memo[0] == mtime:
+            return _memo[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                gen = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            gen = 0
+        _memo = (mtime, gen)
+        return gen
@@ -0,0 +1,231 @@
+# ivf_index.py — Índice aproximado IVF (k-means esférico + listas invertidas) sobre la matriz residente
+import argparse
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from snapshot import content_fingerprint
+
+ASSIGN_CHUNK = 65536  # filas por bloque al asignar vectores a centroides
+
+
+def index_fingerprint(ids: np.ndarray, matrix: np.ndarray, source: str = "float32") -> str:
+    # Filas (ids y orden), contenido (muestra de vectores: re-embeber en su lugar invalida los
+    # centroides) y origen del entrenamiento (float32, float16, ...)
+    return content_fingerprint(ids, matrix) + ":" + source
+
+
+def default_nlist(n: int) -> int:
+    return max(1, min(n, int(4 * np.sqrt(n))))
+
+
+def _assign(X: np.ndarray, C: np.ndarray) -> np.ndarray:
+    out = np.empty((X.shape[0],), dtype=np.int32)
+    for s in range(0, X.shape[0], ASSIGN_CHUNK):
+        out[s:s + ASSIGN_CHUNK] = np.argmax(X[s:s + ASSIGN_CHUNK] @ C.T, axis=1)
+    return out
+
+
+def train_kmeans(X: np.ndarray, nlist: int, iters: int = 20, seed: int = 0,
+                 max_train: int = 256) -> np.ndarray:
+    """
+    k-means esférico (coseno) sobre una muestra de a lo más `max_train` puntos por centroide.
+    Devuelve centroides normalizados (nlist, d).
+    """
+    rng = np.random.default_rng(seed)
+    n = X.shape[0]
+    sample = X
+    if n > nlist * max_train:
+        sample = X[np.sort(rng.choice(n, nlist * max_train, replace=False))]
+    sample = np.asarray(sample, dtype=np.float32)
+
+    C = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = _assign(sample, C)
+        sums = np.zeros_like(C)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # Re-siembra centroides vacíos con puntos al azar
+            sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()), replace=False)]
+        C = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-12)
+    return C.astype(np.float32)
+
+
+class IVFIndex:
+    def __init__(self, centroids: np.ndarray, list_offsets: np.ndarray, list_rows: np.ndarray,
+                 fingerprint: str = ""):
+        self.centroids = centroids        # (nlist, d) float32
+        self.list_offsets = list_offsets  # (nlist + 1,) int64; lista i = list_rows[off[i]:off[i+1]]
+        self.list_rows = list_rows        # (n,) int32, posiciones de fila en la matriz
+        self.fingerprint = fingerprint
+
+    @property
+    def nlist(self) -> int:
+        return int(self.centroids.shape[0])
+
+    @classmethod
+    def build(cls, X: np.ndarray, nlist: Optional[int] = None, iters: int = 20,
+              seed: int = 0, fingerprint: str = "") -> "IVFIndex":
+        nlist = min(nlist or default_nlist(X.shape[0]), X.shape[0])
+        C = train_kmeans(X, nlist, iters=iters, seed=seed)
+        assign = _assign(X, C)
+        order = np.argsort(assign, kind="stable").astype(np.int32)
+        counts = np.bincount(assign, minlength=nlist)
+        offsets = np.zeros((nlist + 1,), dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(C, offsets, order, fingerprint)
+
+    def candidates(self, q_vec: np.ndarray, nprobe: int) -> np.ndarray:
+        nprobe = max(1, min(nprobe, self.nlist))
+        cs = self.centroids @ q_vec
+        if nprobe < self.nlist:
+            probe = np.argpartition(-cs, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(self.nlist)
+        off = self.list_offsets
+        return np.concatenate([self.list_rows[off[i]:off[i + 1]] for i in probe])
+
+    def search(self, score_rows: Callable[[np.ndarray, np.ndarray], np.ndarray], q_vec: np.ndarray,
+               nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (filas candidatas, similitudes) usando solo las `nprobe` listas más cercanas.
+        `score_rows(q, filas)` puntúa las filas candidatas (float32 o cuantizadas).
+        """
+        rows = self.candidates(q_vec, nprobe)
+        return rows, score_rows(q_vec, rows)
+
+    # ---- persistencia ----
+    def save(self, path: str):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, centroids=self.centroids, list_offsets=self.list_offsets,
+                 list_rows=self.list_rows, fingerprint=np.array(self.fingerprint))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as z:
+            return cls(z["centroids"], z["list_offsets"], z["list_rows"], str(z["fingerprint"]))
+
+
+def ivf_path(index_dir: str, table: str) -> str:
+    return os.path.join(index_dir, f"{table}.ivf.npz")
+
+
+def load_or_build(index_dir: str, table: str, ids: np.ndarray, matrix: np.ndarray,
+                  nlist: Optional[int] = None, source: str = "float32") -> IVFIndex:
+    """
+    Usa el índice persistido si corresponde a las mismas filas, los mismos vectores (muestra) y el
+    mismo origen de entrenamiento (`source`, el tipo de `matrix`); si no, lo reconstruye y persiste.
+    """
+    fp = index_fingerprint(ids, matrix, source)
+    path = ivf_path(index_dir, table) if index_dir else ""
+    if path and os.path.exists(path):
+        try:
+            ivf = IVFIndex.load(path)
+            if ivf.fingerprint == fp and ivf.list_rows.shape[0] == ids.shape[0]:
+                return ivf
+            print(f"[INFO] Índice IVF de {table} desactualizado; se reconstruye.")
+        except Exception as e:
+            print(f"[WARN] No se pudo leer {path}: {e}")
+    t0 = time.time()
+    ivf = IVFIndex.build(matrix, nlist=nlist, fingerprint=fp)
+    print(f"[INFO] IVF {table}: nlist={ivf.nlist} construido en {time.time() - t0:.2f}s")
+    if path:
+        os.makedirs(index_dir, exist_ok=True)
+        ivf.save(path)
+    return ivf
+
+
+# =======================
+# REPORTE RECALL vs FUERZA BRUTA
+# =======================
+def recall_report(matrix: np.ndarray, ivf: IVFIndex, queries: np.ndarray, k: int,
+                  nprobes: List[int]) -> List[Dict]:
+    """recall@k y latencia media por `nprobe`, comparando contra el top-k exacto."""
+    t0 = time.perf_counter()
+    exact = []
+    for q in queries:
+        s = matrix @ q
+        kk = min(k, s.shape[0])
+        exact.append(set(np.argpartition(-s, kk - 1)[:kk].tolist()))
+    brute_ms = (time.perf_counter() - t0) * 1000.0 / len(queries)
+
+    out = [{"nprobe": "exacto", "recall": 1.0, "ms_por_consulta": round(brute_ms, 3), "candidatos": matrix.shape[0]}]
+    for nprobe in nprobes:
+        hits, cands = 0, 0
+        t0 = time.perf_counter()
+        for q, truth in zip(queries, exact):
+            rows, s = ivf.search(lambda qv, r: matrix[r] @ qv, q, nprobe)
+            kk = min(k, s.shape[0])
+            top = rows[np.argpartition(-s, kk - 1)[:kk]] if kk else rows[:0]
+            hits += len(truth.intersection(top.tolist()))
+            cands += rows.shape[0]
+        ms = (time.perf_counter() - t0) * 1000.0 / len(queries)
+        out.append({
+            "nprobe": nprobe,
+            "recall": round(hits / float(sum(len(t) for t in exact) or 1), 4),
+            "ms_por_consulta": round(ms, 3),
+            "candidatos": cands // len(queries),
+        })
+    return out
+
+
+def synthetic_queries(matrix: np.ndarray, n: int, noise: float, seed: int) -> np.ndarray:
+    # Consultas sintéticas: filas del corpus con ruido gaussiano, renormalizadas
+    rng = np.random.default_rng(seed)
+    Q = np.asarray(matrix[rng.choice(matrix.shape[0], min(n, matrix.shape[0]), replace=False)], dtype=np.float32)
+    Q = Q + noise * rng.standard_normal(Q.shape).astype(np.float32) / np.sqrt(Q.shape[1])
+    return Q / (np.linalg.norm(Q, axis=1, keepdims=True) + 1e-12)
+
+
+def main():
+    from snapshot import load_snapshot
+
+    parser = argparse.ArgumentParser(description="Índice IVF sobre snapshots de embeddings")
+    parser.add_argument("cmd", choices=["build", "report"])
+    parser.add_argument("--snapshot-dir", required=True, help="Carpeta con <tabla>.npy / <tabla>.ids.npy")
+    parser.add_argument("--index-dir", default=None, help="Dónde persistir <tabla>.ivf.npz (default: snapshot-dir)")
+    parser.add_argument("--tables", nargs="+", default=["articulos", "modificaciones"])
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--n-queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.5, help="Ruido de las consultas sintéticas")
+    parser.add_argument("--queries-file", default=None, help="Archivo con una consulta real por línea (usa el modelo)")
+    args = parser.parse_args()
+
+    index_dir = args.index_dir or args.snapshot_dir
+    for table in args.tables:
+        snap = load_snapshot(args.snapshot_dir, table)
+        if snap is None:
+            print(f"[WARN] Sin snapshot para {table}")
+            continue
+        ids, matrix = snap
+        if args.cmd == "build" and os.path.exists(ivf_path(index_dir, table)):
+            os.remove(ivf_path(index_dir, table))
+        ivf = load_or_build(index_dir, table, ids, matrix, nlist=args.nlist)
+        if args.cmd == "build":
+            print(f"[OK] {table}: {matrix.shape[0]} filas, nlist={ivf.nlist} -> {ivf_path(index_dir, table)}")
+            continue
+
+        if args.queries_file:
+            from sentence_transformers import SentenceTransformer
+            with open(args.queries_file, encoding="utf-8") as f:
+                texts = ["query: " + l.strip() for l in f if l.strip()]
+            model = SentenceTransformer(os.getenv("MODEL_NAME", "intfloat/multilingual-e5-base"))
+            queries = model.encode(texts, normalize_embeddings=True).astype(np.float32)
+        else:
+            queries = synthetic_queries(matrix, args.n_queries, args.noise, seed=0)
+
+        print(f"\n[{table}] n={matrix.shape[0]} nlist={ivf.nlist} k={args.k} consultas={len(queries)}")
+        print(f"{'nprobe':>8} {'recall':>8} {'ms/cons':>9} {'candidatos':>11}")
+        for r in recall_report(matrix, ivf, queries, args.k, args.nprobe):
+            print(f"{r['nprobe']:>8} {r['recall']:>8} {r['ms_por_consulta']:>9} {r['candidatos']:>11}")
+
+
+if __name__ == "__main__":
+    main()
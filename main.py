@@ -1,15 +1,40 @@
 # main.py — API de búsqueda semántica (MySQL + múltiples tablas)
+import asyncio
+import json
 import os
-from dataclasses import dataclass
-from typing import List, Optional, Dict
+from datetime import date
+from functools import partial
+from typing import Any, Awaitable, List, Optional, Dict, Tuple
 
 import numpy as np
-import mysql.connector as mysql
-from fastapi import FastAPI, Query
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
 
+try:  # opcional: serialización rápida para el modo stream
+    import orjson
+except ImportError:
+    orjson = None
+
+from db_aio import get_async_pool
+from db_pool import DB_BACKEND, get_pool
+from executors import DB_WORKERS, ENCODE_WORKERS, SCORE_WORKERS, Saturated, StageExecutor
+from table_config import (TableConf, TABLE_CONFIGS, select_sql, select_by_ids_sql,
+                          select_doc_attrs_sql, select_filter_sql)
+from snapshot import content_fingerprint, load_snapshot, load_quantized
+from ivf_index import load_or_build
+from bm25_index import BM25Index, load_and_update as load_bm25_index
+from cache import TTLCache
+from generation import read_generation
+from metadata_filter import Filtros, build_filter_index
+from metrics import EXECUTOR_QUEUED, EXECUTOR_RUNNING, Timings, render_metrics, start_request, timed
+from quantization import KINDS as QUANT_KINDS, QuantizedMatrix
+from query_encoder import QueryEncoder, normalize_query
+from ranking import fuse_hybrid, merge_hits, table_hits
+from vector_index import TableIndex, build_table_index
+
 # ========== Configuración ==========
 load_dotenv()
 
@@ -28,128 +53,122 @@ TABLES = [t.strip() for t in os.getenv(
 MODEL_NAME = os.getenv("MODEL_NAME", "intfloat/multilingual-e5-base")
 USE_E5_PREFIX = True  # Para e5, prefijos "query: " / "passage: "
 
+# Carpeta con snapshots .npy exportados por make_embeddings.py (vacío = leer BLOBs de MySQL)
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "")
+
+# Índice aproximado IVF (vacío = solo fuerza bruta)
+ANN_TABLES = [t.strip() for t in os.getenv("ANN_TABLES", "articulos,modificaciones").split(",") if t.strip()]
+ANN_DIR = os.getenv("ANN_DIR", SNAPSHOT_DIR)       # dónde persistir <tabla>.ivf.npz
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))       # 0 = automático (~4*sqrt(n))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))     # listas a sondear por defecto
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "5000"))  # por debajo, fuerza bruta
+
+# two_phase: en memoria solo ids + vectores; texto/título/ruta se leen por id para el top-k.
+# resident: además mantiene en memoria los campos de despliegue de todas las filas.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "two_phase").lower()
+
+# Representación residente: float32 | float16 | int8 | binary (primera etapa + rescoring float32)
+INDEX_DTYPE = os.getenv("INDEX_DTYPE", "float32").lower()
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "10"))  # lista corta = limit * RESCORE_FACTOR
+BINARY_SHORTLIST = int(os.getenv("BINARY_SHORTLIST", "300"))  # mínimo de candidatos tras Hamming
+
+# Fan-out concurrente por tabla (hilos: SCORE_WORKERS en executors.py)
+TABLE_TIMEOUT_S = float(os.getenv("TABLE_TIMEOUT_S", "5.0"))  # por etapa y por tabla
+
+# Filtros de metadatos (bitmaps / fechas ordenadas alineados con la matriz); se cargan con el índice
+FILTERS_ENABLED = os.getenv("FILTERS_ENABLED", "true").lower() == "true"
+
+# Índice léxico BM25 en proceso y modo híbrido (fusión por rango recíproco)
+BM25_DIR = os.getenv("BM25_DIR", SNAPSHOT_DIR)   # dónde persistir <tabla>.bm25.npz
+# Sin carpeta donde persistir, cada worker tokenizaría las cuatro tablas completas al arrancar:
+# por omisión solo se activa si hay BM25_DIR (o SNAPSHOT_DIR)
+BM25_ENABLED = os.getenv("BM25_ENABLED", "true" if BM25_DIR else "false").lower() == "true"
+
+# POST /search/batch: máximo de consultas por petición
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "512"))
+
+# Caché de respuestas completas; se vacía cuando cambia la generación de datos (generation.py)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", "600"))
 
-# ========== Esquema por tabla ==========
-@dataclass
-class TableConf:
-    table: str
-    id_col: str
-    text_col: str
-    embed_cols: List[str]                 # se tomará el primero NO nulo
-    ruta_col: Optional[str] = None
-    id_doc_col: Optional[str] = None
-    title_col: Optional[str] = None
-    date_col: Optional[str] = None
-
-# Ajusta estas configs a tu esquema real
-TABLE_CONFIGS: Dict[str, TableConf] = {
-    # ---- DOCUMENTOS ----
-    "documentos": TableConf(
-        table="documentos",
-        id_col="id_documento",
-        text_col="nombre_regulacion",                 # Texto a mostrar
-        embed_cols=["embedding_completo"],            # Embedding del documento
-        ruta_col="ruta_archivo",
-        title_col="nombre_regulacion",
-        date_col="fecha_publicacion",
-    ),
-    # ---- MODIFICACIONES ----
-    "modificaciones": TableConf(
-        table="modificaciones",
-        id_col="id_modificacion",
-        id_doc_col="id_documento",
-        text_col="texto_modificacion",
-        embed_cols=["embedding_texto_modificacion"],  # Embedding por fragmento
-        ruta_col="ruta_archivo",
-        title_col="nombre_regulacion",
-        date_col="fecha_publicacion",
-    ),
-    # ---- ANEXOS ----
-    # Estructura dada:
-    # id_anexo, id_documento, nombre_anexo, texto_anexo, ruta_archivo,
-    # embedding_completo, embedding_texto
-    "anexos": TableConf(
-        table="anexos",
-        id_col="id_anexo",
-        id_doc_col="id_documento",
-        text_col="texto_anexo",
-        embed_cols=["embedding_texto", "embedding_completo"],  # intenta texto, luego completo
-        ruta_col="ruta_archivo",
-        title_col="nombre_anexo",
-        date_col=None,
-    ),
-    # ---- ARTICULOS ----
-    # id_articulo, id_documento, numero_articulo, texto_articulo, embedding_articulo
-    "articulos": TableConf(
-        table="articulos",
-        id_col="id_articulo",
-        id_doc_col="id_documento",
-        text_col="texto_articulo",
-        embed_cols=["embedding_articulo"],
-        ruta_col=None,
-        title_col="numero_articulo",  # se mostrará como "Título"
-        date_col=None,
-    ),
-}
 
 # ========== App/Modelo ==========
 app = FastAPI(title="Buscador semántico CNBV (multi-tabla)")
 model = SentenceTransformer(MODEL_NAME)
 
+# Handlers async: encode, scoring NumPy y BD (si no hay driver async) corren en ejecutores dedicados
+encode_exec = StageExecutor("encode", ENCODE_WORKERS)
+score_exec = StageExecutor("score", SCORE_WORKERS)
+db_exec = StageExecutor("db", DB_WORKERS)
+
+encoder = QueryEncoder(model, MODEL_NAME, prefix="query: " if USE_E5_PREFIX else "", executor=encode_exec)
+
 class Resultado(BaseModel):
     id: int
     fuente: str                       # nombre de la tabla
     id_documento: Optional[int] = None
     titulo: Optional[str] = None
     texto: str
-    similaridad: float
+    similaridad: float                # coseno (0.0 si la fila no tiene embedding o en modo lexical)
+    score: Optional[float] = None     # RRF global (hybrid) o BM25 / máximo alcanzable en su tabla (lexical)
     ruta_archivo: Optional[str] = None
     fecha_publicacion: Optional[str] = None  # YYYY-MM-DD
 
 class Respuesta(BaseModel):
     results: List[Resultado]
+    partial: bool = False                     # True si alguna tabla falló o excedió el timeout
+    tablas_fallidas: Dict[str, str] = {}      # tabla -> motivo ("timeout" o error)
+    timings: Optional[Dict[str, Any]] = None  # solo con ?timings=true: ms por etapa y por tabla
+
+class BatchQuery(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_QUERIES)
+    limit: int = Field(10, ge=1, le=100)
+    tables: Optional[List[str]] = None        # default: TABLES
+    timings: bool = False
+
+class BatchRespuesta(BaseModel):
+    results: List[List[Resultado]]            # results[i] corresponde a queries[i]
+    partial: bool = False
+    tablas_fallidas: Dict[str, str] = {}
+    timings: Optional[Dict[str, Any]] = None
+
+# Índices residentes por tabla (se reemplazan completos en cada recarga)
+INDEXES: Dict[str, TableIndex] = {}
+BM25_INDEXES: Dict[str, BM25Index] = {}
+
+result_cache = TTLCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL_S)
+_result_cache_gen = read_generation()
+
+
+def cached_results_generation() -> int:
+    """Vacía la caché de resultados si make_embeddings / el extractor escribieron filas nuevas."""
+    global _result_cache_gen
+    gen = read_generation()
+    if gen != _result_cache_gen:
+        result_cache.clear()
+        _result_cache_gen = gen
+    return gen
 
 
 # ========== Utilidades ==========
+DB_CONFIG = dict(host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASS, database=DB_NAME)
+
 def get_conn():
-    return mysql.connect(
-        host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASS, database=DB_NAME
-    )
+    # Conexión del pool compartido; close() la devuelve al pool
+    return get_pool(DB_CONFIG).get_conn()
+
+# Etapas de BD de la API sin bloquear hilos (mysql.connector.aio); None = se usan db_exec + pool síncrono
+aio_pool = get_async_pool(DB_CONFIG)
 
 def blob_to_vec(blob: bytes) -> np.ndarray:
     return np.frombuffer(blob, dtype=np.float32)
 
 def encode_query(q: str) -> np.ndarray:
-    if USE_E5_PREFIX:
-        q = "query: " + q
-    v = model.encode(q, normalize_embeddings=True)  # normaliza q
-    return v.astype(np.float32)
-
-def fetch_rows(conf: TableConf):
-    # Construye SELECT con aliases genéricos
-    base_cols = {
-        conf.id_col: "_id",
-        conf.text_col: "_text",
-    }
-    if conf.ruta_col:    base_cols[conf.ruta_col]  = "_ruta"
-    if conf.id_doc_col:  base_cols[conf.id_doc_col]= "_id_doc"
-    if conf.title_col:   base_cols[conf.title_col] = "_title"
-    if conf.date_col:    base_cols[conf.date_col]  = "_date"
-
-    # Embeddings: alias _emb0, _emb1, ...
-    emb_aliases = []
-    for i, c in enumerate(conf.embed_cols):
-        emb_aliases.append((c, f"_emb{i}"))
-
-    select_parts = [f"{col} AS {alias}" for col, alias in base_cols.items()]
-    select_parts += [f"{col} AS {alias}" for col, alias in emb_aliases]
-
-    sql = f"""
-        SELECT {', '.join(select_parts)}
-        FROM {conf.table}
-        WHERE {conf.text_col} IS NOT NULL
-          AND ({' OR '.join([f'{c} IS NOT NULL' for c in conf.embed_cols])})
-    """
+    # Normalizado y cacheado (LRU + TTL) por texto de consulta y MODEL_NAME
+    return encoder.encode(q)
+
+def fetch_rows(conf: TableConf, with_meta: bool = True, with_embeddings: bool = True):
+    sql = select_sql(conf, with_meta=with_meta, with_embeddings=with_embeddings)
 
     conn = get_conn()
     cur = conn.cursor(dictionary=True)
@@ -160,59 +179,517 @@ def fetch_rows(conf: TableConf):
     conn.close()
 
 
+def fetch_by_ids(conf: TableConf, ids: List[int]) -> Dict[int, dict]:
+    """Fase 2: campos de despliegue solo para los ganadores (un WHERE id IN por tabla)."""
+    if not ids:
+        return {}
+    conn = get_conn()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(select_by_ids_sql(conf, len(ids)), ids)
+        rows = cur.fetchall()
+        cur.close()
+    finally:
+        conn.close()
+    return {int(r["_id"]): r for r in rows}
+
+
+async def fetch_by_ids_async(conf: TableConf, ids: List[int]) -> Dict[int, dict]:
+    if not ids:
+        return {}
+    with timed("fetch", conf.table):
+        if aio_pool is None:
+            return await db_exec.run(fetch_by_ids, conf, ids)
+        rows = await aio_pool.fetch_all(select_by_ids_sql(conf, len(ids)), ids)
+    return {int(r["_id"]): r for r in rows}
+
+
+def fetch_dicts(sql: str) -> List[dict]:
+    conn = get_conn()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(sql)
+        rows = cur.fetchall()
+        cur.close()
+    finally:
+        conn.close()
+    return rows
+
+
+def fetch_vectors_by_ids(conf: TableConf, ids: np.ndarray) -> np.ndarray:
+    """Vectores float32 normalizados para una lista corta de ids (rescoring sin matriz float32 residente)."""
+    id_list = [int(i) for i in ids]
+    if not id_list:
+        return np.zeros((0, 0), dtype=np.float32)
+    with timed("fetch", conf.table):
+        conn = get_conn()
+        try:
+            cur = conn.cursor(dictionary=True)
+            cur.execute(select_by_ids_sql(conf, len(id_list), with_meta=False, with_embeddings=True), id_list)
+            rows = cur.fetchall()
+            cur.close()
+        finally:
+            conn.close()
+    with timed("decode", conf.table):
+        by_id = {}
+        for r in rows:
+            blob = next((r[f"_emb{i}"] for i in range(len(conf.embed_cols)) if r.get(f"_emb{i}")), None)
+            if blob:
+                by_id[int(r["_id"])] = blob_to_vec(blob)
+        dim = max((v.shape[0] for v in by_id.values()), default=0)
+        out = np.zeros((len(id_list), dim), dtype=np.float32)
+        for j, i in enumerate(id_list):
+            v = by_id.get(i)
+            if v is not None and v.shape[0] == dim:
+                out[j] = v / (np.linalg.norm(v) + 1e-12)
+    return out
+
+
+def quantize_index(idx: TableIndex, conf: TableConf, kind: str) -> TableIndex:
+    """Primera etapa sobre float16/int8/binario; el float32 queda en mmap (snapshot) o se pide a BD por id."""
+    q = None
+    if SNAPSHOT_DIR and idx.matrix is not None:
+        q = load_quantized(SNAPSHOT_DIR, idx.table, kind, fingerprint=content_fingerprint(idx.ids, idx.matrix))
+    if q is not None and q[0].shape[0] == idx.size:
+        idx.qmatrix = QuantizedMatrix(kind, *q, dim=idx.dim)
+    else:
+        idx.qmatrix = QuantizedMatrix.from_float32(idx.matrix, kind)
+    if not isinstance(idx.matrix, np.memmap):
+        # Sin snapshot: no se retiene la copia float32 en memoria
+        idx.matrix = None
+        idx.vectors_by_ids = partial(fetch_vectors_by_ids, conf)
+    idx.rescore_factor = RESCORE_FACTOR
+    idx.rescore_min = BINARY_SHORTLIST if kind == "binary" else 0
+    return idx
+
+
+def load_table_index(tname: str, conf: TableConf) -> TableIndex:
+    idx = _load_table_index(tname, conf)
+    if tname in ANN_TABLES and idx.size >= ANN_MIN_ROWS:
+        # Antes de cuantizar: sin snapshot el float32 se descarta y el k-means sobre códigos
+        # decuantizados (p. ej. signos ±1/sqrt(d) en binary) da centroides que pierden recall
+        idx.ann = load_or_build(ANN_DIR, tname, idx.ids, idx.matrix, nlist=ANN_NLIST or None,
+                                source=str(idx.matrix.dtype))
+    if INDEX_DTYPE in QUANT_KINDS and idx.size > 0:
+        quantize_index(idx, conf, INDEX_DTYPE)
+    return idx
+
+
+def _load_table_index(tname: str, conf: TableConf) -> TableIndex:
+    resident = RETRIEVAL_MODE == "resident"
+    # 1) Snapshot memory-mapped (compartido entre workers vía page cache)
+    snap = load_snapshot(SNAPSHOT_DIR, tname) if SNAPSHOT_DIR else None
+    if snap is not None:
+        ids, matrix = snap
+        if not resident:
+            return TableIndex(table=tname, ids=ids, matrix=matrix, meta=None)
+        # Solo metadatos desde MySQL (sin BLOBs), alineados con el orden del snapshot
+        by_id = {int(r["_id"]): r for r in fetch_rows(conf, with_embeddings=False)}
+        meta = [by_id.get(int(i)) for i in ids]
+        alive = np.array([m is not None for m in meta], dtype=bool)
+        return TableIndex(table=tname, ids=ids, matrix=matrix, meta=meta,
+                          alive=None if alive.all() else alive)
+    # 2) Fallback: BLOBs desde MySQL (en two_phase, consulta angosta: solo id + embeddings)
+    return build_table_index(tname, fetch_rows(conf, with_meta=resident), len(conf.embed_cols),
+                             keep_meta=resident)
+
+
+def load_indexes() -> Dict[str, TableIndex]:
+    """Carga cada tabla de TABLES una sola vez en una matriz residente (float32 o cuantizada)."""
+    global INDEXES
+    nuevos: Dict[str, TableIndex] = {}
+    docs = load_doc_attrs() if FILTERS_ENABLED else None
+    for tname in TABLES:
+        conf = TABLE_CONFIGS.get(tname)
+        if not conf:
+            continue
+        try:
+            idx = load_table_index(tname, conf)
+            if docs is not None and idx.size > 0:
+                idx.filters = build_filter_index(idx.ids, fetch_dicts(select_filter_sql(conf)), docs)
+            nuevos[tname] = idx
+            print(f"[INFO] Índice {tname}: {idx.size} filas x {idx.dim} dims")
+        except Exception as e:
+            print(f"[WARN] No se pudo cargar índice {tname}: {e}")
+    INDEXES = nuevos
+    if BM25_ENABLED:
+        load_bm25()
+    return nuevos
+
+
+def load_doc_attrs() -> Optional[Dict[int, dict]]:
+    """id_documento -> tipo/ámbito/emisor/fecha; las demás tablas los heredan por id_documento."""
+    try:
+        return {int(r["_id_doc"]): r for r in fetch_dicts(select_doc_attrs_sql())}
+    except Exception as e:
+        print(f"[WARN] No se pudieron cargar atributos de documentos (filtros desactivados): {e}")
+        return None
+
+
+def load_bm25() -> Dict[str, BM25Index]:
+    """Índice persistido + filas nuevas, editadas y borradas; no se reconstruye en cada arranque."""
+    global BM25_INDEXES
+    if not BM25_DIR:
+        print("[WARN] BM25_ENABLED sin BM25_DIR: el índice léxico se construye completo en cada arranque.")
+    nuevos: Dict[str, BM25Index] = {}
+    for tname in TABLES:
+        conf = TABLE_CONFIGS.get(tname)
+        if not conf:
+            continue
+        try:
+            nuevos[tname] = load_bm25_index(BM25_DIR, tname, conf.id_col, conf.text_col, get_conn)
+        except Exception as e:
+            print(f"[WARN] No se pudo cargar BM25 {tname}: {e}")
+    BM25_INDEXES = nuevos
+    return nuevos
+
+
+@app.on_event("startup")
+def _startup():
+    load_indexes()
+
+
+def resultado_dict(tname: str, row: dict, sim: float, score: Optional[float] = None) -> dict:
+    # Mismos campos que Resultado, sin pasar por pydantic (modo stream)
+    return {
+        "id": int(row["_id"]),
+        "fuente": tname,
+        "id_documento": int(row["_id_doc"]) if row.get("_id_doc") is not None else None,
+        "titulo": str(row["_title"]) if row.get("_title") is not None else None,
+        "texto": row["_text"],
+        "similaridad": sim,
+        "score": score,
+        "ruta_archivo": row.get("_ruta"),
+        "fecha_publicacion": str(row.get("_date")) if row.get("_date") else None,
+    }
+
+
+def to_resultado(tname: str, row: dict, sim: float, score: Optional[float] = None) -> Resultado:
+    return Resultado(**resultado_dict(tname, row, sim, score))
+
+
+def ndjson_line(obj: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj) + b"\n"
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+async def fan_out(tasks: Dict[str, Awaitable], timeout: Optional[float] = None) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Ejecuta una tarea por tabla en paralelo. Devuelve (resultados, fallidas) donde
+    `fallidas` mapea tabla -> "timeout" o el mensaje de error; las tareas lentas no bloquean.
+    """
+    if not tasks:
+        return {}, {}
+    futs = {asyncio.ensure_future(aw): tname for tname, aw in tasks.items()}
+    ok: Dict[str, Any] = {}
+    fallidas: Dict[str, str] = {}
+    try:
+        done, pending = await asyncio.wait(futs, timeout=TABLE_TIMEOUT_S if timeout is None else timeout)
+        for fut in done:
+            tname = futs[fut]
+            exc = fut.exception()
+            if exc is None:
+                ok[tname] = fut.result()
+            elif isinstance(exc, Saturated):
+                raise exc
+            else:
+                fallidas[tname] = f"error: {exc}"
+    finally:
+        # Timeout, 503 por saturación o petición cancelada: nada sigue ocupando BD ni ejecutores
+        for fut in futs:
+            if not fut.done():
+                fut.cancel()
+    for fut in pending:
+        fallidas[futs[fut]] = "timeout"
+    for tname, motivo in fallidas.items():
+        print(f"[WARN] Falló tabla {tname}: {motivo}")
+    return ok, fallidas
+
+
+async def hydrate(indexes: Dict[str, TableIndex], ganadores: List[tuple]) -> Tuple[List[Resultado], Dict[str, str]]:
+    """Convierte hits en Resultado, leyendo de BD solo lo que no está en memoria."""
+    grupos, fallidas = await hydrate_many(indexes, [ganadores])
+    return grupos[0], fallidas
+
+
+async def hydrate_many(indexes: Dict[str, TableIndex], grupos: List[List[tuple]]) -> Tuple[List[List[Resultado]], Dict[str, str]]:
+    """Como hydrate, para varias listas de hits: un solo WHERE id IN por tabla para todas."""
+    def _resident(tname, row):
+        idx = indexes.get(tname)
+        return idx.meta[row] if idx is not None and idx.meta is not None and row >= 0 else None
+
+    todos = [h for ganadores in grupos for h in ganadores]
+    tasks: Dict[str, Awaitable] = {}
+    for tname in {h[1] for h in todos}:
+        ids = list(dict.fromkeys(h[2] for h in todos if h[1] == tname and _resident(tname, h[3]) is None))
+        if ids:
+            tasks[tname] = fetch_by_ids_async(TABLE_CONFIGS[tname], ids)
+    por_tabla, fallidas = await fan_out(tasks)
+
+    salida: List[List[Resultado]] = []
+    with timed("serialize"):
+        for ganadores in grupos:
+            resultados: List[Resultado] = []
+            for _, tname, doc_id, row_pos, sim, score in ganadores:
+                row = _resident(tname, row_pos) or por_tabla.get(tname, {}).get(doc_id)
+                if row is None:  # la fila ya no existe en BD (o su tabla falló al hidratar)
+                    continue
+                resultados.append(to_resultado(tname, row, sim, score))
+            salida.append(resultados)
+    return salida, fallidas
+
+
+def respond(model, respuesta: dict, tiempos: Timings, with_timings: bool) -> JSONResponse:
+    """Serializa aquí (y no en FastAPI) para medir la etapa; `timings` se agrega al final."""
+    with timed("serialize"):
+        body = model(**respuesta).model_dump(mode="json")
+    tiempos.finish()
+    if with_timings:
+        body["timings"] = tiempos.as_dict()
+    return JSONResponse(body)
+
+
+async def stream_hits(indexes: Dict[str, TableIndex], ganadores: List[tuple], fallidas: Dict[str, str],
+                      cache_key: Optional[tuple], tiempos: Timings, with_timings: bool):
+    """
+    NDJSON en orden de rango: una línea por resultado en cuanto su fila está disponible (los
+    residentes salen de inmediato; cada tabla se lee una sola vez por id) y al final una línea
+    {"partial", "tablas_fallidas", "total"}.
+    """
+    def _resident(tname, row):
+        idx = indexes.get(tname)
+        return idx.meta[row] if idx is not None and idx.meta is not None and row >= 0 else None
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + TABLE_TIMEOUT_S
+    pendientes: Dict[str, asyncio.Future] = {}
+    for tname in {h[1] for h in ganadores}:
+        ids = list(dict.fromkeys(h[2] for h in ganadores if h[1] == tname and _resident(tname, h[3]) is None))
+        if ids:
+            pendientes[tname] = asyncio.ensure_future(fetch_by_ids_async(TABLE_CONFIGS[tname], ids))
+
+    fallidas = dict(fallidas)
+    por_tabla: Dict[str, Dict[int, dict]] = {}
+    enviados: List[dict] = []
+    try:
+        for _, tname, doc_id, row_pos, sim, score in ganadores:
+            row = _resident(tname, row_pos)
+            if row is None and tname in pendientes and tname not in fallidas:
+                if tname not in por_tabla:
+                    try:
+                        por_tabla[tname] = await asyncio.wait_for(pendientes[tname], max(0.0, deadline - loop.time()))
+                    except asyncio.TimeoutError:
+                        fallidas[tname] = "timeout"
+                    except Exception as e:
+                        fallidas[tname] = f"error: {e}"
+                row = por_tabla.get(tname, {}).get(doc_id)
+            if row is None:
+                continue
+            with timed("serialize"):
+                d = resultado_dict(tname, row, sim, score)
+                line = ndjson_line(d)
+            enviados.append(d)
+            yield line
+    finally:
+        for fut in pendientes.values():
+            fut.cancel()
+    for tname, motivo in fallidas.items():
+        print(f"[WARN] Falló tabla {tname}: {motivo}")
+    tiempos.finish()
+    fin = {"partial": bool(fallidas), "tablas_fallidas": fallidas, "total": len(enviados)}
+    if with_timings:
+        fin["timings"] = tiempos.as_dict()
+    yield ndjson_line(fin)
+    if cache_key is not None and not fallidas:
+        result_cache.put(cache_key, {"results": [Resultado(**d) for d in enviados], "partial": False,
+                                     "tablas_fallidas": {}})
+
+
+async def stream_cached(respuesta: dict, tiempos: Timings, with_timings: bool):
+    for r in respuesta["results"]:
+        with timed("serialize"):
+            line = ndjson_line(r.model_dump())
+        yield line
+    tiempos.finish()
+    fin = {"partial": respuesta["partial"], "tablas_fallidas": respuesta["tablas_fallidas"],
+           "total": len(respuesta["results"])}
+    if with_timings:
+        fin["timings"] = tiempos.as_dict()
+    yield ndjson_line(fin)
+
+
+def _csv(s: Optional[str]) -> Tuple[str, ...]:
+    return tuple(v.strip() for v in s.split(",") if v.strip()) if s else ()
+
+
+def parse_filtros(tipo_de_ordenamiento: Optional[str], ambito_aplicacion: Optional[str], emisor: Optional[str],
+                  fecha_desde: Optional[date], fecha_hasta: Optional[date], id_documento: Optional[str]) -> Filtros:
+    try:
+        ids_doc = tuple(sorted({int(v) for v in _csv(id_documento)}))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="id_documento debe ser una lista de enteros separados por comas")
+    return Filtros(
+        tipo_de_ordenamiento=tuple(sorted(_csv(tipo_de_ordenamiento))),
+        ambito_aplicacion=tuple(sorted(_csv(ambito_aplicacion))),
+        emisor=tuple(sorted(_csv(emisor))),
+        id_documento=ids_doc,
+        fecha_desde=fecha_desde,
+        fecha_hasta=fecha_hasta,
+    )
+
+
+NDJSON = "application/x-ndjson"
+
+
 # ========== Endpoint ==========
+@app.exception_handler(Saturated)
+async def _saturated(request: Request, exc: Saturated):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+
 @app.get("/search", response_model=Respuesta)
-def search(
+async def search(
     query: str = Query(..., min_length=1),
     limit: int = Query(10, ge=1, le=100),
-    tables: Optional[str] = Query(None, description="Lista separada por comas para filtrar tablas")
+    tables: Optional[str] = Query(None, description="Lista separada por comas para filtrar tablas"),
+    nprobe: Optional[int] = Query(None, ge=1, description="Listas IVF a sondear (más = mejor recall, más latencia)"),
+    exact: bool = Query(False, description="Ignora el índice aproximado y usa fuerza bruta"),
+    mode: str = Query("semantic", pattern="^(semantic|lexical|hybrid)$",
+                      description="semantic (coseno), lexical (BM25) o hybrid (RRF de ambos)"),
+    tipo_de_ordenamiento: Optional[str] = Query(None, description="Valores separados por comas (Ley, Circular, ...)"),
+    ambito_aplicacion: Optional[str] = Query(None, description="Federal, Estatal, Municipal (separados por comas)"),
+    emisor: Optional[str] = Query(None, description="Emisores separados por comas"),
+    fecha_desde: Optional[date] = Query(None, description="fecha_publicacion >= (YYYY-MM-DD)"),
+    fecha_hasta: Optional[date] = Query(None, description="fecha_publicacion <= (YYYY-MM-DD)"),
+    id_documento: Optional[str] = Query(None, description="Ids de documento separados por comas"),
+    stream: bool = Query(False, description="NDJSON: un resultado por línea en orden de rango, y un resumen al final"),
+    timings: bool = Query(False, description="Incluye ms por etapa (encode, fetch, score, topk, ...) y por tabla"),
 ):
-    q_vec = encode_query(query)
+    tiempos = start_request("main", "search")
+    probe = None if exact else (nprobe or ANN_NPROBE)
+    filtros = parse_filtros(tipo_de_ordenamiento, ambito_aplicacion, emisor, fecha_desde, fecha_hasta, id_documento)
 
     # Determina qué tablas usar
     tables_to_use = [t.strip() for t in (tables.split(",") if tables else TABLES)]
     # Filtra por las que tengan config
     tables_to_use = [t for t in tables_to_use if t in TABLE_CONFIGS]
 
-    resultados: List[Resultado] = []
+    # Consultas populares: sin codificar ni puntuar
+    gen = cached_results_generation()
+    cache_key = (gen, normalize_query(query), tuple(tables_to_use), limit, probe, mode, filtros)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        if stream:
+            return StreamingResponse(stream_cached(cached, tiempos, timings), media_type=NDJSON)
+        return respond(Respuesta, cached, tiempos, timings)
+
+    if mode != "semantic" and not BM25_INDEXES:
+        mode = "semantic"  # sin índice léxico cargado
+    q_vec = None
+    if mode != "lexical":
+        with timed("encode"):
+            q_vec = await encoder.encode_async(query)
 
+    indexes, lexicos = INDEXES, BM25_INDEXES
+    tasks = {}
     for tname in tables_to_use:
-        conf = TABLE_CONFIGS[tname]
-        try:
-            for row in fetch_rows(conf):
-                # Toma el primer embedding disponible
-                emb_blob = None
-                for i in range(len(conf.embed_cols)):
-                    emb_blob = row.get(f"_emb{i}")
-                    if emb_blob:
-                        break
-                if not emb_blob:
-                    continue
+        idx, bm25 = indexes.get(tname), lexicos.get(tname)
+        if mode == "semantic" and (idx is None or idx.size == 0):
+            continue
+        if mode == "lexical" and bm25 is None:
+            continue
+        if mode == "hybrid" and bm25 is None and (idx is None or idx.size == 0):
+            continue
+        tasks[tname] = score_exec.run(table_hits, tname, idx, bm25, q_vec, query, limit, probe, mode, filtros)
+    # Top-k por tabla en paralelo (argpartition); latencia ~ la tabla más lenta
+    por_tabla, fallidas = await fan_out(tasks)
+    per_table = list(por_tabla.values())
 
-                v = blob_to_vec(emb_blob)
-                denom = np.linalg.norm(v) + 1e-12  # por si no están normalizados en BD
-                sim = float(np.dot(q_vec, v) / denom)
-
-                resultados.append(
-                    Resultado(
-                        id=row["_id"],
-                        fuente=tname,
-                        id_documento=row.get("_id_doc"),
-                        titulo=row.get("_title"),
-                        texto=row["_text"],
-                        similaridad=sim,
-                        ruta_archivo=row.get("_ruta"),
-                        fecha_publicacion=str(row.get("_date")) if row.get("_date") else None,
-                    )
-                )
-        except Exception as e:
-            # No detenga toda la búsqueda si una tabla falla
-            print(f"[WARN] Falló tabla {tname}: {e}")
+    # Mezcla global con heap y solo entonces se materializan los ganadores
+    with timed("merge"):
+        if mode == "hybrid":
+            ganadores = fuse_hybrid(per_table, limit)
+        else:
+            ganadores = merge_hits(per_table, limit)
+    if stream:
+        # El top-k ya es definitivo: se empieza a enviar mientras se hidrata
+        return StreamingResponse(stream_hits(indexes, ganadores, fallidas, None if fallidas else cache_key,
+                                             tiempos, timings), media_type=NDJSON)
+    resultados, fallidas_hidratar = await hydrate(indexes, ganadores)
+    fallidas.update(fallidas_hidratar)
+    respuesta = {"results": resultados, "partial": bool(fallidas), "tablas_fallidas": fallidas}
+    if not fallidas:  # nunca cachear resultados parciales
+        result_cache.put(cache_key, respuesta)
+    return respond(Respuesta, respuesta, tiempos, timings)
 
-    # Orden global y top-k
-    resultados.sort(key=lambda r: r.similaridad, reverse=True)
-    return {"results": resultados[:limit]}
+@app.post("/search/batch", response_model=BatchRespuesta)
+async def search_batch(body: BatchQuery):
+    """
+    Muchas consultas en una petición: un solo model.encode y, por tabla, un producto
+    matriz-matriz (bloques de filas x consultas) con top-k por consulta. Solo modo semántico.
+    """
+    if any(not q.strip() for q in body.queries):
+        raise HTTPException(status_code=422, detail="Las consultas no pueden estar vacías")
+    tiempos = start_request("main", "search_batch")
+    tables_to_use = [t.strip() for t in (body.tables or TABLES)]
+    tables_to_use = [t for t in tables_to_use if t in TABLE_CONFIGS]
+
+    with timed("encode"):
+        Q = await encode_exec.run(encoder.encode_batch, body.queries)
+    indexes = INDEXES
+    tasks = {
+        tname: score_exec.run(indexes[tname].search_topk_batch, Q, body.limit)
+        for tname in tables_to_use
+        if tname in indexes and indexes[tname].size > 0
+    }
+    # Una matriz de puntajes por tabla: el timeout escala con el tamaño del lote
+    por_tabla, fallidas = await fan_out(tasks, timeout=TABLE_TIMEOUT_S * max(1.0, len(body.queries) / 32.0))
+
+    grupos: List[List[tuple]] = []
+    for j in range(len(body.queries)):
+        per_table = []
+        for tname, res in por_tabla.items():
+            idx, (rows, sims) = indexes[tname], res[j]
+            per_table.append([(s, tname, int(idx.ids[r]), r, s, None) for r, s in zip(rows.tolist(), sims.tolist())])
+        with timed("merge"):
+            grupos.append(merge_hits(per_table, body.limit))
+
+    resultados, fallidas_hidratar = await hydrate_many(indexes, grupos)
+    fallidas.update(fallidas_hidratar)
+    return respond(BatchRespuesta, {"results": resultados, "partial": bool(fallidas), "tablas_fallidas": fallidas},
+                   tiempos, body.timings)
+
+@app.get("/metrics")
+def metrics():
+    """Histogramas por etapa / petición y colas de los ejecutores, en formato de texto de Prometheus."""
+    for e in (encode_exec, score_exec, db_exec):
+        st = e.stats()
+        EXECUTOR_QUEUED.set(st["queued"], "main", e.name)
+        EXECUTOR_RUNNING.set(st["running"], "main", e.name)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.post("/reload")
+def reload_indexes():
+    indexes = load_indexes()
+    result_cache.clear()
+    return {"status": "ok", "indexes": {t: idx.size for t, idx in indexes.items()}}
 
 @app.get("/")
 def root():
-    return {"status": "ok", "tables": TABLES, "model": MODEL_NAME}
+    return {
+        "status": "ok",
+        "tables": TABLES,
+        "model": MODEL_NAME,
+        "indexes": {t: idx.size for t, idx in INDEXES.items()},
+        "ann": {t: idx.ann.nlist for t, idx in INDEXES.items() if idx.ann is not None},
+        "index_dtype": INDEX_DTYPE,
+        "bm25": {t: b.n_docs for t, b in BM25_INDEXES.items()},
+        "filters_bytes": {t: idx.filters.nbytes for t, idx in INDEXES.items() if idx.filters is not None},
+        "db_backend": DB_BACKEND,
+        "db_pool": get_pool(DB_CONFIG).stats(),
+        "db_async": aio_pool.stats() if aio_pool is not None else None,
+        "executors": {e.name: e.stats() for e in (encode_exec, score_exec, db_exec)},
+        "query_encoder": encoder.stats(),
+        "result_cache": {**result_cache.stats(), "generation": _result_cache_gen},
+    }
@@ -3,20 +3,32 @@ import sys
 import math
 import time
 import argparse
+import queue
+import threading
 import numpy as np
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Tuple
 
-import mysql.connector as mysql
 from dotenv import load_dotenv
 from sentence_transformers import SentenceTransformer
 
+from db_pool import DB_BACKEND, get_pool
+from generation import bump_generation
+from table_config import TABLE_CONFIGS, select_sql
+from quantization import KINDS as QUANT_KINDS, QuantizedMatrix
+from snapshot import content_fingerprint, write_snapshot, write_quantized
+from vector_index import build_table_index
+
 # =======================
 # CONFIGURACIÓN GENERAL
 # =======================
 CONFIG = {
     "MODEL_NAME": "intfloat/multilingual-e5-base",  # Alternativa: "BAAI/bge-m3"
     "DB_BATCH": 200,        # cuántas filas pedimos por lote desde MySQL
-    "ENC_BATCH": 32,        # tamaño de batch para model.encode
+    "ENC_BATCH": 32,        # batch inicial de model.encode para chunks de longitud máxima (presupuesto de tokens)
+    "ENC_BATCH_MAX": 512,   # tope de chunks por batch cuando son cortos (títulos, emisores)
+    "ENC_WINDOW": int(os.getenv("EMBED_WINDOW", "2048")),  # chunks que se ordenan por longitud juntos
+    "ENC_AUTOTUNE": os.getenv("EMBED_AUTOTUNE", "true").lower() == "true",  # ajusta el presupuesto por tokens/s
     "MAX_CHARS": 20000,     # recorte duro por texto antes de embed
     "ONLY_NULLS": True,     # solo filas cuyo embedding destino sea NULL
     "NORMALIZE": True,      # normalizar embeddings (recomendado)
@@ -24,6 +36,8 @@ CONFIG = {
     "PDF_MAX_PAGES": 200,   # límite de páginas a leer por PDF
     "CHUNK_CHARS": 3000,    # tamaño de chunk si el texto es largo
     "CHUNK_OVERLAP": 300,   # solape entre chunks
+    "PDF_WORKERS": int(os.getenv("EMBED_PDF_WORKERS", "4")),  # hilos que extraen PDFs / arman textos
+    "QUEUE_DEPTH": int(os.getenv("EMBED_QUEUE_DEPTH", "4")),  # lotes en vuelo entre cada par de etapas
 }
 
 # Carga condicional de PyMuPDF
@@ -40,6 +54,8 @@ if CONFIG["USE_PYMUPDF"]:
 # =======================
 def connect_db():
     load_dotenv()
+    if DB_BACKEND == "sqlite":
+        return get_pool().get_conn()  # DB_SQLITE_PATH; no hay credenciales que validar
 
     # Nombres estándar; con fallbacks a tus nombres previos
     host = os.getenv("DB_HOST", "localhost")
@@ -66,7 +82,7 @@ def connect_db():
         print("DB_NAME=buscador_normativo")
         sys.exit(1)
 
-    return mysql.connect(**cfg)
+    return get_pool(cfg).get_conn()
 
 
 # =======================
@@ -118,6 +134,110 @@ def encode_texts(model: SentenceTransformer, texts: List[str], normalize=True, e
         emb = emb.astype(np.float32)
     return emb
 
+# =======================
+# BATCHES POR LONGITUD
+# =======================
+def token_lengths(model: SentenceTransformer, texts: List[str]) -> np.ndarray:
+    """Tokens por texto tras truncar a max_seq_length (lo que de verdad entra al transformer)."""
+    max_len = getattr(model, "max_seq_length", None) or 512
+    tok = getattr(model, "tokenizer", None)
+    if tok is None:
+        return np.array([min(len(t) // 4 + 2, max_len) for t in texts], dtype=np.int64)  # ~4 caracteres por token
+    ids = tok(texts, add_special_tokens=True, truncation=True, max_length=max_len)["input_ids"]
+    return np.array([len(x) for x in ids], dtype=np.int64)
+
+
+class BatchTuner:
+    """
+    Presupuesto de tokens por batch de model.encode (chunks x longitud del más largo, con relleno).
+    Empieza en ENC_BATCH chunks de longitud máxima y, con ENC_AUTOTUNE, se ajusta por ventana según
+    los tokens/s medidos: mientras mejoran sigue en la misma dirección (x1.25); si empeoran vuelve al
+    mejor presupuesto y prueba la contraria; tras dos cambios de dirección se queda en el mejor.
+    """
+
+    STEP = 1.25
+
+    def __init__(self, budget: int, lo: int, hi: int, enabled: bool = True):
+        self.budget = budget
+        self.lo, self.hi = lo, hi
+        self.enabled = enabled
+        self.best_budget, self.best_rate = budget, 0.0
+        self.direction, self.flips = 1, 0
+        self.tokens = self.padded = 0
+        self.seconds = 0.0
+
+    def batches(self, lengths: np.ndarray) -> List[np.ndarray]:
+        """Índices ordenados del más largo al más corto, agrupados para no pasar del presupuesto."""
+        order = np.argsort(-lengths, kind="stable")
+        out, i = [], 0
+        while i < len(order):
+            longest = max(int(lengths[order[i]]), 1)
+            n = max(1, min(CONFIG["ENC_BATCH_MAX"], self.budget // longest))
+            out.append(order[i:i + n])
+            i += n
+        return out
+
+    def record(self, tokens: int, padded: int, seconds: float):
+        self.tokens += tokens
+        self.padded += padded
+        self.seconds += seconds
+        if not self.enabled or seconds <= 0:
+            return
+        rate = tokens / seconds
+        if rate > self.best_rate * 1.02:
+            self.best_budget, self.best_rate = self.budget, rate
+        elif self.budget == self.best_budget:
+            self.best_rate = 0.5 * (self.best_rate + rate)  # misma config: sigue la deriva sin moverse
+        else:
+            self.budget = self.best_budget
+            self.direction = -self.direction
+            self.flips += 1
+            return
+        if self.flips < 2:
+            self.budget = int(min(self.hi, max(self.lo, self.budget * self.STEP ** self.direction)))
+
+    def summary(self) -> str:
+        rate = self.tokens / self.seconds if self.seconds > 0 else 0.0
+        useful = self.tokens / self.padded if self.padded else 1.0
+        return (f"{rate:.0f} tokens/s, {useful:.0%} tokens útiles (resto relleno), "
+                f"presupuesto {self.budget} tokens/batch")
+
+
+_tuner = None
+
+
+def batch_tuner(model: SentenceTransformer) -> BatchTuner:
+    """Un ajustador por corrida: lo aprendido con un campo sirve para los siguientes (mismo modelo)."""
+    global _tuner
+    if _tuner is None:
+        max_len = getattr(model, "max_seq_length", None) or 512
+        budget = CONFIG["ENC_BATCH"] * max_len
+        # Tope de 8x el inicial: la memoria de activaciones crece con el presupuesto
+        _tuner = BatchTuner(budget, lo=max_len, hi=8 * budget, enabled=CONFIG["ENC_AUTOTUNE"])
+    return _tuner
+
+
+def encode_bucketed(model: SentenceTransformer, texts: List[str], tuner: BatchTuner, normalize=True) -> np.ndarray:
+    """
+    Codifica `texts` en batches de longitud parecida (del más largo al más corto) y devuelve los
+    embeddings en el orden original: títulos cortos no se rellenan hasta el largo de un chunk de 3000.
+    """
+    if not texts:
+        return np.zeros((0, 384), dtype=np.float32)
+    lengths = token_lengths(model, texts)
+    out = None
+    padded = 0
+    t0 = time.perf_counter()
+    for idx in tuner.batches(lengths):
+        emb = encode_texts(model, [texts[i] for i in idx], normalize=normalize, enc_batch=len(idx))
+        if out is None:
+            out = np.empty((len(texts), emb.shape[1]), dtype=np.float32)
+        out[idx] = emb
+        padded += len(idx) * int(lengths[idx[0]])
+    tuner.record(int(lengths.sum()), padded, time.perf_counter() - t0)
+    return out
+
+
 def extract_pdf_text(path: str, max_pages: int = 200) -> str:
     if not CONFIG["USE_PYMUPDF"] or not path:
         return ""
@@ -142,13 +262,32 @@ def count_rows(conn, table: str, where: str) -> int:
     cur.close()
     return n
 
-def fetch_ids(conn, table: str, id_field: str, where: str, limit: int, offset: int) -> List[int]:
-    cur = conn.cursor()
-    q = f"SELECT `{id_field}` FROM `{table}` {where} ORDER BY `{id_field}` ASC LIMIT %s OFFSET %s"
-    cur.execute(q, (limit, offset))
-    rows = [r[0] for r in cur.fetchall()]
-    cur.close()
-    return rows
+def iter_keyset(conn, table: str, id_field: str, cols: List[str], where: str = "",
+                batch: int = 200) -> Iterator[List[tuple]]:
+    """
+    Lotes de filas (id, *cols) en orden de id: `<where> AND id > último ORDER BY id LIMIT n`.
+    Cada lote cuesta lo mismo sin importar cuánto se haya avanzado (a diferencia de OFFSET), y
+    como no depende de posiciones, llenar los NULL del predicado no hace que se salten filas.
+    """
+    cond = where[len("WHERE "):] if where.startswith("WHERE ") else where
+    select = ", ".join(f"`{c}`" for c in [id_field, *cols])
+    last_id = None
+    while True:
+        parts, params = ([f"({cond})"] if cond.strip() else []), []
+        if last_id is not None:
+            parts.append(f"`{id_field}` > %s")
+            params.append(last_id)
+        sql = (f"SELECT {select} FROM `{table}` "
+               + ("WHERE " + " AND ".join(parts) + " " if parts else "")
+               + f"ORDER BY `{id_field}` ASC LIMIT %s")
+        cur = conn.cursor()
+        cur.execute(sql, (*params, batch))
+        rows = cur.fetchall()
+        cur.close()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
 
 def update_blob(conn, table: str, id_field: str, target_field: str, pairs: List[Tuple[int, np.ndarray]]):
     if not pairs:
@@ -158,6 +297,7 @@ def update_blob(conn, table: str, id_field: str, target_field: str, pairs: List[
     cur.executemany(q, [(as_bytes_float32(v), _id) for _id, v in pairs])
     conn.commit()
     cur.close()
+    bump_generation()  # invalida cachés de resultados de la API
 
 def build_where(only_nulls: bool, target_field: str, extra: str = "") -> str:
     parts = []
@@ -171,230 +311,275 @@ def build_where(only_nulls: bool, target_field: str, extra: str = "") -> str:
 # =======================
 # PIPELINES POR TABLA
 # =======================
-def process_documentos(model: SentenceTransformer, conn, args):
-    """
-    Embeddings por campo en `documentos`:
-      nombre_regulacion -> embedding_nombre
-      ambito_aplicacion -> embedding_ambito
-      tipo_de_ordenamiento -> embedding_tipo
-      emisor -> embedding_emisor
-      embedding_completo (opcional): desde PDF (ruta_archivo) o concatenando campos si no hay PDF
-    """
-    table = "documentos"
-    idf = "id_documento"
-
-    tasks = [
-        ("nombre_regulacion", "embedding_nombre", "nombre_regulacion"),
-        ("ambito_aplicacion", "embedding_ambito", "ambito_aplicacion"),
-        ("tipo_de_ordenamiento", "embedding_tipo", "tipo_de_ordenamiento"),
-        ("emisor", "embedding_emisor", "emisor"),
-    ]
-
-    for src, dst, _ in tasks:
-        where = build_where(CONFIG["ONLY_NULLS"], dst)
-        total = count_rows(conn, table, where)
-        if total == 0:
-            print(f"[documentos] {dst}: nada por hacer.")
-            continue
+def _clean(txt) -> str:
+    return "" if txt is None else str(txt).strip()
 
-        print(f"[documentos] {dst}: {total} filas a procesar.")
-        processed = 0
-        batches = math.ceil(total / CONFIG["DB_BATCH"])
-        for b in range(batches):
-            ids = fetch_ids(conn, table, idf, where, CONFIG["DB_BATCH"], b * CONFIG["DB_BATCH"])
-            if not ids:
-                break
+def pdf_or_concat(ruta, *parts) -> str:
+    """Texto del PDF en `ruta` si se puede extraer; si no, los campos no vacíos unidos por ' | '."""
+    text = ""
+    if CONFIG["USE_PYMUPDF"] and ruta and str(ruta).strip():
+        text = extract_pdf_text(str(ruta).strip(), CONFIG["PDF_MAX_PAGES"])
+    if not text:
+        text = " | ".join([str(p) for p in parts if p]) or ""
+    return text
 
-            placeholders = ",".join(["%s"] * len(ids))
-            cur = conn.cursor()
-            cur.execute(
-                f"SELECT `{idf}`, `{src}` FROM `{table}` WHERE `{idf}` IN ({placeholders})",
-                ids
-            )
-            rows = cur.fetchall()
-            cur.close()
-
-            # Construir lista plana de textos (con chunking)
-            flat_texts, map_rows = [], []
-            for _id, txt in rows:
-                s = "" if txt is None else str(txt).strip()
-                chunks = chunk_text(s, CONFIG["MAX_CHARS"], CONFIG["CHUNK_CHARS"], CONFIG["CHUNK_OVERLAP"])
-                if not chunks:
-                    continue
-                for ch in chunks:
-                    flat_texts.append(preprocess_for_e5(ch))
-                    map_rows.append((_id, True))
+class StageStats:
+    """Filas, tiempo ocupado y tiempo esperando la cola de entrada/salida de una etapa del pipeline."""
 
-            if not flat_texts:
-                print(f"[documentos] {dst}: lote {b+1}/{batches} vacío.")
-                continue
+    def __init__(self, name: str):
+        self.name = name
+        self.batches = 0
+        self.rows = 0
+        self.busy = 0.0
+        self.wait_in = 0.0
+        self.wait_out = 0.0
 
-            t0 = time.time()
-            emb = encode_texts(model, flat_texts, normalize=CONFIG["NORMALIZE"], enc_batch=CONFIG["ENC_BATCH"])
-            took = time.time() - t0
+    def summary(self, wall: float) -> str:
+        rate = self.rows / self.busy if self.busy > 0 else 0.0
+        return (f"{self.name:<8} {self.rows:>8} filas {rate:>9.0f} filas/s ocupado {self.busy / max(wall, 1e-9):>4.0%}"
+                f" | espera entrada {self.wait_in:.2f}s, salida {self.wait_out:.2f}s")
 
-            by_id = {}
-            for (row_id, _), vec in zip(map_rows, emb):
-                by_id.setdefault(row_id, []).append(vec)
-            pairs = [(row_id, mean_pool(vecs)) for row_id, vecs in by_id.items()]
 
-            update_blob(conn, table, idf, dst, pairs)
-            processed += len(pairs)
-            print(f"[OK documentos] {dst} lote {b+1}/{batches}: {len(pairs)} filas en {took:.2f}s | {processed}/{total}")
+class _Stopped(Exception):
+    """Otra etapa falló: las demás dejan de esperar y salen."""
 
-    # Opcional: embedding_completo desde PDF o concatenación
-    dst = "embedding_completo"
-    where = build_where(CONFIG["ONLY_NULLS"], dst)
-    total = count_rows(conn, table, where)
-    if total > 0:
-        print(f"[documentos] {dst}: {total} filas a procesar (PDF o concat).")
-        batches = math.ceil(total / CONFIG["DB_BATCH"])
-        for b in range(batches):
-            ids = fetch_ids(conn, table, idf, where, CONFIG["DB_BATCH"], b * CONFIG["DB_BATCH"])
-            if not ids:
-                break
-            placeholders = ",".join(["%s"] * len(ids))
-            cur = conn.cursor()
-            cur.execute(
-                f"""SELECT `{idf}`, `ruta_archivo`, `nombre_regulacion`, `ambito_aplicacion`,
-                           `tipo_de_ordenamiento`, `emisor`
-                    FROM `{table}` WHERE `{idf}` IN ({placeholders})""",
-                ids
-            )
-            rows = cur.fetchall()
-            cur.close()
-
-            flat_texts, map_rows = [], []
-            for _id, ruta, nombre, ambito, tipo, emisor in rows:
-                text = ""
-                if CONFIG["USE_PYMUPDF"] and ruta and str(ruta).strip():
-                    text = extract_pdf_text(str(ruta).strip(), CONFIG["PDF_MAX_PAGES"])
-                if not text:
-                    parts = [nombre, ambito, tipo, emisor]
-                    text = " | ".join([p for p in parts if p]) or ""
-                chunks = chunk_text(text, CONFIG["MAX_CHARS"], CONFIG["CHUNK_CHARS"], CONFIG["CHUNK_OVERLAP"])
-                if not chunks:
-                    continue
-                for ch in chunks:
-                    flat_texts.append(preprocess_for_e5(ch))
-                    map_rows.append((_id, True))
 
-            if not flat_texts:
-                print(f"[documentos] {dst}: lote {b+1}/{batches} sin textos.")
-                continue
+_DONE = object()  # fin del flujo; cada etapa lo reenvía a la siguiente
 
-            t0 = time.time()
-            emb = encode_texts(model, flat_texts, normalize=CONFIG["NORMALIZE"], enc_batch=CONFIG["ENC_BATCH"])
-            took = time.time() - t0
 
-            by_id = {}
-            for (row_id, _), vec in zip(map_rows, emb):
-                by_id.setdefault(row_id, []).append(vec)
-            pairs = [(rid, mean_pool(vs)) for rid, vs in by_id.items()]
-            update_blob(conn, table, idf, dst, pairs)
-            print(f"[OK documentos] {dst} lote {b+1}/{batches}: {len(pairs)} filas en {took:.2f}s.")
+class Pipeline:
+    """
+    Etapas en hilos unidas por colas acotadas (QUEUE_DEPTH lotes): mientras el modelo codifica un lote,
+    el lector ya trae el siguiente, los PDFs del siguiente se extraen y el escritor guarda el anterior.
+    Las colas llenas frenan a las etapas rápidas, así que la memoria queda acotada.
+    """
 
+    def __init__(self, depth: int):
+        self.depth = depth
+        self.stop = threading.Event()
+        self.errors: List[BaseException] = []
+        self.threads: List[threading.Thread] = []
 
-def process_articulos(model: SentenceTransformer, conn, args):
+    def queue(self) -> "queue.Queue":
+        return queue.Queue(maxsize=self.depth)
+
+    def get(self, q: "queue.Queue", st: StageStats):
+        t0 = time.perf_counter()
+        try:
+            while True:
+                try:
+                    return q.get(timeout=0.2)
+                except queue.Empty:
+                    if self.stop.is_set():
+                        raise _Stopped()
+        finally:
+            st.wait_in += time.perf_counter() - t0
+
+    def put(self, q: "queue.Queue", item, st: StageStats):
+        t0 = time.perf_counter()
+        try:
+            while True:
+                try:
+                    q.put(item, timeout=0.2)
+                    return
+                except queue.Full:
+                    if self.stop.is_set():
+                        raise _Stopped()
+        finally:
+            st.wait_out += time.perf_counter() - t0
+
+    def spawn(self, name: str, fn: Callable[[], None]):
+        def run():
+            try:
+                fn()
+            except _Stopped:
+                pass
+            except BaseException as e:
+                self.fail(e)
+        th = threading.Thread(target=run, name=f"embed-{name}", daemon=True)
+        th.start()
+        self.threads.append(th)
+
+    def fail(self, e: BaseException):
+        self.errors.append(e)
+        self.stop.set()
+
+    def join(self):
+        for th in self.threads:
+            th.join()
+        if self.errors:
+            raise self.errors[0]
+
+
+def embed_field(model: SentenceTransformer, conn, table: str, idf: str, dst: str,
+                cols: List[str], to_text: Callable[..., str]):
     """
-    articulos.texto_articulo -> articulos.embedding_articulo
+    Llena `dst` para las filas pendientes de `table`: lee (id, *cols) por keyset, arma el texto con
+    to_text(*cols), lo parte en chunks, codifica y guarda el promedio de los chunks por fila.
+
+    Cuatro etapas en paralelo: lector (conn) -> preparación (pool de PDF_WORKERS hilos para to_text y
+    chunking) -> codificador (este hilo) -> escritor (conexión propia). Con colas acotadas el tiempo
+    total lo fija la etapa más lenta, normalmente el modelo, y no la suma de las cuatro.
     """
-    table, idf, src, dst = "articulos", "id_articulo", "texto_articulo", "embedding_articulo"
     where = build_where(CONFIG["ONLY_NULLS"], dst)
     total = count_rows(conn, table, where)
     if total == 0:
-        print("[articulos] nada por hacer.")
+        print(f"[{table}] {dst}: nada por hacer.")
         return
 
-    print(f"[articulos] {total} filas a procesar.")
-    processed = 0
     batches = math.ceil(total / CONFIG["DB_BATCH"])
-    for b in range(batches):
-        ids = fetch_ids(conn, table, idf, where, CONFIG["DB_BATCH"], b * CONFIG["DB_BATCH"])
-        if not ids:
-            break
-        placeholders = ",".join(["%s"] * len(ids))
-        cur = conn.cursor()
-        cur.execute(f"SELECT `{idf}`, `{src}` FROM `{table}` WHERE `{idf}` IN ({placeholders})", ids)
-        rows = cur.fetchall()
-        cur.close()
-
-        flat_texts, map_rows = [], []
-        for _id, txt in rows:
-            s = "" if txt is None else str(txt)
-            chunks = chunk_text(s, CONFIG["MAX_CHARS"], CONFIG["CHUNK_CHARS"], CONFIG["CHUNK_OVERLAP"])
-            if not chunks:
-                continue
-            for ch in chunks:
-                flat_texts.append(preprocess_for_e5(ch))
-                map_rows.append((_id, True))
-
-        if not flat_texts:
-            print(f"[articulos] lote {b+1}/{batches} vacío.")
-            continue
-
-        t0 = time.time()
-        emb = encode_texts(model, flat_texts, normalize=CONFIG["NORMALIZE"], enc_batch=CONFIG["ENC_BATCH"])
-        took = time.time() - t0
-
+    print(f"[{table}] {dst}: {total} filas a procesar en {batches} lotes.")
+    pipe = Pipeline(CONFIG["QUEUE_DEPTH"])
+    q_rows, q_texts, q_pairs = pipe.queue(), pipe.queue(), pipe.queue()
+    st_read, st_prep, st_enc, st_write = (StageStats(n) for n in ("lector", "prep", "encoder", "escritor"))
+
+    def reader():
+        it = iter_keyset(conn, table, idf, cols, where, CONFIG["DB_BATCH"])
+        while True:
+            t0 = time.perf_counter()
+            rows = next(it, None)  # aquí corre el SELECT
+            st_read.busy += time.perf_counter() - t0
+            if rows is None:
+                break
+            st_read.batches += 1
+            st_read.rows += len(rows)
+            pipe.put(q_rows, rows, st_read)
+        pipe.put(q_rows, _DONE, st_read)
+
+    def prep():
+        def texts_of(row):
+            return chunk_text(to_text(*row[1:]), CONFIG["MAX_CHARS"], CONFIG["CHUNK_CHARS"], CONFIG["CHUNK_OVERLAP"])
+
+        with ThreadPoolExecutor(max_workers=CONFIG["PDF_WORKERS"], thread_name_prefix="embed-pdf") as pool:
+            while True:
+                rows = pipe.get(q_rows, st_prep)
+                if rows is _DONE:
+                    break
+                t0 = time.perf_counter()
+                # Construir lista plana de textos (con chunking); el orden de las filas se conserva
+                flat_texts, map_rows = [], []
+                for row, chunks in zip(rows, pool.map(texts_of, rows)):
+                    for ch in chunks:
+                        flat_texts.append(preprocess_for_e5(ch))
+                        map_rows.append(row[0])
+                st_prep.batches += 1
+                st_prep.rows += len(rows)
+                st_prep.busy += time.perf_counter() - t0
+                pipe.put(q_texts, (len(rows), flat_texts, map_rows), st_prep)
+        pipe.put(q_texts, _DONE, st_prep)
+
+    def writer():
+        wconn = connect_db()  # la conexión del lector está ocupada con el siguiente SELECT
+        processed = 0
+        try:
+            while True:
+                item = pipe.get(q_pairs, st_write)
+                if item is _DONE:
+                    break
+                n_rows, pairs, took = item
+                t0 = time.perf_counter()
+                update_blob(wconn, table, idf, dst, pairs)
+                st_write.batches += 1
+                st_write.rows += len(pairs)
+                st_write.busy += time.perf_counter() - t0
+                processed += len(pairs)
+                print(f"[OK {table}] {dst} ventana {st_write.batches}: {len(pairs)} filas "
+                      f"(encode {took:.2f}s) | {processed}/{total}")
+        finally:
+            wconn.close()
+
+    t_start = time.perf_counter()
+    pipe.spawn("reader", reader)
+    pipe.spawn("prep", prep)
+    pipe.spawn("writer", writer)
+    def encode_window(window):
+        # Chunks de varios lotes de BD juntos, ordenados por longitud; luego de vuelta a su fila
+        flat_texts = [t for _, texts, _ in window for t in texts]
+        map_rows = [rid for _, _, rows in window for rid in rows]
+        n_rows = sum(n for n, _, _ in window)
+        t0 = time.perf_counter()
+        emb = encode_bucketed(model, flat_texts, tuner, normalize=CONFIG["NORMALIZE"])
         by_id = {}
-        for (rid, _), vec in zip(map_rows, emb):
+        for rid, vec in zip(map_rows, emb):
             by_id.setdefault(rid, []).append(vec)
         pairs = [(rid, mean_pool(vs)) for rid, vs in by_id.items()]
-        update_blob(conn, table, idf, dst, pairs)
-        processed += len(pairs)
-        print(f"[OK articulos] lote {b+1}/{batches}: {len(pairs)} filas en {took:.2f}s | {processed}/{total}")
+        took = time.perf_counter() - t0
+        st_enc.batches += 1
+        st_enc.rows += n_rows
+        st_enc.busy += took
+        pipe.put(q_pairs, (n_rows, pairs, took), st_enc)
 
+    tuner = batch_tuner(model)
+    try:
+        window, n_chunks = [], 0
+        while True:
+            item = pipe.get(q_texts, st_enc)
+            if item is not _DONE:
+                n_rows, flat_texts, map_rows = item
+                if not flat_texts:
+                    print(f"[{table}] {dst}: lote de {n_rows} filas sin textos.")
+                    continue
+                window.append(item)
+                n_chunks += len(flat_texts)
+                if n_chunks < CONFIG["ENC_WINDOW"]:
+                    continue
+            if window:
+                encode_window(window)
+                window, n_chunks = [], 0
+            if item is _DONE:
+                break
+        pipe.put(q_pairs, _DONE, st_enc)
+    except _Stopped:
+        pass
+    except BaseException as e:
+        pipe.fail(e)
+    pipe.join()
 
-def process_modificaciones(model: SentenceTransformer, conn, args):
+    wall = time.perf_counter() - t_start
+    stages = (st_read, st_prep, st_enc, st_write)
+    print(f"[PIPE {table}] {dst}: {wall:.2f}s; cuello de botella: {max(stages, key=lambda s: s.busy).name}")
+    for st in stages:
+        print(f"    {st.summary(wall)}")
+    print(f"    batches  {tuner.summary()}")
+
+
+def process_documentos(model: SentenceTransformer, conn, args):
     """
-    modificaciones.texto_modificacion -> modificaciones.embedding_completo
+    Embeddings por campo en `documentos`:
+      nombre_regulacion -> embedding_nombre
+      ambito_aplicacion -> embedding_ambito
+      tipo_de_ordenamiento -> embedding_tipo
+      emisor -> embedding_emisor
+      embedding_completo (opcional): desde PDF (ruta_archivo) o concatenando campos si no hay PDF
     """
-    table, idf, src, dst = "modificaciones", "id_modificacion", "texto_modificacion", "embedding_completo"
-    where = build_where(CONFIG["ONLY_NULLS"], dst)
-    total = count_rows(conn, table, where)
-    if total == 0:
-        print("[modificaciones] nada por hacer.")
-        return
+    table, idf = "documentos", "id_documento"
+    for src, dst in [
+        ("nombre_regulacion", "embedding_nombre"),
+        ("ambito_aplicacion", "embedding_ambito"),
+        ("tipo_de_ordenamiento", "embedding_tipo"),
+        ("emisor", "embedding_emisor"),
+    ]:
+        embed_field(model, conn, table, idf, dst, [src], _clean)
 
-    print(f"[modificaciones] {total} filas a procesar.")
-    processed = 0
-    batches = math.ceil(total / CONFIG["DB_BATCH"])
-    for b in range(batches):
-        ids = fetch_ids(conn, table, idf, where, CONFIG["DB_BATCH"], b * CONFIG["DB_BATCH"])
-        if not ids:
-            break
-        placeholders = ",".join(["%s"] * len(ids))
-        cur = conn.cursor()
-        cur.execute(f"SELECT `{idf}`, `{src}` FROM `{table}` WHERE `{idf}` IN ({placeholders})", ids)
-        rows = cur.fetchall()
-        cur.close()
+    # Opcional: embedding_completo desde PDF o concatenación
+    embed_field(model, conn, table, idf, "embedding_completo",
+                ["ruta_archivo", "nombre_regulacion", "ambito_aplicacion", "tipo_de_ordenamiento", "emisor"],
+                pdf_or_concat)
 
-        flat_texts, map_rows = [], []
-        for _id, txt in rows:
-            s = "" if txt is None else str(txt)
-            chunks = chunk_text(s, CONFIG["MAX_CHARS"], CONFIG["CHUNK_CHARS"], CONFIG["CHUNK_OVERLAP"])
-            if not chunks:
-                continue
-            for ch in chunks:
-                flat_texts.append(preprocess_for_e5(ch))
-                map_rows.append((_id, True))
-
-        if not flat_texts:
-            print(f"[modificaciones] lote {b+1}/{batches} vacío.")
-            continue
 
-        t0 = time.time()
-        emb = encode_texts(model, flat_texts, normalize=CONFIG["NORMALIZE"], enc_batch=CONFIG["ENC_BATCH"])
-        took = time.time() - t0
+def process_articulos(model: SentenceTransformer, conn, args):
+    """
+    articulos.texto_articulo -> articulos.embedding_articulo
+    """
+    embed_field(model, conn, "articulos", "id_articulo", "embedding_articulo", ["texto_articulo"], _clean)
 
-        by_id = {}
-        for (rid, _), vec in zip(map_rows, emb):
-            by_id.setdefault(rid, []).append(vec)
-        pairs = [(rid, mean_pool(vs)) for rid, vs in by_id.items()]
-        update_blob(conn, table, idf, dst, pairs)
-        processed += len(pairs)
-        print(f"[OK modificaciones] lote {b+1}/{batches}: {len(pairs)} filas en {took:.2f}s | {processed}/{total}")
+
+def process_modificaciones(model: SentenceTransformer, conn, args):
+    """
+    modificaciones.texto_modificacion -> modificaciones.embedding_completo
+    """
+    embed_field(model, conn, "modificaciones", "id_modificacion", "embedding_completo",
+                ["texto_modificacion"], _clean)
 
 
 def process_anexos(model: SentenceTransformer, conn, args):
@@ -403,109 +588,59 @@ def process_anexos(model: SentenceTransformer, conn, args):
     anexos.embedding_completo -> desde PDF si hay ruta_archivo; si no, concat(nombre_anexo + texto_anexo)
     """
     table, idf = "anexos", "id_anexo"
-
     # 1) embedding_texto
-    dst = "embedding_texto"
-    where = build_where(CONFIG["ONLY_NULLS"], dst)
-    total = count_rows(conn, table, where)
-    if total > 0:
-        print(f"[anexos] {dst}: {total} filas a procesar.")
-        batches = math.ceil(total / CONFIG["DB_BATCH"])
-        for b in range(batches):
-            ids = fetch_ids(conn, table, idf, where, CONFIG["DB_BATCH"], b * CONFIG["DB_BATCH"])
-            if not ids:
-                break
-            placeholders = ",".join(["%s"] * len(ids))
-            cur = conn.cursor()
-            cur.execute(f"SELECT `{idf}`, `texto_anexo` FROM `{table}` WHERE `{idf}` IN ({placeholders})", ids)
-            rows = cur.fetchall()
-            cur.close()
-
-            flat_texts, map_rows = [], []
-            for _id, txt in rows:
-                s = "" if txt is None else str(txt)
-                chunks = chunk_text(s, CONFIG["MAX_CHARS"], CONFIG["CHUNK_CHARS"], CONFIG["CHUNK_OVERLAP"])
-                if not chunks:
-                    continue
-                for ch in chunks:
-                    flat_texts.append(preprocess_for_e5(ch))
-                    map_rows.append((_id, True))
-
-            if flat_texts:
-                t0 = time.time()
-                emb = encode_texts(model, flat_texts, normalize=CONFIG["NORMALIZE"], enc_batch=CONFIG["ENC_BATCH"])
-                took = time.time() - t0
-
-                by_id = {}
-                for (rid, _), vec in zip(map_rows, emb):
-                    by_id.setdefault(rid, []).append(vec)
-                pairs = [(rid, mean_pool(vs)) for rid, vs in by_id.items()]
-                update_blob(conn, table, idf, dst, pairs)
-                print(f"[OK anexos] {dst} lote {b+1}/{batches}: {len(pairs)} filas en {took:.2f}s.")
-
+    embed_field(model, conn, table, idf, "embedding_texto", ["texto_anexo"], _clean)
     # 2) embedding_completo (PDF o concat)
-    dst = "embedding_completo"
-    where = build_where(CONFIG["ONLY_NULLS"], dst)
-    total = count_rows(conn, table, where)
-    if total == 0:
-        print("[anexos] embedding_completo: nada por hacer.")
-        return
+    embed_field(model, conn, table, idf, "embedding_completo", ["ruta_archivo", "nombre_anexo", "texto_anexo"],
+                pdf_or_concat)
 
-    print(f"[anexos] {dst}: {total} filas a procesar (PDF o concat).")
-    batches = math.ceil(total / CONFIG["DB_BATCH"])
-    for b in range(batches):
-        ids = fetch_ids(conn, table, idf, where, CONFIG["DB_BATCH"], b * CONFIG["DB_BATCH"])
-        if not ids:
-            break
-        placeholders = ",".join(["%s"] * len(ids))
-        cur = conn.cursor()
-        cur.execute(
-            f"SELECT `{idf}`, `ruta_archivo`, `nombre_anexo`, `texto_anexo` FROM `{table}` WHERE `{idf}` IN ({placeholders})",
-            ids
-        )
-        rows = cur.fetchall()
-        cur.close()
 
-        flat_texts, map_rows = [], []
-        for _id, ruta, nombre, texto in rows:
-            text = ""
-            if CONFIG["USE_PYMUPDF"] and ruta and str(ruta).strip():
-                text = extract_pdf_text(str(ruta).strip(), CONFIG["PDF_MAX_PAGES"])
-            if not text:
-                parts = [nombre, texto]
-                text = " | ".join([p for p in parts if p]) or ""
-            chunks = chunk_text(text, CONFIG["MAX_CHARS"], CONFIG["CHUNK_CHARS"], CONFIG["CHUNK_OVERLAP"])
-            if not chunks:
-                continue
-            for ch in chunks:
-                flat_texts.append(preprocess_for_e5(ch))
-                map_rows.append((_id, True))
-
-        if not flat_texts:
-            print(f"[anexos] {dst}: lote {b+1}/{batches} sin textos.")
+# =======================
+# SNAPSHOTS PARA LA API
+# =======================
+def export_snapshots(conn, tables: List[str], snapshot_dir: str, quantize: List[str] = ()):
+    """
+    Exporta por tabla la matriz float32 normalizada (<tabla>.npy) y sus ids (<tabla>.ids.npy)
+    con el mismo criterio de selección que usa main.py, para cargarla con mmap_mode="r".
+    Con `quantize` escribe además <tabla>.float16.npy, <tabla>.int8.npy (+ .int8.scale.npy)
+    y/o <tabla>.binary.npy (signos empaquetados, 1 bit por dimensión).
+    Las versiones cuantizadas, binaria incluida, viven solo aquí y no como columnas junto a los
+    BLOB: se derivan del float32 sin aportar información nueva y, sin snapshot, la API las
+    calcula al cargar (quantize_index).
+    """
+    for tname in tables:
+        conf = TABLE_CONFIGS.get(tname)
+        if not conf:
             continue
-
         t0 = time.time()
-        emb = encode_texts(model, flat_texts, normalize=CONFIG["NORMALIZE"], enc_batch=CONFIG["ENC_BATCH"])
-        took = time.time() - t0
-
-        by_id = {}
-        for (rid, _), vec in zip(map_rows, emb):
-            by_id.setdefault(rid, []).append(vec)
-        pairs = [(rid, mean_pool(vs)) for rid, vs in by_id.items()]
-        update_blob(conn, table, idf, dst, pairs)
-        print(f"[OK anexos] {dst} lote {b+1}/{batches}: {len(pairs)} filas en {took:.2f}s.")
+        cur = conn.cursor(dictionary=True)
+        cur.execute(select_sql(conf, with_meta=False))
+        idx = build_table_index(tname, cur, len(conf.embed_cols), keep_meta=False)
+        cur.close()
+        write_snapshot(snapshot_dir, tname, idx.ids, idx.matrix)
+        fp = content_fingerprint(idx.ids, idx.matrix)
+        for kind in quantize:
+            qm = QuantizedMatrix.from_float32(idx.matrix, kind)
+            write_quantized(snapshot_dir, tname, kind, qm.codes, qm.scales, fingerprint=fp)
+            print(f"[OK snapshot] {tname}.{kind}: {qm.nbytes / 1e6:.1f} MB (float32: {idx.matrix.nbytes / 1e6:.1f} MB)")
+        print(f"[OK snapshot] {tname}: {idx.size} filas x {idx.dim} dims en {time.time() - t0:.2f}s -> {snapshot_dir}")
 
 
 # =======================
 # CLI
 # =======================
 def main():
-    parser = argparse.ArgumentParser(description="Generador de embeddings (MySQL)")
+    parser = argparse.ArgumentParser(description="Generador de embeddings (MySQL o SQLite según DB_BACKEND)")
     parser.add_argument("--tables", nargs="+", default=["documentos", "articulos", "modificaciones", "anexos"],
                         help="Qué tablas procesar: documentos articulos modificaciones anexos")
     parser.add_argument("--only-nulls", action="store_true", help="Procesa solo filas con embedding NULL (default)")
     parser.add_argument("--all", action="store_true", help="Procesa todas las filas (ignora ONLY_NULLS)")
+    parser.add_argument("--export-snapshot", metavar="DIR", default=None,
+                        help="Al terminar, exporta snapshots .npy por tabla para la API (SNAPSHOT_DIR)")
+    parser.add_argument("--quantize", nargs="+", choices=QUANT_KINDS, default=[],
+                        help="Versiones cuantizadas a exportar junto al snapshot (INDEX_DTYPE en la API)")
+    parser.add_argument("--skip-embed", action="store_true",
+                        help="No genera embeddings; útil junto con --export-snapshot")
     args = parser.parse_args()
 
     if args.all:
@@ -513,20 +648,22 @@ def main():
     if args.only_nulls:
         CONFIG["ONLY_NULLS"] = True
 
-    print(f"[INFO] Modelo: {CONFIG['MODEL_NAME']}")
-    model = SentenceTransformer(CONFIG["MODEL_NAME"])
-
     conn = connect_db()
     try:
         tabs = set([t.lower() for t in args.tables])
-        if "documentos" in tabs:
-            process_documentos(model, conn, args)
-        if "articulos" in tabs:
-            process_articulos(model, conn, args)
-        if "modificaciones" in tabs:
-            process_modificaciones(model, conn, args)
-        if "anexos" in tabs:
-            process_anexos(model, conn, args)
+        if not args.skip_embed:
+            print(f"[INFO] Modelo: {CONFIG['MODEL_NAME']}")
+            model = SentenceTransformer(CONFIG["MODEL_NAME"])
+            if "documentos" in tabs:
+                process_documentos(model, conn, args)
+            if "articulos" in tabs:
+                process_articulos(model, conn, args)
+            if "modificaciones" in tabs:
+                process_modificaciones(model, conn, args)
+            if "anexos" in tabs:
+                process_anexos(model, conn, args)
+        if args.export_snapshot:
+            export_snapshots(conn, [t.lower() for t in args.tables], args.export_snapshot, args.quantize)
     finally:
         conn.close()
         print("[DONE] Proceso completado.")
@@ -0,0 +1,163 @@
+# metadata_filter.py — Filtros de metadatos precalculados, alineados con las filas del índice vectorial
+import datetime
+from dataclasses import dataclass, fields
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BITMAP_MAX_VALUES = 64  # hasta aquí, un bitmap empaquetado por valor; con más valores, postings CSR
+
+CATEGORICAL_FIELDS = ("tipo_de_ordenamiento", "ambito_aplicacion", "emisor")
+
+
+@dataclass(frozen=True)
+class Filtros:
+    """Varios valores dentro de un campo se combinan con OR; campos distintos, con AND."""
+    tipo_de_ordenamiento: Tuple[str, ...] = ()
+    ambito_aplicacion: Tuple[str, ...] = ()
+    emisor: Tuple[str, ...] = ()
+    id_documento: Tuple[int, ...] = ()
+    fecha_desde: Optional[datetime.date] = None
+    fecha_hasta: Optional[datetime.date] = None
+
+    def __bool__(self) -> bool:
+        return any(getattr(self, f.name) for f in fields(self))
+
+
+def _key(v) -> Hashable:
+    # Comparación sin distinguir mayúsculas ni espacios sobrantes ("Ley" == "ley ")
+    return v.strip().casefold() if isinstance(v, str) else v
+
+
+class _Categorical:
+    """
+    Valor por fila codificado como entero. Pocos valores: matriz (V, ceil(n/8)) de bits, y el OR
+    de varios valores se hace sobre bytes empaquetados. Muchos valores: filas ordenadas por código
+    (offsets[c]:offsets[c+1] son las filas con valor c).
+    """
+
+    def __init__(self, codes: np.ndarray, values: Dict[Hashable, int], bitmaps: Optional[bool] = None):
+        self.n = int(codes.shape[0])
+        self.values = values
+        V = len(values)
+        if bitmaps is None:
+            bitmaps = V <= BITMAP_MAX_VALUES
+        self.bitmaps: Optional[np.ndarray] = None
+        self.order: Optional[np.ndarray] = None
+        self.offsets: Optional[np.ndarray] = None
+        if bitmaps:
+            self.bitmaps = np.zeros((V, (self.n + 7) // 8), dtype=np.uint8)
+            for c in range(V):
+                self.bitmaps[c] = np.packbits(codes == c)
+        else:
+            valid = np.flatnonzero(codes >= 0)
+            self.order = valid[np.argsort(codes[valid], kind="stable")].astype(np.int32)
+            self.offsets = np.zeros((V + 1,), dtype=np.int64)
+            np.cumsum(np.bincount(codes[valid], minlength=V), out=self.offsets[1:])
+
+    @classmethod
+    def from_values(cls, column: List, bitmaps: Optional[bool] = None) -> "_Categorical":
+        values: Dict[Hashable, int] = {}
+        codes = np.full((len(column),), -1, dtype=np.int32)
+        for i, v in enumerate(column):
+            if v is None or v == "":
+                continue
+            k = _key(v)
+            codes[i] = values.setdefault(k, len(values))
+        return cls(codes, values, bitmaps)
+
+    @property
+    def nbytes(self) -> int:
+        if self.bitmaps is not None:
+            return int(self.bitmaps.nbytes)
+        return int(self.order.nbytes + self.offsets.nbytes)
+
+    def mask(self, wanted: Iterable) -> np.ndarray:
+        codes = sorted({self.values[k] for k in map(_key, wanted) if k in self.values})
+        if not codes:
+            return np.zeros((self.n,), dtype=bool)
+        if self.bitmaps is not None:
+            bits = np.bitwise_or.reduce(self.bitmaps[codes], axis=0)
+            return np.unpackbits(bits, count=self.n).astype(bool)
+        m = np.zeros((self.n,), dtype=bool)
+        for c in codes:
+            m[self.order[self.offsets[c]:self.offsets[c + 1]]] = True
+        return m
+
+
+class FilterIndex:
+    """Estructuras por campo para una tabla; la fila i corresponde a la fila i de su TableIndex."""
+
+    def __init__(self, n: int, categorical: Dict[str, _Categorical], id_documento: _Categorical,
+                 date_sorted: np.ndarray, date_order: np.ndarray):
+        self.n = n
+        self.categorical = categorical
+        self.id_documento = id_documento
+        self.date_sorted = date_sorted  # (m,) datetime64[D] ascendente, solo filas con fecha
+        self.date_order = date_order    # (m,) int32, fila correspondiente a cada fecha
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(c.nbytes for c in self.categorical.values()) + self.id_documento.nbytes
+                   + self.date_sorted.nbytes + self.date_order.nbytes)
+
+    def mask(self, f: Filtros) -> Optional[np.ndarray]:
+        """Máscara bool (n,) de filas que cumplen todos los filtros; None si no hay filtros."""
+        if not f:
+            return None
+        m: Optional[np.ndarray] = None
+
+        def _and(part: np.ndarray):
+            nonlocal m
+            m = part if m is None else np.logical_and(m, part, out=m)
+
+        for name in CATEGORICAL_FIELDS:
+            wanted = getattr(f, name)
+            if wanted:
+                _and(self.categorical[name].mask(wanted))
+        if f.id_documento:
+            _and(self.id_documento.mask(f.id_documento))
+        if f.fecha_desde or f.fecha_hasta:
+            lo = np.searchsorted(self.date_sorted, np.datetime64(f.fecha_desde, "D"), "left") if f.fecha_desde else 0
+            hi = (np.searchsorted(self.date_sorted, np.datetime64(f.fecha_hasta, "D"), "right")
+                  if f.fecha_hasta else self.date_sorted.shape[0])
+            part = np.zeros((self.n,), dtype=bool)
+            part[self.date_order[lo:hi]] = True
+            _and(part)
+        return m
+
+
+def build_filter_index(ids: np.ndarray, rows: Iterable[dict], docs: Dict[int, dict]) -> FilterIndex:
+    """
+    `ids`: ids de fila en el orden de la matriz. `rows`: (_id, _id_doc, _date opcional) de la tabla.
+    `docs`: id_documento -> atributos de documentos. La fecha propia de la fila tiene prioridad
+    sobre la del documento. Las filas sin registro en BD quedan fuera de cualquier filtro.
+    """
+    by_id = {int(r["_id"]): r for r in rows}
+    n = int(ids.shape[0])
+    doc_col: List[Optional[int]] = [None] * n
+    cols: Dict[str, List] = {name: [None] * n for name in CATEGORICAL_FIELDS}
+    dates = np.full((n,), np.datetime64("NaT"), dtype="datetime64[D]")
+    for i, _id in enumerate(ids.tolist()):
+        r = by_id.get(int(_id))
+        if r is None:
+            continue
+        doc_id = r.get("_id_doc")
+        doc = docs.get(int(doc_id)) if doc_id is not None else None
+        doc_col[i] = int(doc_id) if doc_id is not None else None
+        if doc is not None:
+            for name in CATEGORICAL_FIELDS:
+                cols[name][i] = doc.get(name)
+        d = r.get("_date") or (doc.get("fecha_publicacion") if doc is not None else None)
+        if d:
+            dates[i] = np.datetime64(d, "D")
+
+    has_date = np.flatnonzero(~np.isnat(dates))
+    order = has_date[np.argsort(dates[has_date], kind="stable")].astype(np.int32)
+    return FilterIndex(
+        n=n,
+        categorical={name: _Categorical.from_values(col) for name, col in cols.items()},
+        id_documento=_Categorical.from_values(doc_col, bitmaps=False),
+        date_sorted=dates[order],
+        date_order=order,
+    )
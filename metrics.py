@@ -0,0 +1,161 @@
+# metrics.py — Histogramas de latencia por etapa y exposición en formato de texto de Prometheus
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Segundos: de medio milisegundo (caché, top-k) a varios segundos (BD lenta, lotes grandes)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List] = {}  # labels -> [conteos por bucket, suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(k, list(v[0]), v[1], v[2]) for k, v in sorted(self._series.items())]
+        for labels, counts, total, n in series:
+            acc = 0
+            for b, c in zip(self.buckets, counts):
+                acc += c
+                le = 'le="%s"' % b
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, le)} {acc}")
+            le = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, le)} {n}")
+            lbl = _fmt_labels(self.labelnames, labels)
+            out.append(f"{self.name}_sum{lbl} {total}")
+            out.append(f"{self.name}_count{lbl} {n}")
+        return out
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            items = sorted(self._values.items())
+        out += [f"{self.name}{_fmt_labels(self.labelnames, k)} {v}" for k, v in items]
+        return out
+
+
+STAGE_SECONDS = Histogram("search_stage_seconds", "Tiempo por etapa de búsqueda (y por tabla)",
+                          ("app", "stage", "table"))
+REQUEST_SECONDS = Histogram("search_request_seconds", "Tiempo total por petición", ("app", "endpoint"))
+EXECUTOR_QUEUED = Gauge("search_executor_queued", "Tareas en cola por ejecutor de etapa", ("app", "executor"))
+EXECUTOR_RUNNING = Gauge("search_executor_running", "Tareas en ejecución por ejecutor de etapa", ("app", "executor"))
+
+REGISTRY = [REQUEST_SECONDS, STAGE_SECONDS, EXECUTOR_QUEUED, EXECUTOR_RUNNING]
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for m in REGISTRY:
+        lines += m.render()
+    return "\n".join(lines) + "\n"
+
+
+# =======================
+# Tiempos por petición
+# =======================
+class Timings:
+    """
+    Acumula tiempo por etapa (y por tabla) de una petición; al cerrarla, cada etapa entra
+    una sola vez al histograma (p. ej. dos top-k en la misma tabla cuentan como una muestra).
+    """
+
+    def __init__(self, app: str, endpoint: str):
+        self.app = app
+        self.endpoint = endpoint
+        self.t0 = time.perf_counter()
+        self.stages: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, table: str = ""):
+        with self._lock:
+            self.stages[(stage, table)] = self.stages.get((stage, table), 0.0) + seconds
+
+    def finish(self) -> float:
+        total = time.perf_counter() - self.t0
+        REQUEST_SECONDS.observe(total, self.app, self.endpoint)
+        with self._lock:
+            items = list(self.stages.items())
+        for (stage, table), s in items:
+            STAGE_SECONDS.observe(s, self.app, stage, table)
+        return total
+
+    def as_dict(self) -> Dict:
+        """{"total_ms", "stages": {etapa: ms}, "tables": {tabla: {etapa: ms}}}"""
+        stages: Dict[str, float] = {}
+        tables: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            items = list(self.stages.items())
+        for (stage, table), s in items:
+            if table:
+                tables.setdefault(table, {})[stage] = round(s * 1000.0, 3)
+            else:
+                stages[stage] = round(s * 1000.0, 3)
+        return {"total_ms": round((time.perf_counter() - self.t0) * 1000.0, 3), "stages": stages, "tables": tables}
+
+
+# La petición en curso; StageExecutor copia el contexto a sus hilos
+_current: ContextVar[Optional[Timings]] = ContextVar("search_timings", default=None)
+
+
+def start_request(app: str, endpoint: str) -> Timings:
+    t = Timings(app, endpoint)
+    _current.set(t)
+    return t
+
+
+def record(stage: str, seconds: float, table: str = ""):
+    t = _current.get()
+    if t is not None:
+        t.add(stage, seconds, table)
+    else:
+        STAGE_SECONDS.observe(seconds, "", stage, table)
+
+
+@contextmanager
+def timed(stage: str, table: str = ""):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - t0, table)
@@ -0,0 +1,184 @@
+# quantization.py — Embeddings cuantizados (float16 / int8 / binario) y su puntuación directa
+import argparse
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+SCORE_CHUNK = 32768  # filas por bloque: acota la copia temporal en float32 al puntuar
+KINDS = ("float16", "int8", "binary")
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_M1, _M2, _M4, _H01 = (np.uint64(0x5555555555555555), np.uint64(0x3333333333333333),
+                       np.uint64(0x0F0F0F0F0F0F0F0F), np.uint64(0x0101010101010101))
+
+
+def pack_signs(M: np.ndarray) -> np.ndarray:
+    """1 bit por dimensión (signo): un vector e5 de 768 dims -> 96 bytes."""
+    return np.packbits(np.asarray(M) > 0, axis=-1)
+
+
+def popcount_rows(x: np.ndarray) -> np.ndarray:
+    """Número de bits en 1 por fila de una matriz uint8 (n, nbytes)."""
+    if hasattr(np, "bitwise_count"):  # numpy >= 2
+        return np.bitwise_count(x).sum(axis=1, dtype=np.int32)
+    if x.shape[1] % 8 == 0 and x.flags.c_contiguous:
+        # SWAR sobre palabras de 64 bits
+        w = x.view(np.uint64)
+        w = w - ((w >> np.uint64(1)) & _M1)
+        w = (w & _M2) + ((w >> np.uint64(2)) & _M2)
+        w = (w + (w >> np.uint64(4))) & _M4
+        return ((w * _H01) >> np.uint64(56)).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT8[x].sum(axis=1, dtype=np.int32)
+
+
+class QuantizedMatrix:
+    """
+    float16: codes = M.astype(float16).
+    int8:    codes = round(M / scale) con scale = max|fila| / 127 (una escala float32 por vector).
+    binary:  codes = signos empaquetados (n, d/8); la "similitud" es d - 2 * Hamming,
+             útil solo como prefiltro antes del rescoring en float32.
+    """
+
+    def __init__(self, kind: str, codes: np.ndarray, scales: Optional[np.ndarray] = None,
+                 dim: Optional[int] = None):
+        if kind not in KINDS:
+            raise ValueError(f"Tipo de cuantización no soportado: {kind}")
+        self.kind = kind
+        self.codes = codes
+        self.scales = scales
+        self.dim = dim or (codes.shape[1] * 8 if kind == "binary" else codes.shape[1])
+
+    @classmethod
+    def from_float32(cls, M: np.ndarray, kind: str) -> "QuantizedMatrix":
+        if kind == "binary":
+            codes = np.empty((M.shape[0], (M.shape[1] + 7) // 8), dtype=np.uint8)
+            for s in range(0, M.shape[0], SCORE_CHUNK):
+                codes[s:s + SCORE_CHUNK] = pack_signs(M[s:s + SCORE_CHUNK])
+            return cls(kind, codes, dim=M.shape[1])
+        if kind == "float16":
+            return cls(kind, np.ascontiguousarray(M, dtype=np.float16))
+        codes = np.empty(M.shape, dtype=np.int8)
+        scales = np.empty((M.shape[0],), dtype=np.float32)
+        for s in range(0, M.shape[0], SCORE_CHUNK):
+            block = np.asarray(M[s:s + SCORE_CHUNK], dtype=np.float32)
+            sc = np.abs(block).max(axis=1) / 127.0
+            sc[sc == 0] = 1.0
+            codes[s:s + SCORE_CHUNK] = np.clip(np.rint(block / sc[:, None]), -127, 127)
+            scales[s:s + SCORE_CHUNK] = sc
+        return cls(kind, codes, scales)
+
+    @property
+    def shape(self):
+        return (self.codes.shape[0], self.dim)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    def dequantize(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        codes = self.codes if rows is None else self.codes[rows]
+        if self.kind == "binary":
+            bits = np.unpackbits(codes, axis=1)[:, :self.dim].astype(np.float32)
+            return (2.0 * bits - 1.0) / np.sqrt(self.dim)
+        out = np.asarray(codes, dtype=np.float32)
+        if self.scales is not None:
+            out = out * (self.scales if rows is None else self.scales[rows])[:, None]
+        return out
+
+    def dot(self, q_vec: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Similitud aproximada contra todas las filas (o solo `rows`), por bloques."""
+        codes = self.codes if rows is None else self.codes[rows]
+        n = codes.shape[0]
+        out = np.empty((n,), dtype=np.float32)
+        if self.kind == "binary":
+            # Hamming por XOR + popcount; d - 2*h preserva el orden de similitud de signos
+            q_bits = pack_signs(q_vec)
+            for s in range(0, n, SCORE_CHUNK):
+                h = popcount_rows(np.bitwise_xor(codes[s:s + SCORE_CHUNK], q_bits))
+                out[s:s + SCORE_CHUNK] = self.dim - 2 * h
+            return out
+        for s in range(0, n, SCORE_CHUNK):
+            out[s:s + SCORE_CHUNK] = np.asarray(codes[s:s + SCORE_CHUNK], dtype=np.float32) @ q_vec
+        if self.scales is not None:
+            out *= self.scales if rows is None else self.scales[rows]
+        return out
+
+    def dot_block(self, Q: np.ndarray, start: int, end: int) -> np.ndarray:
+        """Similitudes (end - start, B) de un bloque contiguo de filas contra B consultas a la vez."""
+        codes = self.codes[start:end]
+        if self.kind == "binary":
+            out = np.empty((codes.shape[0], Q.shape[0]), dtype=np.float32)
+            for j, q_bits in enumerate(pack_signs(Q)):
+                out[:, j] = self.dim - 2 * popcount_rows(np.bitwise_xor(codes, q_bits))
+            return out
+        out = np.asarray(codes, dtype=np.float32) @ Q.T
+        if self.scales is not None:
+            out *= self.scales[start:end, None]
+        return out
+
+
+# =======================
+# REPORTE: solapamiento top-k vs float32
+# =======================
+def overlap_report(matrix: np.ndarray, queries: np.ndarray, k: int,
+                   rescore_factors: List[int]) -> List[Dict]:
+    def _top(s: np.ndarray, kk: int) -> np.ndarray:
+        kk = min(kk, s.shape[0])
+        return np.argpartition(-s, kk - 1)[:kk]
+
+    truth = [set(_top(matrix @ q, k).tolist()) for q in queries]
+    out = [{"tipo": "float32", "rescore": "-", "overlap": 1.0, "bytes": int(matrix.nbytes), "ms_por_consulta": None}]
+    for kind in KINDS:
+        qm = QuantizedMatrix.from_float32(matrix, kind)
+        for factor in [0] + list(rescore_factors):
+            hits = 0
+            t0 = time.perf_counter()
+            for q, t in zip(queries, truth):
+                s = qm.dot(q)
+                if factor:
+                    # Lista corta de k*factor y rescoring en precisión completa
+                    cand = _top(s, k * factor)
+                    top = cand[_top(np.asarray(matrix[cand], dtype=np.float32) @ q, k)]
+                else:
+                    top = _top(s, k)
+                hits += len(t.intersection(top.tolist()))
+            ms = (time.perf_counter() - t0) * 1000.0 / len(queries)
+            out.append({
+                "tipo": kind,
+                "rescore": f"x{factor}" if factor else "no",
+                "overlap": round(hits / float(sum(len(t) for t in truth) or 1), 4),
+                "bytes": qm.nbytes,
+                "ms_por_consulta": round(ms, 3),
+            })
+    return out
+
+
+def main():
+    from ivf_index import synthetic_queries
+    from snapshot import load_snapshot
+
+    parser = argparse.ArgumentParser(description="Reporte de solapamiento top-k: float16/int8/binario vs float32")
+    parser.add_argument("--snapshot-dir", required=True)
+    parser.add_argument("--tables", nargs="+", default=["articulos", "modificaciones"])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore", type=int, nargs="+", default=[4, 10, 30])
+    parser.add_argument("--n-queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.5)
+    args = parser.parse_args()
+
+    for table in args.tables:
+        snap = load_snapshot(args.snapshot_dir, table)
+        if snap is None:
+            print(f"[WARN] Sin snapshot para {table}")
+            continue
+        _, matrix = snap
+        queries = synthetic_queries(matrix, args.n_queries, args.noise, seed=0)
+        print(f"\n[{table}] n={matrix.shape[0]} d={matrix.shape[1]} k={args.k}")
+        print(f"{'tipo':>8} {'rescore':>8} {'overlap':>8} {'MB':>9} {'ms/cons':>8}")
+        for r in overlap_report(matrix, queries, args.k, args.rescore):
+            print(f"{r['tipo']:>8} {r['rescore']:>8} {r['overlap']:>8} {r['bytes'] / 1e6:>9.2f} {str(r['ms_por_consulta']):>8}")
+
+
+if __name__ == "__main__":
+    main()
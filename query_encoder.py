@@ -0,0 +1,213 @@
+# query_encoder.py — Codificación de consultas: caché LRU + micro-batching delante de model.encode
+import asyncio
+import os
+import queue
+import threading
+import time
+import unicodedata
+from concurrent.futures import Executor, Future, InvalidStateError
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from cache import TTLCache
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL_S = float(os.getenv("QUERY_CACHE_TTL_S", "3600"))  # 0 = sin expiración
+
+# Micro-batching: junta las consultas que llegan dentro de la ventana en un solo model.encode
+QUERY_BATCHING = os.getenv("QUERY_BATCHING", "true").lower() == "true"
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "3"))
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "32"))
+
+
+def normalize_query(q: str) -> str:
+    # Misma consulta con distinto espaciado / forma Unicode -> misma llave (y mismo texto codificado)
+    return " ".join(unicodedata.normalize("NFC", q).split())
+
+
+def _claim(fut: Future) -> bool:
+    """Marca el Future como en curso; False si ya estaba cancelado (o resuelto) y no hay que codificarlo."""
+    try:
+        return fut.set_running_or_notify_cancel()
+    except RuntimeError:
+        return False
+
+
+def _settle(fut: Future, result=None, exc: Optional[BaseException] = None):
+    try:
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(result)
+    except InvalidStateError:
+        pass  # alguien lo resolvió o canceló antes
+
+
+class _MicroBatcher:
+    """Hilo único que agrupa textos pendientes y resuelve un Future por texto."""
+
+    def __init__(self, encode_many, window_s: float, max_batch: int):
+        self._encode_many = encode_many
+        self.window_s = window_s
+        self.max_batch = max(1, max_batch)
+        self._q: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.max_seen = 0
+
+    def submit(self, text: str, fut: Future):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="query-encoder", daemon=True)
+                    self._thread.start()
+        self._q.put((text, fut))
+
+    def _run(self):
+        while True:
+            batch = [self._q.get()]
+            deadline = time.monotonic() + self.window_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # Los cancelados no se codifican; un Future ya resuelto nunca debe tumbar este hilo
+            batch = [(t, fut) for t, fut in batch if _claim(fut)]
+            if not batch:
+                continue
+            texts = [t for t, _ in batch]
+            try:
+                M = self._encode_many(texts)
+            except Exception as e:
+                for _, fut in batch:
+                    _settle(fut, exc=e)
+                continue
+            for (_, fut), v in zip(batch, M):
+                v.setflags(write=False)  # compartido entre peticiones: solo lectura
+                _settle(fut, v)
+            self.batches += 1
+            self.items += len(batch)
+            self.max_seen = max(self.max_seen, len(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": round(self.window_s * 1000.0, 3),
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_seen": self.max_seen,
+            "pending": self._q.qsize(),
+        }
+
+
+class QueryEncoder:
+    def __init__(self, model, model_name: str, prefix: str = "",
+                 cache_size: int = QUERY_CACHE_SIZE, cache_ttl_s: float = QUERY_CACHE_TTL_S,
+                 batching: bool = QUERY_BATCHING, batch_window_ms: float = QUERY_BATCH_WINDOW_MS,
+                 batch_max: int = QUERY_BATCH_MAX, executor: Optional[Executor] = None):
+        self.model = model
+        self.model_name = model_name
+        self.prefix = prefix          # "query: " para e5
+        self.cache = TTLCache(cache_size, cache_ttl_s)
+        self.batcher = _MicroBatcher(self._encode_many, batch_window_ms / 1000.0, batch_max) if batching else None
+        self.executor = executor      # sin micro-batching: dónde correr model.encode (None = hilo que llama)
+        self._inflight: Dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+
+    def _encode_many(self, texts: List[str]) -> np.ndarray:
+        M = self.model.encode([self.prefix + t for t in texts], batch_size=max(1, len(texts)),
+                              normalize_embeddings=True)
+        return np.asarray(M, dtype=np.float32).reshape(len(texts), -1)
+
+    def _resolve(self, text: str, fut: Future):
+        if not _claim(fut):
+            return
+        try:
+            v = self._encode_many([text])[0]
+            v.setflags(write=False)
+        except Exception as e:
+            _settle(fut, exc=e)
+            return
+        _settle(fut, v)
+
+    def _done(self, key: tuple, fut: Future):
+        with self._lock:
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+        if not fut.cancelled() and fut.exception() is None:
+            self.cache.put(key, fut.result())
+
+    def _lookup(self, q: str) -> Tuple[Optional[np.ndarray], Optional[Future]]:
+        """(vector en caché, None) o (None, Future de la codificación en curso o recién lanzada)."""
+        text = normalize_query(q)
+        key = (self.model_name, self.prefix, text)
+        v = self.cache.get(key)
+        if v is not None:
+            return v, None
+
+        # Una sola codificación por texto aunque lleguen varias peticiones iguales a la vez
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                return None, fut
+            fut = self._inflight[key] = Future()
+        fut.add_done_callback(partial(self._done, key))
+        if self.batcher is not None:
+            self.batcher.submit(text, fut)
+        elif self.executor is not None:
+            try:
+                self.executor.submit(self._resolve, text, fut)
+            except BaseException as e:
+                # Saturated (503): el Future no debe quedar en _inflight sin resolverse nunca;
+                # quien se haya sumado a él recibe el mismo error
+                _settle(fut, exc=e)
+                raise
+        else:
+            self._resolve(text, fut)
+        return None, fut
+
+    def encode(self, q: str) -> np.ndarray:
+        v, fut = self._lookup(q)
+        return v if fut is None else fut.result()
+
+    async def encode_async(self, q: str) -> np.ndarray:
+        """Igual que encode, pero el event loop no se bloquea mientras corre model.encode."""
+        v, fut = self._lookup(q)
+        if fut is None:
+            return v
+        # shield: el Future es compartido por todas las peticiones con el mismo texto; cancelar
+        # una (cliente que se desconecta, wait_for) no debe cancelarlo para las demás
+        return await asyncio.shield(asyncio.wrap_future(fut))
+
+    def encode_batch(self, queries: List[str]) -> np.ndarray:
+        """(n, d) para una lista de consultas: las que no están en caché van en un solo model.encode."""
+        texts = [normalize_query(q) for q in queries]
+        vecs: Dict[str, np.ndarray] = {}
+        for t in texts:
+            v = self.cache.get((self.model_name, self.prefix, t))
+            if v is not None:
+                vecs[t] = v
+        missing = sorted({t for t in texts if t not in vecs})
+        if missing:
+            for t, v in zip(missing, self._encode_many(missing)):
+                v.setflags(write=False)
+                self.cache.put((self.model_name, self.prefix, t), v)
+                vecs[t] = v
+        return np.stack([vecs[t] for t in texts])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "cache": self.cache.stats(),
+            "batching": self.batcher.stats() if self.batcher is not None else None,
+        }
@@ -0,0 +1,91 @@
+# ranking.py — Candidatos por tabla y mezcla global de /search (semantic, lexical, hybrid)
+import heapq
+import os
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bm25_index import BM25Index
+from metadata_filter import Filtros
+from metrics import timed
+from vector_index import TableIndex
+
+# Modo híbrido (fusión por rango recíproco)
+RRF_K = int(os.getenv("RRF_K", "60"))
+RRF_DEPTH = int(os.getenv("RRF_DEPTH", "100"))   # candidatos por señal antes de fusionar
+
+
+# Un "hit" es (puntaje de rango, tabla, id, fila en la matriz o -1, coseno, score auxiliar)
+def table_hits(tname: str, idx: Optional[TableIndex], bm25: Optional[BM25Index], q_vec: Optional[np.ndarray],
+               query: str, limit: int, probe: Optional[int], mode: str, filtros: Filtros = Filtros()):
+    """
+    Candidatos de una tabla. semantic y lexical: lista de hits con puntajes comparables entre tablas
+    (coseno; BM25 dividido entre su máximo alcanzable en la tabla). hybrid: (hits semánticos, hits
+    léxicos) de hasta RRF_DEPTH cada uno, que fuse_hybrid combina ya con todas las tablas juntas.
+    """
+    vacio = ([], []) if mode == "hybrid" else []
+    allowed = allowed_ids = None
+    if filtros:
+        # Sin metadatos cargados no hay forma de verificar el filtro: la tabla no aporta resultados
+        if idx is None or idx.filters is None:
+            return vacio
+        allowed = idx.filters.mask(filtros)
+        if not allowed.any():
+            return vacio
+        allowed_ids = idx.ids[allowed]
+
+    if mode == "semantic":
+        rows, sims = idx.search_topk(q_vec, limit, probe, allowed)
+        return [(s, tname, int(idx.ids[r]), r, s, None) for r, s in zip(rows.tolist(), sims.tolist())]
+
+    if mode == "lexical":
+        with timed("lexical", tname):
+            lex_ids, lex_scores = bm25.search(query, limit, allowed_ids)
+            norm = lex_scores / max(bm25.max_score(query), 1e-9)
+        rows = idx.rows_for_ids(lex_ids) if idx is not None else np.full(lex_ids.shape, -1)
+        return [(b, tname, int(i), int(r), 0.0, b) for i, r, b in zip(lex_ids, rows, norm.tolist())]
+
+    # hybrid: cada señal por separado; el RRF se calcula sobre los rangos globales
+    depth = max(limit, RRF_DEPTH)
+    sem: List[tuple] = []
+    if idx is not None and idx.size > 0:
+        rows, sims = idx.search_topk(q_vec, depth, probe, allowed)
+        sem = [(s, tname, int(idx.ids[r]), r, s, None) for r, s in zip(rows.tolist(), sims.tolist())]
+    if bm25 is None:
+        return sem, []
+    with timed("lexical", tname):
+        lex_ids, lex_scores = bm25.search(query, depth, allowed_ids)
+        norm = lex_scores / max(bm25.max_score(query), 1e-9)
+    rows = idx.rows_for_ids(lex_ids) if idx is not None else np.full(lex_ids.shape, -1)
+    # Coseno de los candidatos léxicos, por si ganan sin venir de la señal semántica
+    cos = np.zeros(lex_ids.shape, dtype=np.float32)
+    if idx is not None and (rows >= 0).any():
+        cos[rows >= 0] = idx.exact_scores(q_vec, rows[rows >= 0])
+    lex = [(b, tname, int(i), int(r), float(c), b)
+           for i, r, b, c in zip(lex_ids.tolist(), rows.tolist(), norm.tolist(), cos.tolist())]
+    return sem, lex
+
+
+def fuse_hybrid(per_table: List[Tuple[List[tuple], List[tuple]]], limit: int) -> List[tuple]:
+    """
+    RRF global: cada señal se ordena con los candidatos de todas las tablas juntos (coseno y BM25
+    normalizado son comparables entre tablas) y los rangos se fusionan una sola vez. Con un RRF por
+    tabla, el primero de cada tabla empataba con los de las demás y el resultado alternaba tablas.
+    """
+    depth = max(limit, RRF_DEPTH)
+    rrf: Dict[Tuple[str, int], float] = {}
+    hits: Dict[Tuple[str, int], tuple] = {}
+    for senal in (0, 1):
+        todos = heapq.merge(*(t[senal] for t in per_table), key=lambda h: h[0], reverse=True)
+        for rank, h in enumerate(islice(todos, depth)):
+            key = (h[1], h[2])
+            rrf[key] = rrf.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            hits.setdefault(key, h)  # la semántica va primero: su fila y coseno mandan
+    top = heapq.nlargest(limit, rrf.items(), key=lambda kv: kv[1])
+    return [(sc, tname, i, hits[(tname, i)][3], hits[(tname, i)][4], sc) for (tname, i), sc in top]
+
+
+def merge_hits(per_table: List[List[tuple]], limit: int) -> List[tuple]:
+    """Mezcla con heap de listas ya ordenadas por un puntaje comparable entre tablas (semantic, lexical)."""
+    return list(islice(heapq.merge(*per_table, key=lambda h: h[0], reverse=True), limit))
@@ -0,0 +1,113 @@
+# snapshot.py — Snapshots por tabla (.npy float32 + sidecar de ids) para np.load(mmap_mode="r")
+import hashlib
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def snapshot_paths(snapshot_dir: str, table: str) -> Tuple[str, str]:
+    """(matriz, ids): la fila i de `<tabla>.npy` corresponde a `<tabla>.ids.npy[i]`."""
+    return (
+        os.path.join(snapshot_dir, f"{table}.npy"),
+        os.path.join(snapshot_dir, f"{table}.ids.npy"),
+    )
+
+
+FINGERPRINT_SAMPLE_ROWS = 256
+
+
+def content_fingerprint(ids: np.ndarray, matrix: np.ndarray, sample: int = FINGERPRINT_SAMPLE_ROWS) -> str:
+    """
+    md5 de los ids, la forma y una muestra espaciada de filas de `matrix`. A diferencia de solo los
+    ids, cambia cuando se vuelven a generar embeddings en su lugar (make_embeddings --all); leer la
+    muestra de un mmap cuesta unas cuantas páginas. Cambios aislados fuera de la muestra no se ven.
+    """
+    h = hashlib.md5(np.ascontiguousarray(ids, dtype=np.int64).tobytes())
+    h.update(f"{matrix.shape}:{matrix.dtype}".encode())
+    n = int(matrix.shape[0])
+    if n:
+        rows = np.unique(np.linspace(0, n - 1, min(n, sample)).astype(np.int64))
+        h.update(np.ascontiguousarray(matrix[rows]).tobytes())
+    return h.hexdigest()
+
+
+def _save_atomic(path: str, arr: np.ndarray):
+    # Escribe a un temporal y renombra: los workers nunca ven un archivo a medias
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def write_snapshot(snapshot_dir: str, table: str, ids: np.ndarray, matrix: np.ndarray):
+    if matrix.shape[0] != ids.shape[0]:
+        raise ValueError(f"{table}: {matrix.shape[0]} vectores pero {ids.shape[0]} ids")
+    os.makedirs(snapshot_dir, exist_ok=True)
+    m_path, ids_path = snapshot_paths(snapshot_dir, table)
+    # Primero la matriz y al final los ids: un snapshot "completo" siempre tiene ambos
+    _save_atomic(m_path, np.ascontiguousarray(matrix, dtype=np.float32))
+    _save_atomic(ids_path, np.asarray(ids, dtype=np.int64))
+
+
+def load_snapshot(snapshot_dir: str, table: str, mmap: bool = True) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Devuelve (ids, matrix) o None si no hay snapshot para la tabla.
+    Con mmap=True la matriz queda en el page cache compartido entre procesos.
+    """
+    m_path, ids_path = snapshot_paths(snapshot_dir, table)
+    if not (os.path.exists(m_path) and os.path.exists(ids_path)):
+        return None
+    matrix = np.load(m_path, mmap_mode="r" if mmap else None)
+    ids = np.load(ids_path)
+    if matrix.ndim != 2 or matrix.shape[0] != ids.shape[0]:
+        print(f"[WARN] Snapshot inconsistente para {table}; se ignora.")
+        return None
+    return ids, matrix
+
+
+def quantized_paths(snapshot_dir: str, table: str, kind: str) -> Tuple[str, str]:
+    """(códigos, escalas) de la versión cuantizada: <tabla>.<kind>.npy y <tabla>.<kind>.scale.npy."""
+    return (
+        os.path.join(snapshot_dir, f"{table}.{kind}.npy"),
+        os.path.join(snapshot_dir, f"{table}.{kind}.scale.npy"),
+    )
+
+
+def _fingerprint_path(snapshot_dir: str, table: str, kind: str) -> str:
+    return os.path.join(snapshot_dir, f"{table}.{kind}.fingerprint")
+
+
+def write_quantized(snapshot_dir: str, table: str, kind: str, codes: np.ndarray,
+                    scales: Optional[np.ndarray] = None, fingerprint: str = ""):
+    """`fingerprint`: content_fingerprint del float32 del que salieron los códigos."""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    c_path, s_path = quantized_paths(snapshot_dir, table, kind)
+    if scales is not None:
+        _save_atomic(s_path, np.asarray(scales, dtype=np.float32))
+    _save_atomic(c_path, np.ascontiguousarray(codes))
+    fp_path = _fingerprint_path(snapshot_dir, table, kind)
+    with open(fp_path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(fingerprint)
+    os.replace(fp_path + ".tmp", fp_path)
+
+
+def load_quantized(snapshot_dir: str, table: str, kind: str, fingerprint: Optional[str] = None,
+                   mmap: bool = True) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+    """
+    (códigos, escalas|None) o None si no se exportó esa versión. Con `fingerprint`, también None
+    si los códigos se generaron desde otros vectores (snapshot regenerado, filas re-embebidas o
+    borradas e insertadas con el mismo total): alineados por posición, darían candidatos equivocados.
+    """
+    c_path, s_path = quantized_paths(snapshot_dir, table, kind)
+    if not os.path.exists(c_path):
+        return None
+    if fingerprint is not None:
+        fp_path = _fingerprint_path(snapshot_dir, table, kind)
+        stored = open(fp_path, encoding="utf-8").read().strip() if os.path.exists(fp_path) else ""
+        if stored != fingerprint:
+            print(f"[WARN] {c_path} no corresponde al snapshot actual; se recalcula desde float32.")
+            return None
+    codes = np.load(c_path, mmap_mode="r" if mmap else None)
+    scales = np.load(s_path) if os.path.exists(s_path) else None
+    return codes, scales
@@ -0,0 +1,123 @@
+# table_config.py — Esquema por tabla compartido por la API y el pipeline de embeddings
+from dataclasses import dataclass
+from typing import List, Optional, Dict
+
+
+@dataclass
+class TableConf:
+    table: str
+    id_col: str
+    text_col: str
+    embed_cols: List[str]                 # se tomará el primero NO nulo
+    ruta_col: Optional[str] = None
+    id_doc_col: Optional[str] = None
+    title_col: Optional[str] = None
+    date_col: Optional[str] = None
+
+# Ajusta estas configs a tu esquema real
+TABLE_CONFIGS: Dict[str, TableConf] = {
+    # ---- DOCUMENTOS ----
+    "documentos": TableConf(
+        table="documentos",
+        id_col="id_documento",
+        text_col="nombre_regulacion",                 # Texto a mostrar
+        embed_cols=["embedding_completo"],            # Embedding del documento
+        ruta_col="ruta_archivo",
+        title_col="nombre_regulacion",
+        date_col="fecha_publicacion",
+    ),
+    # ---- MODIFICACIONES ----
+    "modificaciones": TableConf(
+        table="modificaciones",
+        id_col="id_modificacion",
+        id_doc_col="id_documento",
+        text_col="texto_modificacion",
+        embed_cols=["embedding_texto_modificacion"],  # Embedding por fragmento
+        ruta_col="ruta_archivo",
+        title_col="nombre_regulacion",
+        date_col="fecha_publicacion",
+    ),
+    # ---- ANEXOS ----
+    # Estructura dada:
+    # id_anexo, id_documento, nombre_anexo, texto_anexo, ruta_archivo,
+    # embedding_completo, embedding_texto
+    "anexos": TableConf(
+        table="anexos",
+        id_col="id_anexo",
+        id_doc_col="id_documento",
+        text_col="texto_anexo",
+        embed_cols=["embedding_texto", "embedding_completo"],  # intenta texto, luego completo
+        ruta_col="ruta_archivo",
+        title_col="nombre_anexo",
+        date_col=None,
+    ),
+    # ---- ARTICULOS ----
+    # id_articulo, id_documento, numero_articulo, texto_articulo, embedding_articulo
+    "articulos": TableConf(
+        table="articulos",
+        id_col="id_articulo",
+        id_doc_col="id_documento",
+        text_col="texto_articulo",
+        embed_cols=["embedding_articulo"],
+        ruta_col=None,
+        title_col="numero_articulo",  # se mostrará como "Título"
+        date_col=None,
+    ),
+}
+
+
+def _select_parts(conf: TableConf, with_meta: bool, with_embeddings: bool) -> List[str]:
+    # Lista de pares (no dict): una columna puede tener dos alias (documentos: texto == título)
+    base_cols = [(conf.id_col, "_id")]
+    if with_meta:
+        base_cols.append((conf.text_col, "_text"))
+        if conf.ruta_col:    base_cols.append((conf.ruta_col, "_ruta"))
+        if conf.id_doc_col:  base_cols.append((conf.id_doc_col, "_id_doc"))
+        if conf.title_col:   base_cols.append((conf.title_col, "_title"))
+        if conf.date_col:    base_cols.append((conf.date_col, "_date"))
+
+    select_parts = [f"{col} AS {alias}" for col, alias in base_cols]
+    if with_embeddings:
+        select_parts += [f"{col} AS _emb{i}" for i, col in enumerate(conf.embed_cols)]
+    return select_parts
+
+
+def select_sql(conf: TableConf, with_meta: bool = True, with_embeddings: bool = True) -> str:
+    """
+    SELECT con aliases genéricos: _id, _text, _ruta, _id_doc, _title, _date y
+    _emb0, _emb1, ... (uno por columna de embedding, en orden de preferencia).
+    """
+    return f"""
+        SELECT {', '.join(_select_parts(conf, with_meta, with_embeddings))}
+        FROM {conf.table}
+        WHERE {conf.text_col} IS NOT NULL
+          AND ({' OR '.join([f'{c} IS NOT NULL' for c in conf.embed_cols])})
+    """
+
+
+def select_by_ids_sql(conf: TableConf, n_ids: int, with_meta: bool = True,
+                      with_embeddings: bool = False) -> str:
+    """Por defecto, campos de despliegue (sin embeddings) para `n_ids` ids: un solo WHERE id IN (...)."""
+    placeholders = ",".join(["%s"] * n_ids)
+    return f"""
+        SELECT {', '.join(_select_parts(conf, with_meta, with_embeddings))}
+        FROM {conf.table}
+        WHERE {conf.id_col} IN ({placeholders})
+    """
+
+
+# Atributos de documento usados como filtros (se heredan a articulos/modificaciones/anexos por id_documento)
+DOC_FILTER_COLS = ["tipo_de_ordenamiento", "ambito_aplicacion", "emisor", "fecha_publicacion"]
+
+
+def select_doc_attrs_sql() -> str:
+    return f"SELECT id_documento AS _id_doc, {', '.join(DOC_FILTER_COLS)} FROM documentos"
+
+
+def select_filter_sql(conf: TableConf) -> str:
+    """Columnas angostas para los filtros: _id, _id_doc y la fecha propia de la tabla (_date) si la tiene."""
+    # documentos no tiene id_doc_col: su propio id es el id_documento
+    cols = [f"{conf.id_col} AS _id", f"{conf.id_doc_col or conf.id_col} AS _id_doc"]
+    if conf.date_col:
+        cols.append(f"{conf.date_col} AS _date")
+    return f"SELECT {', '.join(cols)} FROM {conf.table}"
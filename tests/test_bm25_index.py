@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+
+from bm25_index import BM25Index, bm25_path, load_and_update
+from db_sqlite import SQLiteConnection, init_schema
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "bd.sqlite3")
+    init_schema(path)
+    cn = SQLiteConnection(path, readonly=False)
+    cn._cn.execute("INSERT INTO documentos (id_documento) VALUES (1)")
+    cn._cn.executemany(
+        "INSERT INTO articulos (id_articulo, id_documento, texto_articulo) VALUES (?, 1, ?)",
+        [(1, "licencia de construcción"), (2, "permiso ambiental"), (3, "impuesto predial")],
+    )
+    cn.commit()
+    yield cn, lambda: SQLiteConnection(path, readonly=False)
+    cn.close()
+
+
+def _load(tmp_path, get_conn) -> BM25Index:
+    return load_and_update(str(tmp_path / "bm25"), "articulos", "id_articulo", "texto_articulo", get_conn)
+
+
+def _hits(idx: BM25Index, query: str) -> list:
+    return idx.search(query, k=10)[0].tolist()
+
+
+def test_edited_and_deleted_rows_are_resynced(tmp_path, db):
+    cn, get_conn = db
+    assert _hits(_load(tmp_path, get_conn), "licencia") == [1]
+
+    cn._cn.execute("UPDATE articulos SET texto_articulo = 'licencia de funcionamiento' WHERE id_articulo = 2")
+    cn._cn.execute("UPDATE articulos SET texto_articulo = 'tarifa de agua' WHERE id_articulo = 1")
+    cn._cn.execute("DELETE FROM articulos WHERE id_articulo = 3")
+    cn.commit()
+
+    idx = _load(tmp_path, get_conn)
+    assert _hits(idx, "licencia") == [2]
+    assert _hits(idx, "ambiental") == []
+    assert _hits(idx, "predial") == []
+    assert _hits(idx, "tarifa") == [1]
+    assert sorted(idx.doc_ids.tolist()) == [1, 2] and idx.n_docs == 2
+
+
+def test_unchanged_table_does_not_rewrite_index(tmp_path, db):
+    _, get_conn = db
+    _load(tmp_path, get_conn)
+    path = bm25_path(str(tmp_path / "bm25"), "articulos")
+    mtime = os.stat(path).st_mtime_ns
+    _load(tmp_path, get_conn)
+    assert os.stat(path).st_mtime_ns == mtime
+
+
+def test_remove_documents_matches_fresh_build():
+    docs = {1: "licencia de construcción", 2: "licencia ambiental", 3: "permiso de construcción"}
+    idx = BM25Index.empty()
+    idx.add_documents(docs.items())
+    idx.remove_documents(np.array([2]))
+    fresh = BM25Index.empty()
+    fresh.add_documents((i, t) for i, t in docs.items() if i != 2)
+    for q in ("licencia", "construcción", "ambiental"):
+        got, want = idx.search(q, k=5), fresh.search(q, k=5)
+        assert got[0].tolist() == want[0].tolist()
+        np.testing.assert_allclose(got[1], want[1])
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+import db_aio
+from db_aio import AsyncConnectionPool
+
+
+class _Cursor:
+    async def execute(self, sql, params=None):
+        pass
+
+    async def fetchall(self):
+        return [{"uno": 1}]
+
+    async def close(self):
+        pass
+
+
+class _Conn:
+    def __init__(self, ping_delay: float = 0.0):
+        self.ping_delay = ping_delay
+        self.closed = False
+
+    async def cursor(self, dictionary=False):
+        return _Cursor()
+
+    async def ping(self, reconnect=False):
+        await asyncio.sleep(self.ping_delay)
+
+    async def close(self):
+        self.closed = True
+
+
+class _SlowConnector:
+    """Sustituye a mysql.connector.aio: connect tarda `delay` segundos."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def connect(self, **cfg):
+        await asyncio.sleep(self.delay)
+        return _Conn()
+
+
+async def _cancel_after(coro, delay: float):
+    task = asyncio.ensure_future(coro)
+    await asyncio.sleep(delay)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+def test_cancel_during_connect_releases_permit(monkeypatch):
+    async def run():
+        pool = AsyncConnectionPool({}, size=2, timeout_s=0.5, ping=False)
+        monkeypatch.setattr(db_aio, "mysql_aio", _SlowConnector(1.0))
+        for _ in range(pool.size + 1):
+            await _cancel_after(pool.fetch_all("SELECT 1"), 0.01)
+        assert pool._sem._value == pool.size
+        assert pool.stats()["open"] == 0
+
+        monkeypatch.setattr(db_aio, "mysql_aio", _SlowConnector(0.0))
+        assert await pool.fetch_all("SELECT 1") == [{"uno": 1}]
+
+    asyncio.run(run())
+
+
+def test_cancel_during_ping_drops_idle_connection(monkeypatch):
+    async def run():
+        pool = AsyncConnectionPool({}, size=1, timeout_s=0.5, ping=True)
+        monkeypatch.setattr(db_aio, "mysql_aio", _SlowConnector(0.0))
+        await pool.fetch_all("SELECT 1")
+        raw, _ = pool._idle[0]
+        raw.ping_delay = 1.0
+
+        await _cancel_after(pool.fetch_all("SELECT 1"), 0.01)
+        await asyncio.sleep(0)  # deja correr el cierre diferido
+        assert raw.closed
+        assert pool.stats()["open"] == 0 and pool.stats()["idle"] == 0
+        assert await pool.fetch_all("SELECT 1") == [{"uno": 1}]
+        assert pool.stats()["open"] == 1
+
+    asyncio.run(run())
@@ -0,0 +1,27 @@
+import json
+
+import numpy as np
+
+from app.search import decode_embeddings
+
+
+def test_json_returned_as_bytes_is_parsed_as_json():
+    # Columna sin migrar que el driver entrega como bytes (JSON en BLOB / VARBINARY)
+    v = np.array([0.5, -0.25, 0.125], dtype=np.float32)
+    M, valid = decode_embeddings([json.dumps(v.tolist()).encode()] * 2)
+    assert valid.tolist() == [0, 1]
+    assert np.allclose(M, v)
+
+
+def test_mixed_blob_and_json_rows():
+    v = np.array([1.0, 2.0, 3.0, 4.0], dtype=np.float32)
+    M, valid = decode_embeddings([v.tobytes(), json.dumps(v.tolist()).encode(), json.dumps(v.tolist())])
+    assert valid.tolist() == [0, 1, 2]
+    assert np.allclose(M, v)
+
+
+def test_float32_blobs_use_bulk_path():
+    X = np.random.default_rng(0).standard_normal((5, 8)).astype(np.float32)
+    M, valid = decode_embeddings([row.tobytes() for row in X])
+    assert valid.tolist() == list(range(5))
+    assert np.array_equal(M, X)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import ivf_index
+from ivf_index import IVFIndex, load_or_build
+
+
+def _matrix(n: int = 500, dim: int = 16, seed: int = 0) -> np.ndarray:
+    X = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return X / np.linalg.norm(X, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Cuenta las construcciones de IVF (las cargas desde disco no cuentan)."""
+    calls = []
+    build = IVFIndex.build.__func__
+
+    def counting(cls, X, *args, **kwargs):
+        calls.append(1)
+        return build(cls, X, *args, **kwargs)
+
+    monkeypatch.setattr(ivf_index.IVFIndex, "build", classmethod(counting))
+    return calls
+
+
+def test_reuses_index_for_same_rows_and_source(tmp_path, builds):
+    X, ids = _matrix(), np.arange(500, dtype=np.int64)
+    load_or_build(str(tmp_path), "articulos", ids, X, nlist=8)
+    load_or_build(str(tmp_path), "articulos", ids, X, nlist=8)
+    assert len(builds) == 1
+
+
+def test_rebuilds_when_training_source_changes(tmp_path, builds):
+    # Un IVF entrenado con códigos decuantizados no debe reutilizarse al volver a float32
+    X, ids = _matrix(), np.arange(500, dtype=np.int64)
+    load_or_build(str(tmp_path), "articulos", ids, np.sign(X), nlist=8, source="binary")
+    ivf = load_or_build(str(tmp_path), "articulos", ids, X, nlist=8)
+    assert len(builds) == 2
+    assert IVFIndex.load(str(tmp_path / "articulos.ivf.npz")).fingerprint == ivf.fingerprint
+    assert ivf.fingerprint.endswith(":float32")
+
+
+def test_rebuilds_when_vectors_are_reembedded_in_place(tmp_path, builds):
+    # Mismos ids, vectores nuevos (make_embeddings --all): los centroides viejos ya no sirven
+    ids = np.arange(500, dtype=np.int64)
+    load_or_build(str(tmp_path), "articulos", ids, _matrix(seed=0), nlist=8)
+    load_or_build(str(tmp_path), "articulos", ids, _matrix(seed=1), nlist=8)
+    assert len(builds) == 2
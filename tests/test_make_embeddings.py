@@ -0,0 +1,200 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from db_sqlite import SQLiteConnection, init_schema
+
+pytest.importorskip("sentence_transformers")  # make_embeddings lo importa (sin cargar modelo)
+import make_embeddings as me  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "bd.sqlite3")
+    init_schema(path)
+    cn = SQLiteConnection(path, readonly=False)
+    cn._cn.execute("INSERT INTO documentos (id_documento) VALUES (1)")
+    # Ids con huecos; la mitad ya tiene embedding
+    cn._cn.executemany(
+        "INSERT INTO articulos (id_articulo, id_documento, texto_articulo, embedding_articulo) VALUES (?, 1, ?, ?)",
+        [(i, f"artículo {i} " * (1 + i % 7), b"x" if i % 2 else None) for i in range(3, 300, 3)],
+    )
+    cn.commit()
+    yield cn, path
+    cn.close()
+
+
+def _pending(cn) -> list:
+    cur = cn.cursor()
+    cur.execute("SELECT id_articulo FROM articulos WHERE embedding_articulo IS NULL ORDER BY id_articulo")
+    ids = [r[0] for r in cur.fetchall()]
+    cur.close()
+    return ids
+
+
+def test_keyset_visits_every_pending_row_while_predicate_shrinks(db):
+    cn, _ = db
+    expected = _pending(cn)
+    where = me.build_where(True, "embedding_articulo")
+    seen = []
+    for rows in me.iter_keyset(cn, "articulos", "id_articulo", ["texto_articulo"], where, batch=7):
+        assert len(rows) <= 7
+        seen.extend(r[0] for r in rows)
+        # Como el escritor: llenar los NULL saca esas filas del predicado (con OFFSET se saltarían filas)
+        cn.cursor().executemany("UPDATE articulos SET embedding_articulo = ? WHERE id_articulo = ?",
+                                [(b"v", r[0]) for r in rows])
+        cn.commit()
+    assert seen == expected
+    assert _pending(cn) == []
+
+
+def test_keyset_with_extra_condition_and_without_where(db):
+    cn, _ = db
+    where = me.build_where(True, "embedding_articulo", "id_articulo > 100")
+    ids = [r[0] for rows in me.iter_keyset(cn, "articulos", "id_articulo", [], where, batch=4) for r in rows]
+    assert ids == [i for i in _pending(cn) if i > 100]
+    everything = [r for rows in me.iter_keyset(cn, "articulos", "id_articulo", ["texto_articulo"], "", batch=50)
+                  for r in rows]
+    assert [r[0] for r in everything] == list(range(3, 300, 3))
+    assert all(len(r) == 2 for r in everything)
+
+
+class _Model:
+    """Vector determinista por texto; `fail_on` simula un error del modelo."""
+
+    max_seq_length = 512
+
+    def __init__(self, fail_on: str = ""):
+        self.fail_on = fail_on
+        self.batches = []
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=True):
+        if self.fail_on and any(self.fail_on in t for t in texts):
+            raise RuntimeError("CUDA out of memory")
+        self.batches.append(len(texts))
+        return np.array([_vec(t) for t in texts], dtype=np.float32)
+
+
+def _vec(text: str) -> list:
+    return [len(text), sum(map(ord, text)) % 997, text.count("o")]
+
+
+@pytest.fixture
+def pipeline_env(db, monkeypatch, tmp_path):
+    cn, path = db
+    monkeypatch.setattr("generation.GENERATION_FILE", str(tmp_path / "generation"))
+    monkeypatch.setattr(me, "connect_db", lambda: SQLiteConnection(path, readonly=False))
+    monkeypatch.setattr(me, "_tuner", None)
+    for key, value in {"DB_BATCH": 5, "QUEUE_DEPTH": 1, "ENC_WINDOW": 8, "PDF_WORKERS": 2,
+                       "CHUNK_CHARS": 40, "CHUNK_OVERLAP": 5, "ENC_AUTOTUNE": False, "ONLY_NULLS": True}.items():
+        monkeypatch.setitem(me.CONFIG, key, value)
+    return cn
+
+
+def _run(fn, timeout: float = 10.0):
+    # Un pipeline que no se apaga colgaría la prueba: corre en un hilo con límite de tiempo
+    out = {}
+
+    def target():
+        try:
+            out["value"] = fn()
+        except BaseException as e:
+            out["error"] = e
+
+    th = threading.Thread(target=target, daemon=True)
+    th.start()
+    th.join(timeout)
+    assert not th.is_alive(), "el pipeline no terminó"
+    return out
+
+
+def test_embed_field_writes_mean_of_chunks_for_each_pending_row(pipeline_env):
+    cn = pipeline_env
+    cur = cn.cursor()
+    cur.execute("SELECT id_articulo, texto_articulo, embedding_articulo FROM articulos")
+    before = {i: (t, e) for i, t, e in cur.fetchall()}
+    pending = _pending(cn)
+
+    out = _run(lambda: me.embed_field(_Model(), cn, "articulos", "id_articulo", "embedding_articulo",
+                                      ["texto_articulo"], me._clean))
+    assert "error" not in out
+    cur.execute("SELECT id_articulo, embedding_articulo FROM articulos")
+    for i, blob in cur.fetchall():
+        if i not in pending:
+            assert blob == before[i][1]  # filas ya embebidas no se tocan
+            continue
+        chunks = me.chunk_text(before[i][0], me.CONFIG["MAX_CHARS"], 40, 5)
+        want = np.mean([_vec(me.preprocess_for_e5(c)) for c in chunks], axis=0)
+        np.testing.assert_allclose(np.frombuffer(blob, dtype=np.float32), want, rtol=1e-6)
+    cur.close()
+
+
+@pytest.mark.parametrize("stage", ["prep", "encoder"])
+def test_stage_error_propagates_and_shuts_down(pipeline_env, stage):
+    cn = pipeline_env
+
+    def to_text(txt):
+        if stage == "prep" and "artículo 150 " in txt:
+            raise ValueError("PDF ilegible")
+        return me._clean(txt)
+
+    model = _Model(fail_on="artículo 150 " if stage == "encoder" else "")
+    out = _run(lambda: me.embed_field(model, cn, "articulos", "id_articulo", "embedding_articulo",
+                                      ["texto_articulo"], to_text))
+    assert isinstance(out.get("error"), ValueError if stage == "prep" else RuntimeError)
+    assert not [th for th in threading.enumerate() if th.name.startswith("embed-")]
+    assert 150 in _pending(cn)  # lo que falló no se marcó como hecho
+
+
+def test_pipeline_failure_unblocks_stage_waiting_on_full_queue():
+    pipe = me.Pipeline(depth=1)
+    q = pipe.queue()
+    st = me.StageStats("lector")
+
+    def producer():
+        while True:
+            pipe.put(q, 1, st)  # nadie consume: se queda esperando hasta que otra etapa falle
+
+    def consumer():
+        time.sleep(0.1)
+        raise KeyError("falló")
+
+    pipe.spawn("producer", producer)
+    pipe.spawn("consumer", consumer)
+    out = _run(pipe.join, timeout=5)
+    assert isinstance(out.get("error"), KeyError)
+    assert pipe.stop.is_set() and st.wait_out > 0
+
+
+class _Tokenizer:
+    def __call__(self, texts, add_special_tokens=True, truncation=True, max_length=512):
+        return {"input_ids": [[0] * min(len(t.split()) + 2, max_length) for t in texts]}
+
+
+@pytest.mark.parametrize("tokenizer", [None, _Tokenizer()])
+def test_encode_bucketed_returns_vectors_in_original_order(tokenizer):
+    rng = np.random.default_rng(5)
+    texts = [" ".join(f"palabra{j}" for j in range(n)) for n in rng.integers(1, 200, size=97)]
+    model = _Model()
+    if tokenizer is not None:
+        model.tokenizer = tokenizer
+    tuner = me.BatchTuner(budget=600, lo=100, hi=1000, enabled=False)
+
+    out = me.encode_bucketed(model, texts, tuner)
+    np.testing.assert_array_equal(out, np.array([_vec(t) for t in texts], dtype=np.float32))
+    assert len(model.batches) > 1 and sum(model.batches) == len(texts)
+    assert tuner.padded >= tuner.tokens == int(me.token_lengths(model, texts).sum())
+
+
+def test_batches_partition_longest_first_within_budget():
+    lengths = np.random.default_rng(9).integers(1, 512, size=300)
+    batches = me.BatchTuner(budget=2048, lo=512, hi=4096).batches(lengths)
+    flat = np.concatenate(batches)
+    assert sorted(flat.tolist()) == list(range(300))
+    firsts = [int(lengths[b[0]]) for b in batches]
+    assert firsts == sorted(firsts, reverse=True)
+    for b in batches:
+        assert int(lengths[b].max()) == int(lengths[b[0]])
+        assert len(b) == 1 or len(b) * int(lengths[b[0]]) <= 2048
@@ -0,0 +1,104 @@
+import datetime
+import random
+
+import numpy as np
+import pytest
+
+import metadata_filter
+from metadata_filter import Filtros, _Categorical, build_filter_index
+
+TIPOS = ["Ley", "Reglamento", "Acuerdo", "Decreto"]
+AMBITOS = ["Federal", "Estatal", "Municipal"]
+EMISORES = [f"Emisor {i}" for i in range(100)]  # más de BITMAP_MAX_VALUES: postings CSR
+BASE = datetime.date(2000, 1, 1)
+
+
+def _corpus(seed: int = 3, n_docs: int = 200, n_rows: int = 600):
+    rnd = random.Random(seed)
+    docs = {
+        d: {"tipo_de_ordenamiento": rnd.choice(TIPOS + [None]),
+            "ambito_aplicacion": rnd.choice(AMBITOS),
+            "emisor": rnd.choice(EMISORES),
+            "fecha_publicacion": rnd.choice([None, BASE + datetime.timedelta(days=rnd.randrange(9000))])}
+        for d in range(1, n_docs + 1)
+    }
+    rows = []
+    for i in range(n_rows):
+        r = {"_id": 1000 + i, "_id_doc": rnd.randrange(1, n_docs + 1)}
+        if rnd.random() < 0.3:
+            r["_date"] = BASE + datetime.timedelta(days=rnd.randrange(9000))
+        rows.append(r)
+    # Ids en otro orden que la BD y uno sin registro: la máscara sigue el orden de la matriz
+    ids = np.array([r["_id"] for r in rows][::-1] + [99999], dtype=np.int64)
+    return ids, rows, docs, rnd
+
+
+def _brute(ids, rows, docs, f: Filtros) -> np.ndarray:
+    by_id = {r["_id"]: r for r in rows}
+
+    def keep(_id) -> bool:
+        r = by_id.get(int(_id))
+        if r is None:
+            return False
+        doc = docs[r["_id_doc"]]
+        for name in ("tipo_de_ordenamiento", "ambito_aplicacion", "emisor"):
+            wanted = getattr(f, name)
+            if wanted and (doc[name] or "").casefold() not in {w.strip().casefold() for w in wanted}:
+                return False
+        if f.id_documento and r["_id_doc"] not in f.id_documento:
+            return False
+        d = r.get("_date") or doc["fecha_publicacion"]
+        if f.fecha_desde and (d is None or d < f.fecha_desde):
+            return False
+        if f.fecha_hasta and (d is None or d > f.fecha_hasta):
+            return False
+        return True
+
+    return np.array([keep(i) for i in ids.tolist()], dtype=bool)
+
+
+def _random_filter(rnd: random.Random) -> Filtros:
+    def some(values, p=0.5):
+        return tuple(rnd.sample(values, rnd.randint(1, 3))) if rnd.random() < p else ()
+
+    desde = BASE + datetime.timedelta(days=rnd.randrange(9000)) if rnd.random() < 0.4 else None
+    hasta = BASE + datetime.timedelta(days=rnd.randrange(9000)) if rnd.random() < 0.4 else None
+    return Filtros(
+        tipo_de_ordenamiento=tuple(t.upper() + " " for t in some(TIPOS)),  # sin distinguir mayúsculas
+        ambito_aplicacion=some(AMBITOS),
+        emisor=some(EMISORES + ["No existe"]),
+        id_documento=some(list(range(1, 205)), p=0.3),
+        fecha_desde=desde,
+        fecha_hasta=hasta,
+    )
+
+
+def test_mask_matches_brute_force():
+    ids, rows, docs, rnd = _corpus()
+    fi = build_filter_index(ids, rows, docs)
+    assert fi.categorical["tipo_de_ordenamiento"].bitmaps is not None
+    assert fi.categorical["emisor"].bitmaps is None
+    assert fi.mask(Filtros()) is None
+    for _ in range(300):
+        f = _random_filter(rnd)
+        if not f:
+            continue
+        np.testing.assert_array_equal(fi.mask(f), _brute(ids, rows, docs, f), err_msg=repr(f))
+
+
+@pytest.mark.parametrize("n", [1, 7, 8, 9, 333])
+def test_bitmap_and_postings_agree(n):
+    rng = np.random.default_rng(n)
+    column = [None if v < 0 else f"v{v}" for v in rng.integers(-1, 6, size=n).tolist()]
+    bitmaps = _Categorical.from_values(column, bitmaps=True)
+    postings = _Categorical.from_values(column, bitmaps=False)
+    for wanted in (["v0"], ["v1", "V2 "], ["nada"], [f"v{i}" for i in range(6)]):
+        expected = np.array([v is not None and v in {w.strip().lower() for w in wanted} for v in column])
+        np.testing.assert_array_equal(bitmaps.mask(wanted), expected)
+        np.testing.assert_array_equal(postings.mask(wanted), expected)
+
+
+def test_threshold_picks_representation(monkeypatch):
+    monkeypatch.setattr(metadata_filter, "BITMAP_MAX_VALUES", 2)
+    assert _Categorical.from_values(["a", "b"]).bitmaps is not None
+    assert _Categorical.from_values(["a", "b", "c"]).bitmaps is None
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from executors import Saturated
+from query_encoder import QueryEncoder
+
+
+class _Model:
+    """encode determinista (longitud del texto) que tarda `delay` segundos."""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.sizes = []
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True):
+        self.calls += 1
+        self.sizes.append(len(texts))
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("encode falló")
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+
+class _SaturatedExecutor:
+    def submit(self, fn, *args, **kwargs):
+        raise Saturated("Etapa encode saturada")
+
+
+def test_cancelling_one_waiter_does_not_cancel_the_others():
+    async def run():
+        enc = QueryEncoder(_Model(delay=0.2), "m", batch_window_ms=1)
+        a = asyncio.ensure_future(enc.encode_async("misma consulta"))
+        b = asyncio.ensure_future(enc.encode_async("misma consulta"))
+        await asyncio.sleep(0.05)
+        a.cancel()
+        v = await asyncio.wait_for(b, timeout=2)
+        assert v[0] == len("misma consulta")
+        # El hilo del micro-batcher sigue vivo para consultas nuevas
+        w = await asyncio.wait_for(enc.encode_async("otra"), timeout=2)
+        assert w[0] == len("otra")
+
+    asyncio.run(run())
+
+
+def test_batcher_skips_cancelled_futures_and_survives():
+    enc = QueryEncoder(_Model(delay=0.0), "m", batch_window_ms=50)
+    fut = Future()
+    fut.cancel()
+    enc.batcher.submit("cancelada", fut)
+    done = Future()
+    enc.batcher.submit("viva", done)
+    assert done.result(timeout=2)[0] == len("viva")
+    assert enc.batcher._thread.is_alive()
+
+
+def test_saturated_submit_does_not_leave_inflight_future():
+    async def run():
+        enc = QueryEncoder(_Model(), "m", batching=False, executor=_SaturatedExecutor())
+        with pytest.raises(Saturated):
+            await enc.encode_async("consulta")
+        assert enc._inflight == {}
+
+        enc.executor = ThreadPoolExecutor(max_workers=1)
+        v = await asyncio.wait_for(enc.encode_async("consulta"), timeout=2)
+        assert v[0] == len("consulta")
+
+    asyncio.run(run())
+
+
+def test_concurrent_sync_callers_share_one_encode():
+    model = _Model(delay=0.1)
+    enc = QueryEncoder(model, "m", batch_window_ms=1)
+    out = []
+    threads = [threading.Thread(target=lambda: out.append(enc.encode("igual"))) for _ in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert len(out) == 4 and model.calls == 1
+
+
+def _encode_concurrently(enc: QueryEncoder, texts) -> dict:
+    barrier = threading.Barrier(len(texts))
+    out = {}
+
+    def call(t):
+        barrier.wait()
+        try:
+            out[t] = enc.encode(t)
+        except Exception as e:
+            out[t] = e
+
+    threads = [threading.Thread(target=call, args=(t,)) for t in texts]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join(timeout=5)
+    return out
+
+
+def test_distinct_concurrent_queries_share_one_model_call():
+    model = _Model()
+    enc = QueryEncoder(model, "m", prefix="query: ", batch_window_ms=300)
+    texts = ["consulta " + "x" * (i + 1) for i in range(8)]
+    out = _encode_concurrently(enc, texts)
+    assert model.sizes == [8]
+    for t in texts:  # cada Future recibe la fila de su propio texto
+        assert out[t][0] == len("query: " + t)
+    assert enc.batcher.stats()["max_batch_seen"] == 8
+
+
+def test_batch_max_caps_each_model_call():
+    model = _Model()
+    enc = QueryEncoder(model, "m", batch_window_ms=300, batch_max=3)
+    texts = [f"q{i}" for i in range(8)]
+    out = _encode_concurrently(enc, texts)
+    assert max(model.sizes) <= 3 and sum(model.sizes) == 8
+    assert all(out[t][0] == len(t) for t in texts)
+
+
+def test_encode_error_reaches_every_waiter_and_batcher_survives():
+    model = _Model(fail=True)
+    enc = QueryEncoder(model, "m", batch_window_ms=200)
+    out = _encode_concurrently(enc, ["a", "bb", "ccc"])
+    assert all(isinstance(v, RuntimeError) for v in out.values())
+    model.fail = False
+    assert enc.encode("dddd")[0] == 4
+    assert enc._inflight == {}
@@ -0,0 +1,74 @@
+import numpy as np
+
+from bm25_index import BM25Index
+from ranking import fuse_hybrid, merge_hits, table_hits
+from vector_index import TableIndex
+
+
+def _index(table: str, cosines: dict, dim: int = 8) -> TableIndex:
+    """Vectores unitarios con el coseno indicado respecto de e0."""
+    ids = sorted(cosines)
+    M = np.zeros((len(ids), dim), dtype=np.float32)
+    for r, i in enumerate(ids):
+        c = cosines[i]
+        M[r, 0], M[r, 1 + r % (dim - 1)] = c, np.sqrt(1 - c * c)
+    return TableIndex(table=table, ids=np.asarray(ids, dtype=np.int64), matrix=M, meta=None)
+
+
+def _bm25(docs: dict) -> BM25Index:
+    idx = BM25Index.empty()
+    idx.add_documents(docs.items())
+    return idx
+
+
+def _e0(dim: int = 8) -> np.ndarray:
+    q = np.zeros((dim,), dtype=np.float32)
+    q[0] = 1.0
+    return q
+
+
+def test_hybrid_ranks_across_tables():
+    # El primero de cada tabla ya no empata: anexos 43 (coseno 0.402) gana a documentos 43 (0.204)
+    tablas = {
+        "documentos": (_index("documentos", {41: 0.10, 42: 0.15, 43: 0.204}),
+                       _bm25({41: "ley general", 42: "circular unica", 43: "capital"})),
+        "anexos": (_index("anexos", {41: 0.30, 42: 0.35, 43: 0.402}),
+                   _bm25({41: "formato de reporte", 42: "instructivo de llenado",
+                          43: "requerimientos de capital y capital neto"})),
+    }
+    per_table = [table_hits(t, idx, bm25, _e0(), "capital", 3, None, "hybrid") for t, (idx, bm25) in tablas.items()]
+    top = fuse_hybrid(per_table, 3)
+
+    # documentos 43 también es primero léxico en su tabla, pero su coseno lo deja detrás globalmente
+    assert [(h[1], h[2]) for h in top] == [("anexos", 43), ("documentos", 43), ("anexos", 42)]
+    assert all(a[0] >= b[0] for a, b in zip(top, top[1:]))
+    assert top[0][4] > 0.4  # el coseno viaja con el hit para la respuesta
+
+
+def test_hybrid_without_lexical_matches_orders_by_cosine():
+    tablas = {
+        "documentos": (_index("documentos", {1: 0.204, 2: 0.1}), _bm25({1: "ley", 2: "circular"})),
+        "anexos": (_index("anexos", {1: 0.402, 2: 0.35, 3: 0.3}), _bm25({1: "formato", 2: "anexo", 3: "tabla"})),
+    }
+    per_table = [table_hits(t, idx, bm25, _e0(), "inexistente", 3, None, "hybrid") for t, (idx, bm25) in tablas.items()]
+    top = fuse_hybrid(per_table, 3)
+    assert [(h[1], h[2]) for h in top] == [("anexos", 1), ("anexos", 2), ("anexos", 3)]
+
+
+def test_lexical_normalizes_bm25_per_table():
+    # documentos: muchos títulos cortos, el término es raro (idf alto) y solo coincide "capital".
+    # anexos: un texto con ambos términos de la consulta, pero "capital" es común en la tabla.
+    docs = {i: f"disposicion numero {i}" for i in range(1, 50)}
+    docs[50] = "capital"
+    documentos = _bm25(docs)
+    anexos = _bm25({1: "capital neto requerido", 2: "capital minimo", 3: "capital social"})
+
+    raw_doc = documentos.search("capital neto", 1)[1][0]
+    raw_anx = anexos.search("capital neto", 1)[1][0]
+    assert raw_doc > raw_anx  # en crudo el título corto de documentos se lleva el primer lugar
+
+    per_table = [table_hits(t, None, bm25, None, "capital neto", 2, None, "lexical")
+                 for t, bm25 in (("documentos", documentos), ("anexos", anexos))]
+    top = merge_hits(per_table, 2)
+    assert (top[0][1], top[0][2]) == ("anexos", 1)
+    assert all(0.0 <= h[0] <= 1.0 for h in top)
@@ -0,0 +1,35 @@
+import numpy as np
+
+from quantization import QuantizedMatrix
+from snapshot import content_fingerprint, load_quantized, write_quantized
+
+
+def _matrix(seed: int, n: int = 300, dim: int = 16) -> np.ndarray:
+    X = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return X / np.linalg.norm(X, axis=1, keepdims=True)
+
+
+def test_fingerprint_changes_when_vectors_change_in_place():
+    ids = np.arange(300, dtype=np.int64)
+    assert content_fingerprint(ids, _matrix(0)) == content_fingerprint(ids, _matrix(0))
+    assert content_fingerprint(ids, _matrix(0)) != content_fingerprint(ids, _matrix(1))
+
+
+def test_quantized_codes_rejected_when_source_changed(tmp_path):
+    ids, X = np.arange(300, dtype=np.int64), _matrix(0)
+    qm = QuantizedMatrix.from_float32(X, "int8")
+    write_quantized(str(tmp_path), "articulos", "int8", qm.codes, qm.scales, fingerprint=content_fingerprint(ids, X))
+
+    assert load_quantized(str(tmp_path), "articulos", "int8", fingerprint=content_fingerprint(ids, X)) is not None
+    # Re-embebido con los mismos ids y el mismo total de filas
+    assert load_quantized(str(tmp_path), "articulos", "int8", fingerprint=content_fingerprint(ids, _matrix(1))) is None
+    # Mismos vectores pero otro orden / otros ids
+    assert load_quantized(str(tmp_path), "articulos", "int8", fingerprint=content_fingerprint(ids[::-1], X)) is None
+
+
+def test_quantized_codes_without_fingerprint_file_are_rejected(tmp_path):
+    X = _matrix(0)
+    qm = QuantizedMatrix.from_float32(X, "float16")
+    write_quantized(str(tmp_path), "anexos", "float16", qm.codes, qm.scales, fingerprint="")
+    assert load_quantized(str(tmp_path), "anexos", "float16",
+                          fingerprint=content_fingerprint(np.arange(300), X)) is None
@@ -0,0 +1,95 @@
+import asyncio
+import importlib
+import json
+
+import numpy as np
+import pytest
+
+from metrics import Timings
+from vector_index import TableIndex
+
+st = pytest.importorskip("sentence_transformers")
+
+
+class _Model:
+    def __init__(self, name):
+        pass
+
+
+@pytest.fixture(scope="module")
+def main():
+    # main carga el modelo al importarse; aquí basta con uno que no descargue nada
+    real = st.SentenceTransformer
+    st.SentenceTransformer = _Model
+    try:
+        return importlib.import_module("main")
+    finally:
+        st.SentenceTransformer = real
+
+
+def _row(i: int) -> dict:
+    return {"_id": i, "_id_doc": 1, "_title": f"Art. {i}", "_text": f"texto {i}", "_ruta": None, "_date": None}
+
+
+def _resident(table: str, ids) -> TableIndex:
+    return TableIndex(table=table, ids=np.asarray(ids, dtype=np.int64), matrix=None,
+                      meta=[_row(i) for i in ids])
+
+
+def _collect(main, indexes, ganadores, fallidas=None, cache_key=None, with_timings=False):
+    async def run():
+        return [chunk async for chunk in main.stream_hits(indexes, ganadores, fallidas or {}, cache_key,
+                                                          Timings("main", "search"), with_timings)]
+
+    chunks = asyncio.run(run())
+    assert all(c.endswith(b"\n") and c.count(b"\n") == 1 for c in chunks)  # una línea JSON por chunk
+    return [json.loads(c) for c in chunks]
+
+
+def test_lines_in_rank_order_then_summary(main):
+    indexes = {"articulos": _resident("articulos", [1, 2, 3]), "anexos": _resident("anexos", [7])}
+    ganadores = [(0.9, "articulos", 3, 2, 0.9, None), (0.8, "anexos", 7, 0, 0.8, None),
+                 (0.7, "articulos", 1, 0, 0.7, None)]
+    *hits, fin = _collect(main, indexes, ganadores, cache_key=("q", 1), with_timings=True)
+    assert [(h["fuente"], h["id"]) for h in hits] == [("articulos", 3), ("anexos", 7), ("articulos", 1)]
+    assert fin["partial"] is False and fin["tablas_fallidas"] == {} and fin["total"] == 3
+    assert "timings" in fin
+    assert [r.id for r in main.result_cache.get(("q", 1))["results"]] == [3, 7, 1]
+
+
+def test_failed_table_is_skipped_and_reported(main, monkeypatch):
+    async def fetch(conf, ids):
+        if conf.table == "anexos":
+            raise RuntimeError("sin conexión")
+        return {i: _row(i) for i in ids}
+
+    monkeypatch.setattr(main, "fetch_by_ids_async", fetch)
+    indexes = {"articulos": TableIndex(table="articulos", ids=np.array([5, 6]), matrix=None, meta=None),
+               "anexos": TableIndex(table="anexos", ids=np.array([9]), matrix=None, meta=None)}
+    ganadores = [(0.9, "articulos", 5, 0, 0.9, None), (0.8, "anexos", 9, 0, 0.8, None),
+                 (0.7, "articulos", 6, 1, 0.7, None)]
+    *hits, fin = _collect(main, indexes, ganadores, cache_key=("q", 2))
+    assert [h["id"] for h in hits] == [5, 6]
+    assert fin == {"partial": True, "tablas_fallidas": {"anexos": "error: sin conexión"}, "total": 2}
+    assert main.result_cache.get(("q", 2)) is None  # un resultado parcial no se guarda
+
+
+def test_slow_table_times_out(main, monkeypatch):
+    async def fetch(conf, ids):
+        await asyncio.sleep(5)
+        return {}
+
+    monkeypatch.setattr(main, "fetch_by_ids_async", fetch)
+    monkeypatch.setattr(main, "TABLE_TIMEOUT_S", 0.05)
+    indexes = {"articulos": _resident("articulos", [1]),
+               "anexos": TableIndex(table="anexos", ids=np.array([9]), matrix=None, meta=None)}
+    ganadores = [(0.9, "articulos", 1, 0, 0.9, None), (0.8, "anexos", 9, 0, 0.8, None)]
+    *hits, fin = _collect(main, indexes, ganadores)
+    assert [h["id"] for h in hits] == [1]
+    assert fin["tablas_fallidas"] == {"anexos": "timeout"} and fin["total"] == 1
+
+
+def test_ndjson_line_round_trips_unicode(main):
+    line = main.ndjson_line({"texto": "artículo único — ñ", "n": 1})
+    assert line.endswith(b"\n") and b"\n" not in line[:-1]
+    assert json.loads(line) == {"texto": "artículo único — ñ", "n": 1}
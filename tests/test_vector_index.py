@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+import vector_index
+from quantization import QuantizedMatrix
+from vector_index import TableIndex
+
+
+def _index(n: int = 3000, dim: int = 16, seed: int = 0, kind: str = "", dead: float = 0.0) -> TableIndex:
+    rng = np.random.default_rng(seed)
+    M = rng.standard_normal((n, dim)).astype(np.float32)
+    M /= np.linalg.norm(M, axis=1, keepdims=True)
+    idx = TableIndex(table="articulos", ids=np.arange(10, 10 + n, dtype=np.int64), matrix=M, meta=None)
+    if kind:
+        idx.qmatrix = QuantizedMatrix.from_float32(M, kind)
+    if dead:
+        idx.alive = rng.random(n) >= dead
+    return idx
+
+
+def _queries(B: int = 20, dim: int = 16, seed: int = 1) -> np.ndarray:
+    Q = np.random.default_rng(seed).standard_normal((B, dim)).astype(np.float32)
+    return Q / np.linalg.norm(Q, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("kind,dead", [("", 0.0), ("", 0.3), ("float16", 0.0), ("int8", 0.2)])
+def test_batch_matches_per_query(monkeypatch, kind, dead):
+    # Bloques pequeños: el top-k acumulado debe sobrevivir a varias pasadas (3000 filas / 1024)
+    monkeypatch.setattr(vector_index, "BATCH_SCORE_CELLS", 1)
+    idx, Q = _index(kind=kind, dead=dead), _queries()
+    for k in (1, 10):
+        batch = idx.search_topk_batch(Q, k)
+        assert len(batch) == Q.shape[0]
+        for q, (rows, sims) in zip(Q, batch):
+            want_rows, want_sims = idx.search_topk(q, k)
+            np.testing.assert_array_equal(rows, want_rows)
+            np.testing.assert_allclose(sims, want_sims, rtol=1e-5, atol=1e-6)
+
+
+def test_batch_with_k_larger_than_live_rows():
+    idx = _index(n=50, dead=0.9)
+    live = int(idx.alive.sum())
+    for rows, sims in idx.search_topk_batch(_queries(B=3), k=100):
+        assert rows.shape[0] == live and np.all(idx.alive[rows])
+        assert np.all(np.diff(sims) <= 0)
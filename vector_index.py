@@ -0,0 +1,230 @@
+# vector_index.py — Índice vectorial residente por tabla (matriz float32 contigua o cuantizada)
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ivf_index import IVFIndex
+from metadata_filter import FilterIndex
+from metrics import record, timed
+from quantization import QuantizedMatrix
+
+BATCH_SCORE_CELLS = 8_000_000  # filas x consultas por bloque en la búsqueda por lotes (~32 MB float32)
+
+
+@dataclass
+class TableIndex:
+    table: str
+    ids: np.ndarray        # (n,) int64, alineado con las filas de `matrix`
+    matrix: Optional[np.ndarray]  # (n, d) float32, filas normalizadas (coseno == producto punto);
+                                  # None si solo se mantiene residente la versión cuantizada
+    meta: Optional[List[dict]]  # metadatos por fila (_id, _id_doc, _title, _text, _ruta, _date);
+                                # None = se hidratan por id solo para los ganadores
+    ann: Optional[IVFIndex] = None  # índice aproximado opcional sobre `matrix`
+    alive: Optional[np.ndarray] = None  # máscara bool de filas utilizables (None = todas)
+    qmatrix: Optional[QuantizedMatrix] = None  # float16/int8: primera etapa de puntuación
+    vectors_by_ids: Optional[Callable[[np.ndarray], np.ndarray]] = None  # float32 desde BD para rescoring
+    rescore_factor: int = 10  # lista corta = max(k * rescore_factor, rescore_min) al usar `qmatrix`
+    rescore_min: int = 0
+    filters: Optional[FilterIndex] = None  # metadatos por fila para filtrar antes de puntuar
+    _id_order: Optional[np.ndarray] = field(default=None, repr=False)  # argsort(ids), perezoso
+
+    @property
+    def size(self) -> int:
+        return int(self.ids.shape[0])
+
+    @property
+    def dim(self) -> int:
+        if self.matrix is not None:
+            return int(self.matrix.shape[1]) if self.matrix.ndim == 2 else 0
+        return int(self.qmatrix.shape[1]) if self.qmatrix is not None else 0
+
+    def rows_for_ids(self, ids: np.ndarray) -> np.ndarray:
+        """Posición de fila de cada id en la matriz (-1 si el id no tiene vector)."""
+        order = self._id_order
+        if order is None:
+            order = self._id_order = np.argsort(self.ids, kind="stable")
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.size == 0:
+            return np.full(ids.shape, -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.ids, ids, sorter=order), self.size - 1)
+        rows = order[pos]
+        return np.where(self.ids[rows] == ids, rows, -1)
+
+    def scores(self, q_vec: np.ndarray) -> np.ndarray:
+        # Un solo producto matriz-vector por tabla
+        return self.score_rows(q_vec)
+
+    def score_rows(self, q_vec: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        if self.qmatrix is not None:
+            return self.qmatrix.dot(q_vec, rows)
+        return self.matrix @ q_vec if rows is None else self.matrix[rows] @ q_vec
+
+    def exact_scores(self, q_vec: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Similitud en precisión completa para una lista corta de filas."""
+        if self.matrix is not None:
+            return np.asarray(self.matrix[rows], dtype=np.float32) @ q_vec
+        if self.vectors_by_ids is not None:
+            return self.vectors_by_ids(self.ids[rows]) @ q_vec
+        return self.score_rows(q_vec, rows)
+
+    def score_block(self, Q: np.ndarray, start: int, end: int) -> np.ndarray:
+        """(end - start, B): un producto matriz-matriz por bloque de filas."""
+        if self.qmatrix is not None:
+            return self.qmatrix.dot_block(Q, start, end)
+        return np.asarray(self.matrix[start:end], dtype=np.float32) @ Q.T
+
+    def search_rows(self, q_vec: np.ndarray, nprobe: Optional[int] = None,
+                    allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (filas, similitudes). Con índice IVF y `nprobe` solo se puntúan las listas sondeadas;
+        sin ellos, fuerza bruta sobre toda la tabla. `allowed` (máscara bool) restringe las filas
+        ANTES de puntuar: un filtro selectivo hace la consulta más barata.
+        """
+        if allowed is not None:
+            if self.alive is not None:
+                allowed = allowed & self.alive
+            cand = np.flatnonzero(allowed)
+            # Si el filtro deja menos filas de las que sondearía IVF, fuerza bruta exacta sobre ellas
+            if self.ann is not None and nprobe and cand.shape[0] > self.size * min(1.0, nprobe / self.ann.nlist):
+                rows = self.ann.candidates(q_vec, nprobe)
+                rows = rows[allowed[rows]]
+            else:
+                rows = cand
+            return rows, self.score_rows(q_vec, rows)
+        if self.ann is not None and nprobe:
+            rows, sims = self.ann.search(self.score_rows, q_vec, nprobe)
+        else:
+            rows, sims = np.arange(self.size), self.scores(q_vec)
+        if self.alive is not None:
+            sims = np.where(self.alive[rows], sims, -np.inf)
+        return rows, sims
+
+    def search_topk(self, q_vec: np.ndarray, k: int, nprobe: Optional[int] = None,
+                    allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        with timed("score", self.table):
+            rows, sims = self.search_rows(q_vec, nprobe, allowed)
+        if self.qmatrix is not None:
+            # Cuantizado: lista corta aproximada y rescoring en float32 solo de esas filas
+            with timed("topk", self.table):
+                rows, sims = topk(rows, sims, max(k, k * self.rescore_factor, self.rescore_min))
+                rows = rows[np.isfinite(sims)]
+            with timed("rescore", self.table):
+                sims = self.exact_scores(q_vec, rows)
+        with timed("topk", self.table):
+            rows, sims = topk(rows, sims, k)
+            keep = np.isfinite(sims)
+        return rows[keep], sims[keep]
+
+    def search_topk_batch(self, Q: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Top-k de B consultas (Q: (B, d)) en una sola pasada por bloques sobre la tabla completa
+        (sin IVF: con muchas consultas el producto matriz-matriz recorre cada fila una vez para todas).
+        """
+        B = Q.shape[0]
+        kk = max(k, k * self.rescore_factor, self.rescore_min) if self.qmatrix is not None else k
+        best_rows = np.zeros((0, B), dtype=np.int64)
+        best_sims = np.zeros((0, B), dtype=np.float32)
+        chunk = max(1024, BATCH_SCORE_CELLS // max(1, B))
+        t_score = t_topk = 0.0
+        for s in range(0, self.size, chunk):
+            e = min(s + chunk, self.size)
+            t0 = time.perf_counter()
+            S = self.score_block(Q, s, e)
+            if self.alive is not None:
+                S[~self.alive[s:e]] = -np.inf
+            t1 = time.perf_counter()
+            # Candidatos acumulados + bloque nuevo; se conservan kk por columna (consulta)
+            sims = np.vstack([best_sims, S])
+            rows = np.vstack([best_rows, np.broadcast_to(np.arange(s, e)[:, None], S.shape)])
+            if sims.shape[0] > kk:
+                part = np.argpartition(-sims, kk - 1, axis=0)[:kk]
+                sims = np.take_along_axis(sims, part, axis=0)
+                rows = np.take_along_axis(rows, part, axis=0)
+            best_rows, best_sims = rows, sims
+            t_score += t1 - t0
+            t_topk += time.perf_counter() - t1
+        record("score", t_score, self.table)
+        record("topk", t_topk, self.table)
+
+        if self.qmatrix is not None and best_rows.size:
+            with timed("rescore", self.table):
+                # Rescoring en float32 de la unión de listas cortas: una sola lectura de vectores
+                union = np.unique(best_rows)
+                if self.matrix is not None:
+                    V = np.asarray(self.matrix[union], dtype=np.float32)
+                elif self.vectors_by_ids is not None:
+                    V = self.vectors_by_ids(self.ids[union])
+                else:
+                    V = self.qmatrix.dequantize(union)
+                exact = V @ Q.T
+                best_sims = np.where(np.isfinite(best_sims),
+                                     np.take_along_axis(exact, np.searchsorted(union, best_rows), axis=0), -np.inf)
+
+        out = []
+        for j in range(B):
+            rows, sims = topk(best_rows[:, j], best_sims[:, j], k)
+            keep = np.isfinite(sims)
+            out.append((rows[keep], sims[keep]))
+        return out
+
+
+def topk(rows: np.ndarray, sims: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Selección parcial O(n) con argpartition; solo se ordenan los k ganadores."""
+    if k <= 0 or sims.shape[0] == 0:
+        return rows[:0], sims[:0]
+    if sims.shape[0] > k:
+        part = np.argpartition(-sims, k - 1)[:k]
+        rows, sims = rows[part], sims[part]
+    order = np.argsort(-sims, kind="stable")
+    return rows[order], sims[order]
+
+
+def normalize_rows(M: np.ndarray) -> np.ndarray:
+    # Normaliza in-place por si los embeddings no están normalizados en BD
+    norms = np.linalg.norm(M, axis=1, keepdims=True)
+    M /= (norms + 1e-12)
+    return M
+
+
+def build_table_index(table: str, rows: Iterable[dict], n_embed_cols: int,
+                      keep_meta: bool = True) -> TableIndex:
+    """
+    Construye el índice a partir de filas con aliases genéricos (_id, _emb0, _emb1, ...).
+    Toma el primer embedding no nulo de cada fila; descarta las de dimensión distinta.
+    Con keep_meta=False solo se conservan ids y vectores.
+    """
+    blobs: List[bytes] = []
+    ids: List[int] = []
+    meta: List[dict] = []
+    nbytes: Optional[int] = None
+
+    for row in rows:
+        emb_blob = None
+        for i in range(n_embed_cols):
+            emb_blob = row.get(f"_emb{i}")
+            if emb_blob:
+                break
+        if not emb_blob:
+            continue
+        if nbytes is None:
+            nbytes = len(emb_blob)
+        if len(emb_blob) != nbytes:
+            continue
+
+        blobs.append(bytes(emb_blob))
+        ids.append(int(row["_id"]))
+        if keep_meta:
+            meta.append({k: v for k, v in row.items() if not k.startswith("_emb")})
+
+    if not blobs:
+        return TableIndex(table=table, ids=np.zeros((0,), dtype=np.int64),
+                          matrix=np.zeros((0, 0), dtype=np.float32), meta=[] if keep_meta else None)
+
+    # Decodificación en bloque: un solo frombuffer sobre el buffer concatenado
+    dim = nbytes // 4
+    M = np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), dim).copy()
+    normalize_rows(M)
+    return TableIndex(table=table, ids=np.asarray(ids, dtype=np.int64),
+                      matrix=np.ascontiguousarray(M), meta=meta if keep_meta else None)